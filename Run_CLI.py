@@ -0,0 +1,375 @@
+import os
+import sys
+import glob
+import argparse
+import itertools
+import time
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from joycaption_core import (
+    MODEL_PATH, CAPTION_TYPE_MAP, CAPTION_TYPE_SLUGS, CAPTION_LENGTH_CHOICES, EXTRA_OPTIONS_LIST, IMAGE_EXTENSIONS,
+    PRECISION_AUTO, PRECISION_CHOICES, PRECISION_PROFILES,
+    BatchPrefetcher, PrefixKVCache, build_prompt_str, generate_from_inputs, resolve_image_features, chunk_paths, caption_path_for, load_model,
+)
+
+from joycaption_featcache import DEFAULT_CACHE_DIR as FEATURE_CACHE_DIR, FeatureCache, feature_namespace
+from joycaption_journal import JOURNAL_FILENAME, BatchJournal, prompts_key
+from joycaption_writer import write_text_atomic
+from joycaption_dedup import DedupResult, find_duplicates
+from joycaption_contenthash import HASH_NAME
+from joycaption_scan import natural_sort_key, scan_images
+from joycaption_pool import CaptionPool, plan_replicas
+from joycaption_cpu import CpuTuning, default_cpu_tuning, parse_cpulist
+from joycaption_speculative import DEFAULT_DRAFT_MODEL, DEFAULT_NUM_DRAFT_TOKENS, load_draft_model
+from joycaption_metrics import METRICS, peak_memory_bytes
+
+
+# --- Headless batch captioning (no Qt; safe on display-less render nodes) ---
+def collect_images(target: str, recursive: bool = False, include: Optional[List[str]] = None,
+                   exclude: Optional[List[str]] = None) -> Tuple[Path, Iterator[Path]]:
+    """
+    Returns the dataset directory (where the journal lives) and the images to caption. Directories are
+    streamed with scan_images, so captioning starts before a huge tree has been fully listed.
+    """
+    target_path = Path(target)
+    if target_path.is_dir():
+        return target_path, scan_images(target_path, recursive=recursive, include=include, exclude=exclude)
+    if target_path.is_file():
+        return target_path.parent, iter([target_path] if target_path.suffix.lower() in IMAGE_EXTENSIONS else [])
+    candidates = sorted(
+        (Path(p) for p in glob.glob(target, recursive=True) if Path(p).suffix.lower() in IMAGE_EXTENSIONS and Path(p).is_file()),
+        key=lambda p: natural_sort_key(str(p))
+    )
+    dataset_dir = Path(os.path.commonpath([p.parent for p in candidates])) if candidates else Path.cwd()
+    return dataset_dir, iter(candidates)
+
+
+def write_sidecars(img_path: Path, image_captions: List[str], slugs: List[Optional[str]], dedup: DedupResult,
+                   completed: dict):
+    """Writes one image's captions (and its duplicates' copies) and adds them to the journal entry `completed`."""
+    for target_path in [img_path] + dedup.duplicates.get(img_path, []):
+        for slug, caption in zip(slugs, image_captions):
+            write_text_atomic(caption_path_for(target_path, slug), caption)
+        completed[str(target_path)] = {slug or "": caption for slug, caption in zip(slugs, image_captions)}
+
+
+def run_pool(args, image_files: Iterator[Path], prompts: List[str], slugs: List[Optional[str]], dedup: DedupResult,
+             journal: BatchJournal, total_count: Optional[int]) -> int:
+    """--replicas: batches are pulled lazily by N model processes; sidecars and the journal are written here."""
+    cpu_precision = args.precision in PRECISION_PROFILES and PRECISION_PROFILES[args.precision].device == "cpu"
+    specs = plan_replicas(args.replicas, use_cuda=False if args.cpu or cpu_precision else None)
+    print(f"Starting {len(specs)} replicas: " + ", ".join(
+        f"{spec.device}" + (f" (cores {spec.cpu_cores[0]}-{spec.cpu_cores[-1]})" if spec.cpu_cores else "") for spec in specs
+    ))
+    model_config = {"model_path": args.model_path, "precision": args.precision, "tiny": args.tiny_model,
+                    "quantized_cache": args.quantized_cache}
+    gen_config = {"temperature": args.temperature, "top_p": args.top_p, "max_new_tokens": args.max_tokens,
+                  "prefix_cache": args.prefix_cache}
+
+    done_count = 0
+    error_count = 0
+    processed_count = 0
+    with CaptionPool(specs, model_config, gen_config) as pool:
+        for load_message in pool.wait_ready():
+            print(load_message)
+        print(f"Captioning {total_count if total_count is not None else 'all'} images x {len(prompts)} caption types "
+              f"(batch size {args.batch_size}, {len(specs)} replicas)...")
+        start_time = time.perf_counter()
+        for result in pool.map_batches(chunk_paths(image_files, args.batch_size), prompts):
+            processed_count += len(result.paths) + len(result.failed)
+            for img_path, error_message in result.failed.items():
+                print(f"Error captioning {img_path}: {error_message}")
+                error_count += 1
+            completed = {}
+            for img_path, image_captions in zip(result.paths, result.captions):
+                try:
+                    write_sidecars(img_path, image_captions, slugs, dedup, completed)
+                    done_count += 1
+                except Exception as e:
+                    print(f"Error saving caption for {img_path}: {e}")
+                    error_count += 1
+            journal.record(completed)
+
+            elapsed = time.perf_counter() - start_time
+            progress = f"{processed_count}/{total_count}" if total_count is not None else str(processed_count)
+            print(f"[{progress}] {done_count / elapsed:.2f} images/s (replica {result.worker_idx}: "
+                  f"{len(result.paths)} images in {result.elapsed_s:.1f}s)")
+    journal.close()
+
+    print(f"Done. Captioned {done_count} images, {error_count} errors, {time.perf_counter() - start_time:.1f}s.")
+    if dedup.duplicate_count:
+        print(f"Deduplication saved {dedup.duplicate_count} generations (captions copied to duplicates).")
+    return 0 if error_count == 0 else 1
+
+
+def cpu_tuning_from_args(args) -> Optional[CpuTuning]:
+    """None unless --cpu-threads or --cpu-cores was given (load_model then uses the autotuned or default tuning)."""
+    if args.cpu_threads is None and args.cpu_cores is None:
+        return None
+    cores = parse_cpulist(args.cpu_cores) if args.cpu_cores else default_cpu_tuning().cores
+    if args.cpu_cores is None and args.cpu_threads:
+        cores = cores[:args.cpu_threads] # Exactly one pinned core per thread
+    return CpuTuning(intra_op_threads=args.cpu_threads or len(cores), inter_op_threads=args.cpu_interop_threads, cores=cores)
+
+
+def print_peak_memory():
+    """Peak host RSS and CUDA allocation of this process, to compare precision profiles."""
+    peak = peak_memory_bytes()
+    parts = []
+    if peak["rss"] is not None:
+        parts.append(f"host RSS {peak['rss'] / 1024 ** 3:.2f} GB")
+    if peak["cuda"] is not None:
+        parts.append(f"CUDA {peak['cuda'] / 1024 ** 3:.2f} GB")
+    if parts:
+        print("Peak memory: " + ", ".join(parts) + ".")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="JoyCaption headless batch captioning. Writes a .txt sidecar next to every image.")
+    parser.add_argument("target", nargs="?", help="Image file, directory, or glob pattern (quote it, e.g. 'data/**/*.png').")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Also caption images in subdirectories of a directory target.")
+    parser.add_argument("--include", action="append", default=None, metavar="GLOB",
+                        help="Only caption matching files (relative path or file name, repeatable; directory targets).")
+    parser.add_argument("--exclude", action="append", default=None, metavar="GLOB",
+                        help="Skip matching files and directories (relative path or name, repeatable; directory targets).")
+    parser.add_argument("--caption-type", action="append", default=None, choices=list(CAPTION_TYPE_MAP.keys()),
+                        help="Repeatable. With several types each image is encoded once and every type is written to "
+                             "its own sidecar (img.descriptive.txt, img.tags.txt, ...). Default: Descriptive.")
+    parser.add_argument("--caption-length", default="long", choices=CAPTION_LENGTH_CHOICES)
+    parser.add_argument("--extra", type=int, action="append", default=[], metavar="N",
+                        help="Index of an extra option to append to the prompt (repeatable). See --list-extras.")
+    parser.add_argument("--name", default="", help="Person / character name used by extra option 0.")
+    parser.add_argument("--prompt", default=None, help="Use this prompt verbatim instead of building one.")
+    parser.add_argument("--temperature", type=float, default=0.6)
+    parser.add_argument("--top-p", type=float, default=0.9)
+    parser.add_argument("--max-tokens", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=4, help="Images per generate call.")
+    parser.add_argument("--prefetch-depth", type=int, default=2, help="Batches decoded/preprocessed ahead of the one generating.")
+    parser.add_argument("--prefetch-workers", type=int, default=2, help="Threads used for image decode + preprocessing.")
+    parser.add_argument("--no-prefix-cache", dest="prefix_cache", action="store_false",
+                        help="Prefill the whole prompt for every batch instead of reusing the cached system-prompt KV.")
+    parser.add_argument("--feature-cache", action="store_true",
+                        help=f"Cache projected image features on disk ({FEATURE_CACHE_DIR}) so re-runs with a new prompt skip the vision encoder.")
+    parser.add_argument("--feature-cache-gb", type=float, default=8.0, help="Size budget of the feature cache.")
+    parser.add_argument("--model-path", default=MODEL_PATH)
+    parser.add_argument("--precision", default=None, choices=PRECISION_CHOICES,
+                        help="Precision profile: bf16/fp16 (CUDA), int8/nf4 (CUDA + bitsandbytes), cpu-fp32/cpu-bf16. "
+                             f"cpu-int8 (int8 weight-only). Default: {PRECISION_AUTO} (bf16 on CUDA, bf16 or fp32 on CPU).")
+    parser.add_argument("--4bit", dest="load_in_4bit", action="store_true", help="Same as --precision nf4.")
+    parser.add_argument("--cpu-threads", type=int, default=None, metavar="N",
+                        help="CPU profiles: intra-op threads (default: autotuned result, else physical cores of NUMA node 0).")
+    parser.add_argument("--cpu-interop-threads", type=int, default=1, metavar="N", help="CPU profiles: inter-op threads.")
+    parser.add_argument("--cpu-cores", default=None, metavar="LIST",
+                        help="CPU profiles: pin to these cores, taskset format (e.g. 0-15,32-47). Default: match --cpu-threads.")
+    parser.add_argument("--cpu-autotune", action="store_true",
+                        help="CPU profiles: time the candidate thread configurations once after loading and cache the "
+                             "fastest per machine (~/.cache/joycaption/cpu_autotune.json).")
+    parser.add_argument("--no-quantized-cache", dest="quantized_cache", action="store_false",
+                        help="With --precision int8/nf4: quantize from the full-precision weights instead of loading (and creating) the "
+                             "pre-quantized checkpoint cache in ~/.cache/joycaption/quantized.")
+    parser.add_argument("--replicas", type=int, default=0, metavar="N",
+                        help="Run N model replicas in separate processes (one per GPU, or each on its own share of the "
+                             "CPU cores) fed from a shared queue. 0 = one in-process model. --feature-cache is ignored.")
+    parser.add_argument("--cpu", action="store_true", help="With --replicas: place the replicas on CPU even if CUDA is available.")
+    parser.add_argument("--tiny-model", action="store_true",
+                        help="Use a tiny random-weight stand-in model (real tokenizer) to test or benchmark on CPU-only machines. "
+                             "Captions are gibberish.")
+    parser.add_argument("--draft-model", nargs="?", const=DEFAULT_DRAFT_MODEL, default=None, metavar="PATH",
+                        help="Speculative decoding: a small LM sharing JoyCaption's tokenizer proposes tokens for the model to "
+                             f"verify (default {DEFAULT_DRAFT_MODEL}). Same captions at --temperature 0, same distribution "
+                             "otherwise. Images in a batch are decoded one after another.")
+    parser.add_argument("--num-draft-tokens", type=int, default=DEFAULT_NUM_DRAFT_TOKENS, metavar="N",
+                        help="Tokens the draft model proposes per verification step.")
+    parser.add_argument("--overwrite", action="store_true", help="Re-caption images that already have a sidecar.")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Caption byte-identical files once and copy the caption to every duplicate's sidecar.")
+    parser.add_argument("--resume", action="store_true",
+                        help=f"Skip images recorded in the progress journal ({JOURNAL_FILENAME}) by an earlier run with the "
+                             "same prompts, even with --overwrite.")
+    parser.add_argument("--metrics-trace", type=Path, default=None, metavar="FILE",
+                        help="Append one JSON line per timed stage (image load, preprocess, prefill, decode, save) to FILE.")
+    parser.add_argument("--metrics-prom", type=Path, default=None, metavar="FILE",
+                        help="Rewrite FILE with the stage timing histograms in Prometheus text format after every batch "
+                             "(for node_exporter's textfile collector).")
+    parser.add_argument("--log-prompt", action="store_true")
+    parser.add_argument("--list-extras", action="store_true", help="Print the extra options with their indices and exit.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+
+    if args.list_extras:
+        for idx, option_text in enumerate(EXTRA_OPTIONS_LIST):
+            print(f"{idx:2d}: {option_text}")
+        return 0
+
+    if not args.target:
+        print("Error: no target given. Pass an image, a directory or a glob pattern.")
+        return 2
+    if args.batch_size < 1:
+        print("Error: --batch-size must be at least 1.")
+        return 2
+    if args.load_in_4bit:
+        if args.precision not in (None, "nf4"):
+            print("Error: --4bit conflicts with --precision.")
+            return 2
+        args.precision = "nf4"
+    args.precision = args.precision or PRECISION_AUTO
+    if args.replicas < 0:
+        print("Error: --replicas cannot be negative.")
+        return 2
+    if args.draft_model and args.replicas:
+        print("Error: --draft-model is not supported with --replicas.")
+        return 2
+    if (args.metrics_trace or args.metrics_prom) and args.replicas:
+        print("Error: --metrics-trace / --metrics-prom are not supported with --replicas.")
+        return 2
+    for idx in args.extra:
+        if not 0 <= idx < len(EXTRA_OPTIONS_LIST):
+            print(f"Error: --extra {idx} is out of range (0-{len(EXTRA_OPTIONS_LIST) - 1}).")
+            return 2
+
+    caption_types = list(dict.fromkeys(args.caption_type or ["Descriptive"]))
+    if args.prompt is not None and len(caption_types) > 1:
+        print("Error: --prompt cannot be combined with several --caption-type values.")
+        return 2
+    # A single caption type keeps the plain img.txt sidecar.
+    slugs = [CAPTION_TYPE_SLUGS[t] for t in caption_types] if len(caption_types) > 1 else [None]
+
+    dataset_dir, image_files = collect_images(args.target, args.recursive, args.include, args.exclude)
+    if not args.overwrite:
+        image_files = (p for p in image_files if not all(caption_path_for(p, slug).exists() for slug in slugs))
+
+    if args.prompt is not None:
+        prompts = [args.prompt]
+    else:
+        extras = [EXTRA_OPTIONS_LIST[idx] for idx in args.extra]
+        prompts = [build_prompt_str(t, args.caption_length, extras, args.name) for t in caption_types]
+    if args.log_prompt:
+        for prompt in prompts:
+            print(f"PromptLog: {repr(prompt)}")
+
+    # Every finished batch is journaled (fsynced) so an interrupted run can be resumed with --resume.
+    journal = BatchJournal(dataset_dir, prompts_key(prompts))
+    if args.resume:
+        done = journal.completed()
+        print(f"Resuming: {len(done)} images already done according to {journal.path}.")
+        image_files = (p for p in image_files if str(p) not in done)
+
+    total_count: Optional[int] = None # Unknown while the directory scan is still streaming
+    dedup = DedupResult(unique=[])
+    if args.dedup:
+        image_files = list(image_files) # Duplicates can be anywhere in the tree, so this needs the full list
+        dedup_start = time.perf_counter()
+        dedup = find_duplicates(image_files)
+        print(f"Deduplication ({HASH_NAME}): {len(dedup.unique)} unique of {len(image_files)} images, "
+              f"{dedup.hashed_count} files hashed in {time.perf_counter() - dedup_start:.1f}s.")
+        image_files = iter(dedup.unique)
+        total_count = len(dedup.unique)
+
+    first_image = next(image_files, None)
+    if first_image is None:
+        print("No images to caption.")
+        return 0
+    image_files = itertools.chain([first_image], image_files)
+
+    if args.replicas:
+        return run_pool(args, image_files, prompts, slugs, dedup, journal, total_count)
+
+    if args.tiny_model:
+        from joycaption_tiny import build_tiny_model
+        processor, model, load_message = build_tiny_model(args.model_path)
+    else:
+        processor, model, load_message = load_model(args.model_path, precision=args.precision,
+                                                    use_quantized_cache=args.quantized_cache,
+                                                    cpu_tuning=cpu_tuning_from_args(args), cpu_autotune=args.cpu_autotune)
+    print(load_message)
+    draft = None
+    if args.draft_model:
+        draft = load_draft_model(args.draft_model, model, processor, args.num_draft_tokens)
+        print(f"Draft model {args.draft_model} loaded ({draft.num_draft_tokens} tokens per step).")
+
+    if args.metrics_trace:
+        METRICS.start_trace(args.metrics_trace)
+    prefix_cache = PrefixKVCache(model) if args.prefix_cache else None
+    feature_cache = None
+    if args.feature_cache:
+        feature_cache = FeatureCache(feature_namespace(model, processor), budget_bytes=int(args.feature_cache_gb * 1024 ** 3))
+
+    print(f"Captioning {total_count if total_count is not None else 'all'} images x {len(prompts)} caption types "
+          f"(batch size {args.batch_size})...")
+    start_time = time.perf_counter()
+    done_count = 0
+    error_count = 0
+    prefetcher = BatchPrefetcher(
+        processor, chunk_paths(image_files, args.batch_size), prompts,
+        depth=args.prefetch_depth, num_workers=args.prefetch_workers, feature_cache=feature_cache,
+        content_hashes=dedup.digests
+    )
+    processed_count = 0
+    for prepared in prefetcher:
+        processed_count += len(prepared.paths) + len(prepared.failed)
+        for img_path, error_message in prepared.failed.items():
+            print(f"Error loading {img_path}: {error_message}")
+            error_count += 1
+        if prepared.inputs is None:
+            continue
+
+        try:
+            image_features = None
+            if feature_cache is not None or prepared.fanout > 1:
+                image_features = resolve_image_features(
+                    model, prepared.inputs, prepared.fanout, feature_cache, prepared.content_hashes, prepared.cached_features
+                )
+            captions = generate_from_inputs(
+                model, processor, prepared.inputs,
+                args.temperature, args.top_p, args.max_tokens, prefix_cache=prefix_cache, image_features=image_features,
+                draft=draft,
+            )
+        except Exception as e:
+            print(f"Error generating captions for {[p.name for p in prepared.paths]}: {e}")
+            error_count += len(prepared.paths)
+            continue
+
+        completed = {}
+        for image_idx, img_path in enumerate(prepared.paths):
+            image_captions = captions[image_idx * prepared.fanout:(image_idx + 1) * prepared.fanout]
+            try:
+                write_sidecars(img_path, image_captions, slugs, dedup, completed)
+                done_count += 1
+            except Exception as e:
+                print(f"Error saving caption for {img_path}: {e}")
+                error_count += 1
+        journal.record(completed)
+
+        elapsed = time.perf_counter() - start_time
+        progress = f"{processed_count}/{total_count}" if total_count is not None else str(processed_count)
+        speculation = f", {draft.last_stats.describe()}" if draft is not None else ""
+        print(f"[{progress}] {done_count / elapsed:.2f} images/s{speculation}")
+        if args.metrics_prom:
+            METRICS.write_prometheus(args.metrics_prom)
+    prefetcher.close()
+    journal.close()
+    if prefix_cache is not None:
+        print(f"Prefix KV cache: {prefix_cache.hits} reuses, {prefix_cache.misses} prefills.")
+    if feature_cache is not None:
+        print(f"Feature cache: {feature_cache.hits} hits, {feature_cache.misses} misses.")
+        feature_cache.close()
+    if draft is not None:
+        print(f"Speculative decoding: {draft.total_stats.describe()}.")
+    print(f"Stage timings (p50): {METRICS.summary()}.")
+    METRICS.stop_trace()
+    if args.metrics_prom:
+        METRICS.write_prometheus(args.metrics_prom)
+
+    print(f"Done. Captioned {done_count} images, {error_count} errors, {time.perf_counter() - start_time:.1f}s.")
+    print_peak_memory()
+    if dedup.duplicate_count:
+        print(f"Deduplication saved {dedup.duplicate_count} generations (captions copied to duplicates).")
+    return 0 if error_count == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,130 +1,52 @@
 import sys
 import os
-import torch
-from transformers import LlavaForConditionalGeneration, TextIteratorStreamer, AutoProcessor
 from PIL import Image
-from threading import Thread # For model.generate in its own thread
-from typing import Generator, List, Union, Optional, Dict # Typing not strictly needed for Generator here
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import List, Optional, Dict
 from pathlib import Path
 import base64 # For logo
 
-# LIGER Kernel import - ensure liger_kernel is installed and in PYTHONPATH
-try:
-    from liger_kernel.transformers import apply_liger_kernel_to_llama
-    LIGER_AVAILABLE = True
-except ImportError:
-    LIGER_AVAILABLE = False
-    print("Warning: liger_kernel not found. LLM optimizations will be disabled.")
-    def apply_liger_kernel_to_llama(model): # Stub
-        print("LIGER Kernel not applied (stub).")
-        pass
+from joycaption_qt import DecodedImageCache, ThumbnailListModel
+from joycaption_thumbcache import ThumbnailCache
+from joycaption_featcache import FeatureCache, feature_namespace
+from joycaption_journal import BatchJournal, prompts_key
+from joycaption_writer import CaptionWriter, write_text_atomic
+from joycaption_dedup import DedupResult, find_duplicates
+from joycaption_scan import scan_images
+from joycaption_core import (
+    MODEL_PATH, CAPTION_TYPE_MAP, CAPTION_TYPE_SLUGS, NAME_OPTION, CAPTION_LENGTH_CHOICES, EXTRA_OPTIONS_LIST,
+    LOAD_ERROR_CAPTION, BatchPrefetcher, PreparedBatch, PrefixKVCache, TokenCoalescer, build_prompt_str,
+    prepare_batch_inputs, generate_from_inputs, resolve_image_features, chunk_paths, caption_path_for, load_model,
+    LOAD_STAGE_CONFIG, LOAD_STAGE_SHARDS, LOAD_STAGE_LIGER, LOAD_STAGE_AUTOTUNE, LOAD_STAGE_WARMUP,
+    PRECISION_AUTO, PRECISION_PROFILES,
+)
+from joycaption_speculative import DEFAULT_DRAFT_MODEL, DEFAULT_NUM_DRAFT_TOKENS, load_draft_model
+from joycaption_metrics import METRICS
+
+# Precision profile preselected in the "Precision" combo; Run_gui_4bit.py starts this window with "nf4".
+DEFAULT_PRECISION = PRECISION_AUTO
+# CPU profiles: time the thread configurations once after the first load on this machine (result is cached).
+CPU_AUTOTUNE = True
+# "Speculative Decoding": draft LM (must share the Llama 3 tokenizer) and tokens it proposes per step.
+DRAFT_MODEL_PATH = DEFAULT_DRAFT_MODEL
+NUM_DRAFT_TOKENS = DEFAULT_NUM_DRAFT_TOKENS
 
 
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QLabel, QPushButton, QFileDialog, QLineEdit,
     QTextEdit, QComboBox, QVBoxLayout, QHBoxLayout, QCheckBox, QMessageBox,
     QSizePolicy, QStatusBar, QProgressBar, QMainWindow, QSlider, QScrollArea,
-    QGroupBox, QTextBrowser, QFrame, QGridLayout
+    QGroupBox, QGridLayout, QListView, QAbstractItemView
 )
-from PyQt5.QtGui import QPixmap, QIcon, QTextCursor, QImage
+from PyQt5.QtGui import QPixmap, QTextCursor
 from PyQt5.QtCore import Qt, QTimer, QThread, pyqtSignal, QObject, QSize
 
 # --- Constants and Mappings ---
 LOGO_SRC_BASE64 = "PD94bWwgdmVyc2lvbj0iMS4wIiBlbmNvZGluZz0iVVRGLTgiIHN0YW5kYWxvbmU9Im5vIj8+CjwhRE9DVFlQRSBzdmcgUFVCTElDICItLy9XM0MvL0RURCBTVkcgMS4xLy9FTiIgImh0dHA6Ly93d3cudzMub3JnL0dyYXBoaWNzL1NWRy8xLjEvRFREL3N2ZzExLmR0ZCI+Cjxzdmcgd2lkdGg9IjEwMCUiIGhlaWdodD0iMTAwJSIgdmlld0JveD0iMCAwIDUzOCA1MzUiIHZlcnNpb249IjEuMSIgeG1sbnM9Imh0dHA6Ly93d3cudzMub3JnLzIwMDAvc3ZnIiB4bWxuczp4bGluaz0iaHR0cDovL3d3dy53My5vcmcvMTk5OS94bGluayIgeG1sOnNwYWNlPSJwcmVzZXJ2ZSIgeG1sbnM6c2VyaWY9Imh0dHA6Ly93d3cuc2VyaWYuY29tLyIgc3R5bGU9ImZpbGwtcnVsZTpldmVub2RkO2NsaXAtcnVsZTpldmVub2RkO3N0cm9rZS1saW5lam9pbjpyb3VuZDtzdHJva2UtbWl0ZXJsaW1pdDoyOyI+CiAgICA8ZyB0cmFuc2Zvcm09Im1hdHJpeCgxLDAsMCwxLC0xNDcuODcxLDAuMDAxOTA4NjMpIj4KICAgICAgICA8cGF0aCBkPSJNMTk1LjY3LDIyMS42N0MxOTYuNzMsMjA1LjM3IDIwMC4yOCwxODkuNzYgMjA3LjkxLDE3NS4zN0MyMjcuOTgsMTM3LjUxIDI1OS4zMywxMTQuODggMzAyLjAxLDExMS42M0MzMzQuMTUsMTA5LjE4IDM2Ni41OSwxMTAuNiAzOTguODksMTEwLjNDNDAwLjUzLDExMC4yOCA0MDIuMTYsMTEwLjMgNDA0LjQsMTEwLjNDNDA0LjQsMTAxLjk5IDQwNC41Niw5NC4wNSA0MDQuMjMsODYuMTJDNDA0LjE4LDg0Ljg0IDQwMi4xNSw4My4xMyA0MDAuNjYsODIuNDlDMzgzLjIzLDc1LjAyIDM3My4wNSw1OS43OSAzNzMuOTYsNDAuOTZDMzc1LjA5LDE3LjU0IDM5MS40NywyLjY2IDQxMC42NSwwLjM3QzQzNy44OSwtMi44OSA0NTUuNTYsMTUuODQgNDU5LjI2LDM0LjY5QzQ2Mi45Niw1My41NyA0NTIuMTgsNzYuOTMgNDMyLjgxLDgyLjY2QzQzMS42NCw4My4wMSA0MzAuMzMsODUuMjMgNDMwLjI4LDg2LjYyQzQzMC4wMyw5NC4yNiA0MzAuMTYsMTAxLjkyIDQzMC4xNiwxMTAuM0w0MzUuNjMsMTEwLjNDNDYzLjc5LDExMC4zIDQ5MS45NiwxMTAuMjggNTIwLjEyLDExMC4zQzU3NC44NCwxMTAuMzYgNjIzLjA0LDE0OC4zNSA2MzUuNjcsMjAxLjU1QzYzNy4yMywyMDguMTMgNjM3LjgzLDIxNC45MyA2MzguODksMjIxLjY3QzY2MC40MywyMjQuOTQgNjc1LjE5LDIzNi42MiA2ODIuMzYsMjU3LjRDNjgzLjU5LDI2MC45NyA2ODQuNjUsMjY0LjgyIDY4NC42NywyNjguNTRDNjg0Ljc3LDI4My4zNCA2ODUuNzYsMjk4LjMxIDY4My45NCwzMTIuOTFDNjgwLjg5LDMzNy4yOSA2NjIuODYsMzUzLjM2IDYzOC40NywzNTUuODJDNjM1LjE0LDM4NS4wOCA2MjEuOTEsNDA5LjQxIDYwMC40NSw0MjkuMjFDNTgxLjYsNDQ2LjYxIDU1OS4xNCw0NTcuNSA1MzMuNTcsNDU5LjE4QzUwOC4xOCw0NjAuODQgNDgyLjY0LDQ2MC4yIDQ1Ny4xNiw0NjAuMzhDNDM1LjE2LDQ2MC41MyA0MTMuMTcsNDYwLjM0IDM5MS4xNyw0NjAuNTNDMzg4Ljc2LDQ2MC41NSAzODUuOTUsNDYxLjU2IDM4NC4wMyw0NjMuMDRDMzcxLjU0LDQ3Mi42MiAzNTkuMTMsNDgyLjMxIDM0Ni45Miw0OTIuMjVDMzM4Ljk0LDQ5OC43NSAzMzEuMzksNTA1Ljc3IDMyMy41Niw1MTIuNDZDMzE3LjQ1LDUxNy42OCAzMTAuOTMsNTIyLjQ0IDMwNS4xMSw1MjcuOTVDMzAxLjE5LDUzMS42NiAyOTYuNTIsNTMzLjE3IDI5MS42OSw1MzQuMzZDMjg1LjY1LDUzNS44NSAyNzkuMjIsNTI5LjEzIDI3OS4wMSw1MjEuMTlDMjc4LDgsNTEyLjg2IDI3OC45NSw1MDQuNTMgMjc4Ljk0LDQ5Ni4xOUwyNzguOTQsNDU2LjY5QzIzMi44Miw0MzguMTYgMjAzLjU2LDQwNi4yMyAxOTUuMDcsMzU2LjA4QzE5My4yNiwzNTUuNzUgMTkwLjg0LDM1NSo0MSAxODguNDgsMzU0Ljg2QzE2Ny40NiwzNDkuOTEgMTU1LjA0LDMzNi4wMiAxNTAuNzIsMzE1LjYyQzE0Ni45OCwyOTcuOTkgMTQ2LjksMjc5LjY3IDE1MC42MSwyNjIuMDlDMTU1LjU1LDIzOC42OCAxNzEuNDIsMjI1LjU5IDE5NS42NiwyMjEuNjdMMTk1LjY3LDIyMS42N1pNMzA4LjA3LDQ4Ny44MkMzMTUuOTQsNDgxLjEzIDMyMi44NSw0NzUuMTMgMzI5LjksNDY5LjNDMzQ0LjM5LDQ1Ny4zMSAzNTguOSw0NDUuMzYgMzczLjU0LDQzMy41NkMzNzUuMTcsNDMyLjI1IDM3Ny42OCw0MzEuNCAzNzkuNzksNDMxLjM5QzQxNC43OCw0MzEuMjYgNDQ5Ljc4LDQzMS4zOCA0ODQuNzcsNDMxLjI0QzUwMC4zOSw0MzEuMTggNTE2LjEzLDQzMS43NiA1MzEuNjIsNDMwLjE2QzU3Ni45Miw0MjUuNDkgNjA5LjI0LDM4Ny43NyA2MDguOTUsMzQ0Ljg0QzYwOC42OCwzMDUuNTIgNjA4LjkzLDI2Ni4xOSA2MDguODcsMjI2Ljg2QzYwOC44NywyMjMuMjIgNjA4LjU4LDIxOS41NSA2MDcuOTksMjE1Ljk2QzYwMy4xMSwxODYuMjkgNTg4LjYxLDE2My4zMyA1NjEuMzIsMTQ5LjMyQzU0OS4wNCwxNDMuMDIgNTM2LjE1LDEzOS4yOSA1MjIuMjIsMTM5LjI5QzQ1My45LDEzOS4zMiAzODUuNTgsMTM5LjIgMzE3LjI2LDEzOS4zNUMzMDkuMiwxMzkuMzcgMzAwLjk2LDEzOS44OSAyOTMuMTEsMTQxLjZDMjU0LjE5LDE1MC4wNyAyMjUuMzMsMTg1LjY5IDIyNS4wMywyMjUuNDJDMjI0LjgsMjU2LjA4IDIyNC44NiwyODYuNzQgMjI0Ljk5LDMxNy40QzIyNS4wNSwzMzAuNTMgMjI0Ljc0LDM0My43NiAyMjYuMTgsMzU2Ljc3QzIyOC43NCwzODAuMDUgMjQwLjYsMzk4LjYyIDI1OC43OSw0MTIuOTNDMjczLjA0LDQyNC4xNCAyODkuNjMsNDMwLjAyIDMwNy42MSw0MzEuNTVDMzA3LjgyLDQzMi4wMyAzMDguMDYsNDMyLjMzIDMwOC4wNiw0MzIuNjNDMzA4LjA4LDQ1MC42IDMwOC4wOCw0NjguNTcgMzA4LjA4LDQ4Ny44MUwzMDguMDcsNDg3LjgyWk00MzUuNzksNDMuMzNDNDM1Ljk1LDMzLjQyIDQyNy42MSwyNC42NSA0MTcuOCwyNC40QzQwNi43NiwyNC4xMiAzOTguMjUsMzIuMDUgMzk4LjEzLDQyLjc0QzM5OC4wMSw1My4wNCA0MDYuNiw2Mi4xMiA0MTYuNDIsNjIuMDhDNDI3LjExLDYyLjA0IDQzNS42MSw1My44MSA0MzUuNzgsNDMuMzNMNDM1Ljc5LDQzLjMzWiIgc3R5bGU9ImZpbGw6cmdiKDczLDQ3LDExOCk7ZmlsbC1ydWxlOm5vbnplcm87Ii8+CiAgICAgICAgPHBhdGggZD0iTTQxOS4zLDM5MS42M0MzNzQuNDYsMzkwLjQgMzQxLjUxLDM3Mi42MyAzMTguMDEsMzM3LjcxQzMxNS42NywzMzQuMjMgMzEzLjc3LDMzMC4wNCAzMTMuMSwzMjUuOTVDMzExLjg0LDMxOC4yOCAzMTYuNTMsMzExLjcgMzIzLjcyLDMwOS40NkMzMzAuNjYsMzA3LjI5IDMzOC4zMiwzMTAuMSAzNDEuOTgsMzE3LjAzQzM0OS4xNSwzMzAuNjMgMzU5LjE2LDM0MS4zNSAzNzIuMywzNDkuMzFDNDAxLjMyLDM2Ni44OSA0NDQuNTYsMzYzLjcgNDcwLjYxLDM0Mi4zNUM0NzkuMSwzMzUuMzkgNDg2LjA4LDMyNy40MSA0OTEuNTUsMzE3Ljk3QzQ5NS4wNSwzMTEuOTMgNTAwLjIsMzA4LjE4IDUwNy40NywzMDguOTVDNTEzLjczLDMwOS42MSA1MTguODYsMzEyLjg4IDUyMC4xMiwzMTkuMjFDNTIwLjksMzIzLjEzIDUyMC43MywzMjguMjIgNTE4LjgzLDMzMS41NUM1MDAuNjMsMzYzLjMyIDQ3My41NSwzODIuOTUgNDM3LjI5LDM4OS4zN0M0MzAuNDQsMzkwLjU4IDQyMy40OCwzOTEuMTIgNDE5LjI5LDM5MS42M0w0MTkuMywzOTEuNjNaIiBzdHlsZT0iZmlsbDpyZ2IoMjUwLDEzOSwxKTtmaWxsLXJ1bGU6bm9uemVybzsiLz4KICAgICAgICA8cGF0aCBkPSJNNDYyLjcxLDI0MC4xOUM0NjIuOCwyMTYuOTEgNDgwLjI0LDE5OS43OSA1MDQuMDEsMTk5LjY3QzUyNi41NywxOTkuNTUgNTQ0Ljg5LDIxOC4wNyA1NDQuNTEsMjQxLjM0QzU0NC4xOCwyNjEuODUgNTMwLjA5LDI4MS45NiA1MDEuOTEsMjgxLjIzQzQ4MC42OCwyODAuNjggNDYyLjE1LDI2My44IDQ2Mi43MSwyNDAuMkw0NjIuNzEsMjQwLjE5WiIgc3R5bGU9ImZpbGw6cmdiKDI1MCwxMzksMSk7ZmlsbC1ydWxlOm5vbnplcm87Ii8+CiAgICAgICAgPHBhdGggZD0iTTM3MC45OSwyNDAuMDhDMzcxLDI2Mi43OSAzNTIuNTMsMjgxLjM1IDMyOS44OSwyODEuMzdDMzA3LjA1LDI4MS40IDI4OC45NiwyNjMuNDIgMjg4Ljk2LDI0MC42OEMyODguOTYsMjE4LjE0IDMwNi43MywyMDAgMzI5LjE2LDE5OS42MkMzNTIuMDIsMTk5LjI0IDM3MC45OCwyMTcuNTcgMzcwLjk5LDI0MC4wOFoiIHN0eWxlPSJmaWxsOnJnYigyNTAsMTM5LDEpO2ZpbGwtcnVsZTpub256ZXJvOyIvPgogICAgPC9nPgo8L3N2Zz4K"
-MODEL_PATH = "fancyfeast/llama-joycaption-beta-one-hf-llava"
-CAPTION_TYPE_MAP = {
-	"Descriptive": [
-		"Write a detailed description for this image.",
-		"Write a detailed description for this image in {word_count} words or less.",
-		"Write a {length} detailed description for this image.",
-	],
-	"Descriptive (Casual)": [
-		"Write a descriptive caption for this image in a casual tone.",
-		"Write a descriptive caption for this image in a casual tone within {word_count} words.",
-		"Write a {length} descriptive caption for this image in a casual tone.",
-	],
-	"Straightforward": [
-		"Write a straightforward caption for this image. Begin with the main subject and medium. Mention pivotal elements—people, objects, scenery—using confident, definite language. Focus on concrete details like color, shape, texture, and spatial relationships. Show how elements interact. Omit mood and speculative wording. If text is present, quote it exactly. Note any watermarks, signatures, or compression artifacts. Never mention what's absent, resolution, or unobservable details. Vary your sentence structure and keep the description concise, without starting with “This image is…” or similar phrasing.",
-		"Write a straightforward caption for this image within {word_count} words. Begin with the main subject and medium. Mention pivotal elements—people, objects, scenery—using confident, definite language. Focus on concrete details like color, shape, texture, and spatial relationships. Show how elements interact. Omit mood and speculative wording. If text is present, quote it exactly. Note any watermarks, signatures, or compression artifacts. Never mention what's absent, resolution, or unobservable details. Vary your sentence structure and keep the description concise, without starting with “This image is…” or similar phrasing.",
-		"Write a {length} straightforward caption for this image. Begin with the main subject and medium. Mention pivotal elements—people, objects, scenery—using confident, definite language. Focus on concrete details like color, shape, texture, and spatial relationships. Show how elements interact. Omit mood and speculative wording. If text is present, quote it exactly. Note any watermarks, signatures, or compression artifacts. Never mention what's absent, resolution, or unobservable details. Vary your sentence structure and keep the description concise, without starting with “This image is…” or similar phrasing.",
-	],
-	"Stable Diffusion Prompt": [
-		"Output a stable diffusion prompt that is indistinguishable from a real stable diffusion prompt.",
-		"Output a stable diffusion prompt that is indistinguishable from a real stable diffusion prompt. {word_count} words or less.",
-		"Output a {length} stable diffusion prompt that is indistinguishable from a real stable diffusion prompt.",
-	],
-	"MidJourney": [
-		"Write a MidJourney prompt for this image.",
-		"Write a MidJourney prompt for this image within {word_count} words.",
-		"Write a {length} MidJourney prompt for this image.",
-	],
-	"Danbooru tag list": [
-		"Generate only comma-separated Danbooru tags (lowercase_underscores). Strict order: `artist:`, `copyright:`, `character:`, `meta:`, then general tags. Include counts (1girl), appearance, clothing, accessories, pose, expression, actions, background. Use precise Danbooru syntax. No extra text.",
-		"Generate only comma-separated Danbooru tags (lowercase_underscores). Strict order: `artist:`, `copyright:`, `character:`, `meta:`, then general tags. Include counts (1girl), appearance, clothing, accessories, pose, expression, actions, background. Use precise Danbooru syntax. No extra text. {word_count} words or less.",
-		"Generate only comma-separated Danbooru tags (lowercase_underscores). Strict order: `artist:`, `copyright:`, `character:`, `meta:`, then general tags. Include counts (1girl), appearance, clothing, accessories, pose, expression, actions, background. Use precise Danbooru syntax. No extra text. {length} length.",
-	],
-	"e621 tag list": [
-		"Write a comma-separated list of e621 tags in alphabetical order for this image. Start with the artist, copyright, character, species, meta, and lore tags (if any), prefixed by 'artist:', 'copyright:', 'character:', 'species:', 'meta:', and 'lore:'. Then all the general tags.",
-		"Write a comma-separated list of e621 tags in alphabetical order for this image. Start with the artist, copyright, character, species, meta, and lore tags (if any), prefixed by 'artist:', 'copyright:', 'character:', 'species:', 'meta:', and 'lore:'. Then all the general tags. Keep it under {word_count} words.",
-		"Write a {length} comma-separated list of e621 tags in alphabetical order for this image. Start with the artist, copyright, character, species, meta, and lore tags (if any), prefixed by 'artist:', 'copyright:', 'character:', 'species:', 'meta:', and 'lore:'. Then all the general tags.",
-	],
-	"Rule34 tag list": [
-		"Write a comma-separated list of rule34 tags in alphabetical order for this image. Start with the artist, copyright, character, and meta tags (if any), prefixed by 'artist:', 'copyright:', 'character:', and 'meta:'. Then all the general tags.",
-		"Write a comma-separated list of rule34 tags in alphabetical order for this image. Start with the artist, copyright, character, and meta tags (if any), prefixed by 'artist:', 'copyright:', 'character:', and 'meta:'. Then all the general tags. Keep it under {word_count} words.",
-		"Write a {length} comma-separated list of rule34 tags in alphabetical order for this image. Start with the artist, copyright, character, and meta tags (if any), prefixed by 'artist:', 'copyright:', 'character:', and 'meta:'. Then all the general tags.",
-	],
-	"Booru-like tag list": [
-		"Write a list of Booru-like tags for this image.",
-		"Write a list of Booru-like tags for this image within {word_count} words.",
-		"Write a {length} list of Booru-like tags for this image.",
-	],
-	"Art Critic": [
-		"Analyze this image like an art critic would with information about its composition, style, symbolism, the use of color, light, any artistic movement it might belong to, etc.",
-		"Analyze this image like an art critic would with information about its composition, style, symbolism, the use of color, light, any artistic movement it might belong to, etc. Keep it within {word_count} words.",
-		"Analyze this image like an art critic would with information about its composition, style, symbolism, the use of color, light, any artistic movement it might belong to, etc. Keep it {length}.",
-	],
-	"Product Listing": [
-		"Write a caption for this image as though it were a product listing.",
-		"Write a caption for this image as though it were a product listing. Keep it under {word_count} words.",
-		"Write a {length} caption for this image as though it were a product listing.",
-	],
-	"Social Media Post": [
-		"Write a caption for this image as if it were being used for a social media post.",
-		"Write a caption for this image as if it were being used for a social media post. Limit the caption to {word_count} words.",
-		"Write a {length} caption for this image as if it were being used for a social media post.",
-	],
-}
-NAME_OPTION = "If there is a person/character in the image you must refer to them as {name}."
-CAPTION_LENGTH_CHOICES = ["any", "very short", "short", "medium-length", "long", "very long"] + [str(i) for i in range(20, 261, 10)]
-EXTRA_OPTIONS_LIST = [
-    NAME_OPTION,
-    "Do NOT include information about people/characters that cannot be changed (like ethnicity, gender, etc), but do still include changeable attributes (like hair style).",
-    "Include information about lighting.",
-    "Include information about camera angle.",
-    "Include information about whether there is a watermark or not.",
-    "Include information about whether there are JPEG artifacts or not.",
-    "If it is a photo you MUST include information about what camera was likely used and details such as aperture, shutter speed, ISO, etc.",
-    "Do NOT include anything sexual; keep it PG.",
-    "Do NOT mention the image's resolution.",
-    "You MUST include information about the subjective aesthetic quality of the image from low to very high.",
-    "Include information on the image's composition style, such as leading lines, rule of thirds, or symmetry.",
-    "Do NOT mention any text that is in the image.",
-    "Specify the depth of field and whether the background is in focus or blurred.",
-    "If applicable, mention the likely use of artificial or natural lighting sources.",
-    "Do NOT use any ambiguous language.",
-    "Include whether the image is sfw, suggestive, or nsfw.",
-    "ONLY describe the most important elements of the image.",
-    "If it is a work of art, do not include the artist's name or the title of the work.",
-    "Identify the image orientation (portrait, landscape, or square) and aspect ratio if obvious.",
-    """Use vulgar slang and profanity, such as (but not limited to) "fucking," "slut," "cock," etc.""",
-    "Do NOT use polite euphemisms—lean into blunt, casual phrasing.",
-    "Include information about the ages of any people/characters when applicable.",
-    "Mention whether the image depicts an extreme close-up, close-up, medium close-up, medium shot, cowboy shot, medium wide shot, wide shot, or extreme wide shot.",
-    "Do not mention the mood/feeling/etc of the image.",
-    "Explicitly specify the vantage height (eye-level, low-angle worm’s-eye, bird’s-eye, drone, rooftop, etc.).",
-    "If there is a watermark, you must mention it.",
-    """Your response will be used by a text-to-image model, so avoid useless meta phrases like “This image shows…”, "You are looking at...", etc.""",
-]
 
 DARK_STYLESHEET = """
 QWidget {
@@ -268,152 +190,332 @@ QScrollBar::sub-line:vertical {
     border: 1px solid #4f4f4f;
     background-color: #1e1e1e;
 }
-/* Styling for ClickableLabels (thumbnails) */
-ClickableLabel {
+/* Styling for the thumbnail gallery */
+#GalleryView::item {
     border: 2px solid transparent; /* Default transparent border */
     background-color: #3c3f41; /* Darker background for thumbnails */
     padding: 2px;
 }
-ClickableLabel[selected="true"] {
+#GalleryView::item:selected {
     border: 2px solid #548af7; /* Blue border for selected thumbnail */
 }
 QMainWindow {
     background-color: #2b2b2b;
 }
-#GalleryScrollArea QWidget { /* Ensure background of gallery content widget */
+#GalleryView { /* Ensure background of gallery viewport */
     background-color: #2b2b2b;
 }
 """
 
 THUMBNAIL_HEIGHT = 100
+# Per-dataset persistent thumbnail cache size; least recently viewed thumbnails are evicted beyond this.
+THUMBNAIL_CACHE_BUDGET_MB = 512
+# Decoded full-size images kept in memory for the preview and for inference (~120 MB each at 40 MP).
+DECODED_IMAGE_CACHE_MB = 1024
+# Batch jobs kept queued on the inference service, so the next one starts the moment the current one ends.
+BATCH_JOBS_IN_FLIGHT = 2
+# Upper bound on caption view refreshes per second while streaming.
+TOKEN_FLUSH_HZ = 30
+# The fixed QTimer delay the old scheduler inserted between batch items, used for the overhead report.
+LEGACY_BATCH_ITEM_DELAY_S = 0.1
+# Prefill the system prompt once and reuse its KV cache for every job (falls back automatically for padded batches).
+USE_PREFIX_KV_CACHE = True
+# On-disk vision feature cache (~/.cache/joycaption/features), used when "Cache Vision Features" is checked.
+FEATURE_CACHE_BUDGET_GB = 8
+# Per-stage timings (p50) in the status bar, refreshed this often.
+METRICS_REFRESH_MS = 1000
+# Optional exports of the stage timings, enabled by setting the environment variables to file paths:
+# a JSONL trace (one line per timed call) and a Prometheus textfile rewritten on every refresh
+# (point node_exporter's --collector.textfile.directory at its directory). Same as Run_CLI.py's
+# --metrics-trace / --metrics-prom.
+METRICS_TRACE_ENV = "JOYCAPTION_METRICS_TRACE"
+METRICS_PROMETHEUS_ENV = "JOYCAPTION_METRICS_PROM"
+
+
+def _path_from_env(name: str) -> Optional[Path]:
+    value = os.environ.get(name, "").strip()
+    return Path(value).expanduser() if value else None
+
+# --- Caption job: either one image (single mode) or one prefetched batch (batch mode) ---
+@dataclass
+class CaptionJob:
+    job_id: int
+    prompt: str
+    temperature: float
+    top_p: float
+    max_new_tokens: int
+    log_prompt: bool
+    image_path: Optional[Path] = None # Single mode
+    image: Optional[Image.Image] = None # Single mode
+    prepared_future: Optional[Future] = None # Batch mode: Future[PreparedBatch] from BatchPrefetcher
+    stream: bool = True # Emit live tokens (single-image jobs only)
+    feature_cache: Optional[FeatureCache] = None # Reuse/store projected image features across runs
+    extra_slugs: List[str] = field(default_factory=list) # Batch mode: sidecar slugs of the prompts after the primary one
+    journal: Optional[BatchJournal] = None # Batch mode: completed captions are recorded here before job_finished
+    speculative: bool = False # Decode with the service's draft model (if one is loaded)
+
+
+GENERATION_CANCELLED_CAPTION = "[Generation Cancelled]"
+
+
+def is_persistable_caption(caption: str) -> bool:
+    """False for the placeholder texts shown for failed or cancelled items."""
+    return caption not in (LOAD_ERROR_CAPTION, GENERATION_CANCELLED_CAPTION) and not caption.startswith("[Generation Error")
+
+
+class DedupWorker(QThread):
+    """Hashes the batch queue off the UI thread before a batch starts."""
+    progress = pyqtSignal(int, int) # files hashed, files to hash
+    finished_dedup = pyqtSignal(object) # DedupResult
+
+    PROGRESS_EVERY = 256 # Files between progress signals
+
+    def __init__(self, paths: List[Path], parent=None):
+        super().__init__(parent)
+        self.paths = paths
+
+    def _on_progress(self, done_count: int, total: int):
+        if done_count % self.PROGRESS_EVERY == 0 or done_count == total:
+            self.progress.emit(done_count, total)
 
-# --- Clickable Label for Thumbnails ---
-class ClickableLabel(QLabel):
-    clicked = pyqtSignal(Path) # Signal to emit when clicked, carrying the image path
+    def run(self):
+        self.finished_dedup.emit(find_duplicates(self.paths, progress_callback=self._on_progress))
+
+
+class ScanWorker(QThread):
+    """Streams a directory scan to the UI thread in chunks, so the gallery fills while the tree is walked."""
+    images_found = pyqtSignal(list) # Paths in scan order
+    scan_finished = pyqtSignal(int, bool) # total images found, cancelled
 
-    def __init__(self, image_path: Path, parent=None):
+    EMIT_EVERY = 512 # Paths per chunk...
+    EMIT_INTERVAL_S = 0.25 # ...or sooner, so the first images show up quickly on slow shares
+
+    def __init__(self, root: Path, recursive: bool, include: List[str], exclude: List[str], parent=None):
         super().__init__(parent)
-        self.image_path = image_path
-        self.setProperty("selected", False) # For styling
-        self.setFrameShape(QFrame.StyledPanel) # Gives a slight sunken look
-        self.setCursor(Qt.PointingHandCursor)
-
-    def mousePressEvent(self, event):
-        if event.button() == Qt.LeftButton:
-            self.clicked.emit(self.image_path)
-        super().mousePressEvent(event)
-
-    def setSelected(self, selected: bool):
-        self.setProperty("selected", selected)
-        self.style().unpolish(self) # Important to re-evaluate stylesheet
-        self.style().polish(self)
-
-
-# --- Helper to build prompt (from new app.py) ---
-def build_prompt_str(caption_type: str, caption_length: str | int, extra_options: list[str], name_input: str) -> str:
-    if caption_length == "any": map_idx = 0
-    elif isinstance(caption_length, str) and caption_length.isdigit(): map_idx = 1
-    else: map_idx = 2
-
-    prompt_template = CAPTION_TYPE_MAP.get(caption_type)
-    if not prompt_template or len(prompt_template) <= map_idx :
-        print(f"Warning: Prompt template not found or map_idx out of bounds for {caption_type}, index {map_idx}")
-        return "Error: Could not build prompt."
-
-    prompt = prompt_template[map_idx]
-
-    if extra_options: prompt += " " + " ".join(extra_options)
-
-    return prompt.format(
-        name=name_input or "{NAME}",
-        length=caption_length,
-        word_count=caption_length,
-    )
-
-# --- Worker for Text Generation (for streaming) ---
-class GenerationWorker(QObject):
-    new_token = pyqtSignal(str)
-    generation_finished = pyqtSignal(str) # Full caption
-    error_occurred = pyqtSignal(str)
-
-    def __init__(self, model, processor, input_image, prompt, temp, top_p, max_tokens, log_prompt_flag):
-        super().__init__()
-        self.model = model
-        self.processor = processor
-        self.input_image = input_image
-        self.prompt = prompt
-        self.temperature = temp
-        self.top_p = top_p
-        self.max_new_tokens = max_tokens
-        self.log_prompt_flag = log_prompt_flag
-        self._is_running = True
+        self.root = root
+        self.recursive = recursive
+        self.include = include
+        self.exclude = exclude
+        self._cancelled = False
 
-    def stop(self):
-        self._is_running = False
-        print("Attempting to stop generation worker...")
+    def cancel(self):
+        self._cancelled = True
 
+    def run(self):
+        found, chunk, last_emit = 0, [], time.monotonic()
+        for image_path in scan_images(self.root, recursive=self.recursive, include=self.include, exclude=self.exclude):
+            if self._cancelled:
+                break
+            chunk.append(image_path)
+            if len(chunk) >= self.EMIT_EVERY or time.monotonic() - last_emit >= self.EMIT_INTERVAL_S:
+                found += len(chunk)
+                self.images_found.emit(chunk)
+                chunk, last_emit = [], time.monotonic()
+        if chunk and not self._cancelled:
+            found += len(chunk)
+            self.images_found.emit(chunk)
+        self.scan_finished.emit(found, self._cancelled)
+
+
+class ModelLoadWorker(QThread):
+    """Loads (and warms up) the model off the UI thread, reporting each load stage as it happens."""
+    load_progress = pyqtSignal(int, str) # overall percent, stage description
+    status_message = pyqtSignal(str)
+    model_loaded = pyqtSignal(object, object, object, str) # processor, model, DraftModel or None, load message
+    load_failed = pyqtSignal(str)
+
+    # Share of the progress bar each stage covers: (start percent, end percent)
+    STAGE_SPANS = {
+        LOAD_STAGE_CONFIG: (0, 5),
+        LOAD_STAGE_SHARDS: (5, 90),
+        LOAD_STAGE_LIGER: (90, 92),
+        LOAD_STAGE_AUTOTUNE: (92, 97), # CPU profiles, first load on a machine only
+        LOAD_STAGE_WARMUP: (97, 100),
+    }
+
+    def __init__(self, model_path: str, precision: str, draft_path: Optional[str] = None, parent=None):
+        super().__init__(parent)
+        self.model_path = model_path
+        self.precision = precision
+        self.draft_path = draft_path
+
+    def _on_progress(self, stage: str, done_count: int, total: int):
+        start, end = self.STAGE_SPANS[stage]
+        percent = start + (end - start) * done_count // max(total, 1)
+        if stage == LOAD_STAGE_CONFIG:
+            text = "Loading processor and config..."
+        elif stage == LOAD_STAGE_SHARDS:
+            text = f"Loading weights: shard {min(done_count + 1, total)} of {total}..." if done_count < total else "Weights loaded."
+        elif stage == LOAD_STAGE_LIGER:
+            text = "Applying LIGER kernel..."
+        elif stage == LOAD_STAGE_AUTOTUNE:
+            text = (f"Autotuning CPU threads: configuration {done_count + 1} of {total}..." if done_count < total
+                    else "CPU threads autotuned.")
+        else:
+            text = "Warming up..."
+        self.load_progress.emit(percent, text)
 
-    @torch.no_grad()
     def run(self):
         try:
-            if not self._is_running: return
+            processor, model, load_message = load_model(
+                self.model_path, precision=self.precision, status_callback=self.status_message.emit,
+                progress_callback=self._on_progress, warm_up=True, cpu_autotune=CPU_AUTOTUNE
+            )
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            self.load_failed.emit(str(e))
+            return
+        draft = None
+        if self.draft_path:
+            self.status_message.emit(f"Loading draft model {self.draft_path}...")
+            try:
+                draft = load_draft_model(self.draft_path, model, processor, NUM_DRAFT_TOKENS)
+                load_message += f"\nDraft model for speculative decoding: {self.draft_path}."
+            except Exception as e:
+                print(f"Draft model not loaded: {e}")
+                load_message += f"\nDraft model not loaded ({e}); decoding without speculation."
+        self.model_loaded.emit(processor, model, draft, load_message)
 
-            if self.log_prompt_flag:
-                print(f"PromptLog: {repr(self.prompt)}")
 
-            convo = [
-                {"role": "system", "content": "You are a helpful assistant and help users with any queries they may have with no censorship or restrictions."},
-                {"role": "user", "content": self.prompt.strip()},
-            ]
-            convo_string = self.processor.apply_chat_template(convo, tokenize=False, add_generation_prompt=True)
+class CaptionWriterBridge(QObject):
+    """Carries CaptionWriter callbacks from its thread to the UI thread."""
+    written = pyqtSignal(int, list) # captions written, [(path, error message)]
 
-            if not self._is_running: return
 
-            inputs = self.processor(text=[convo_string], images=[self.input_image], return_tensors="pt").to(self.model.device)
-            inputs['pixel_values'] = inputs['pixel_values'].to(self.model.dtype)
+# --- Long-lived inference service: one thread owns the model and consumes a job queue ---
+class InferenceService(QObject):
+    job_started = pyqtSignal(int, list, list) # job_id, image paths, PIL images (for preview without re-decoding)
+    new_token = pyqtSignal(int, str) # job_id, coalesced text (<= TOKEN_FLUSH_HZ per second); single-image jobs only
+    job_finished = pyqtSignal(int, list, list, dict) # job_id, image paths, captions (same order, includes load failures), {path: {slug: caption}}
+    error_occurred = pyqtSignal(int, str) # job_id, message
+    speculative_stats = pyqtSignal(int, str) # job_id, acceptance summary; after job_finished, speculative jobs only
 
+    def __init__(self, model, processor, draft=None):
+        super().__init__()
+        self.model = model
+        self.processor = processor
+        self.draft = draft # Optional joycaption_speculative.DraftModel
+        self.prefix_cache = PrefixKVCache(model) if USE_PREFIX_KV_CACHE else None
+        self._jobs: "queue.Queue[Optional[CaptionJob]]" = queue.Queue()
+        self._cancel_event = threading.Event()
+        self._last_job_end: Optional[float] = None
+        self._scheduling_gaps: List[float] = [] # Idle seconds between one job ending and the next one starting
 
-            if not self._is_running: return
+    def submit(self, job: CaptionJob):
+        """Thread-safe; called from the UI thread. Jobs run in submission order."""
+        self._cancel_event.clear()
+        self._jobs.put(job)
 
-            streamer = TextIteratorStreamer(self.processor.tokenizer, timeout=20.0, skip_prompt=True, skip_special_tokens=True)
+    def cancel_current(self):
+        self._cancel_event.set()
+        print("Attempting to stop current generation...")
 
-            generate_kwargs = dict(
-                **inputs,
-                max_new_tokens=self.max_new_tokens,
-                do_sample=True if self.temperature > 0 else False,
-                use_cache=True,
-                temperature=self.temperature if self.temperature > 0 else None,
-                top_k=None,
-                top_p=self.top_p if self.temperature > 0 else None,
-                streamer=streamer,
-            )
+    def shutdown(self):
+        self.cancel_current()
+        self._jobs.put(None)
 
-            thread = Thread(target=self.model.generate, kwargs=generate_kwargs)
-            thread.start()
+    def take_scheduling_gaps(self) -> List[float]:
+        gaps, self._scheduling_gaps = self._scheduling_gaps, []
+        return gaps
 
-            full_caption_parts = []
-            for token_text in streamer:
-                if not self._is_running:
-                    print("Generation worker received stop signal during streaming.")
-                    break
-                if token_text:
-                    self.new_token.emit(token_text)
-                    full_caption_parts.append(token_text)
+    def reset_scheduling_clock(self):
+        self._last_job_end = None # The next job's wait is user think-time, not scheduling overhead
 
-            thread.join()
+    def run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            if self._last_job_end is not None:
+                self._scheduling_gaps.append(time.perf_counter() - self._last_job_end)
+            self._run_job(job)
+            self._last_job_end = time.perf_counter()
+        self.thread().quit() # Lets QThread.exec() return immediately once the loop is done
+
+    def _run_job(self, job: CaptionJob):
+        # torch / transformers are already imported by load_model; importing here keeps window startup free of them.
+        import torch
+        from joycaption_core import TokenCallbackStreamer
+        try:
+            if job.prepared_future is not None:
+                prepared = job.prepared_future.result() # Usually already done: prefetched while the previous job ran
+                failed = prepared.failed
+            else:
+                prepared = PreparedBatch(paths=[job.image_path], images=[job.image], inputs=None)
+                failed = {}
+            if self._cancel_event.is_set():
+                # Still report the job, as a cancelled generation does below, so the UI does not wait on it forever
+                out_paths = list(failed.keys()) + list(prepared.paths)
+                out_captions = [LOAD_ERROR_CAPTION] * len(failed) + [GENERATION_CANCELLED_CAPTION] * len(prepared.paths)
+                self.job_finished.emit(job.job_id, out_paths, out_captions, {})
+                return
+            draft = self.draft if job.speculative else None
+
+            self.job_started.emit(job.job_id, list(prepared.paths), list(prepared.images))
+
+            out_paths = list(failed.keys())
+            out_captions = [LOAD_ERROR_CAPTION] * len(out_paths)
+            extra_captions: Dict[str, Dict[str, str]] = {}
+            if prepared.images:
+                if job.log_prompt:
+                    print(f"PromptLog: {repr(job.prompt)}" if len(prepared.images) == 1 else
+                          f"PromptLog (batch of {len(prepared.images)}): {repr(job.prompt)}")
+                inputs = prepared.inputs
+                if inputs is None:
+                    inputs = prepare_batch_inputs(self.processor, prepared.images, [job.prompt] * len(prepared.images))
+
+                image_features = None
+                if job.feature_cache is not None and not prepared.content_hashes: # Single-image jobs skip the prefetcher
+                    for img_path in prepared.paths:
+                        content_hash, features = job.feature_cache.lookup(img_path)
+                        prepared.content_hashes.append(content_hash)
+                        prepared.cached_features.append(features)
+                if job.feature_cache is not None or prepared.fanout > 1:
+                    image_features = resolve_image_features(
+                        self.model, inputs, prepared.fanout, job.feature_cache,
+                        prepared.content_hashes, prepared.cached_features
+                    )
 
-            if not self._is_running and not full_caption_parts:
-                 self.generation_finished.emit("[Generation Cancelled]")
-                 return
+                streamer, coalescer = None, None
+                if job.stream and len(prepared.images) * prepared.fanout == 1:
+                    # One cross-thread signal per flush instead of per token keeps the UI thread off the critical path.
+                    coalescer = TokenCoalescer(lambda text: self.new_token.emit(job.job_id, text), max_hz=TOKEN_FLUSH_HZ)
+                    streamer = TokenCallbackStreamer(self.processor.tokenizer, coalescer.add)
+                captions = generate_from_inputs(
+                    self.model, self.processor, inputs, job.temperature, job.top_p, job.max_new_tokens,
+                    streamer=streamer, stop_event=self._cancel_event, prefix_cache=self.prefix_cache,
+                    image_features=image_features, draft=draft,
+                )
+                if draft is not None:
+                    print(f"Speculative decoding ({len(prepared.images)} images): {draft.last_stats.describe()}")
+                if coalescer:
+                    coalescer.flush()
+                if self._cancel_event.is_set() and not any(captions):
+                    captions = [GENERATION_CANCELLED_CAPTION] * len(captions)
+                # Rows are image-major; the first prompt of each image is the primary caption.
+                out_paths += prepared.paths
+                out_captions += captions[::prepared.fanout]
+                for image_idx, img_path in enumerate(prepared.paths):
+                    row_start = image_idx * prepared.fanout
+                    extra_captions[str(img_path)] = dict(
+                        zip(job.extra_slugs, captions[row_start + 1:row_start + prepared.fanout])
+                    )
+                if job.journal is not None and not self._cancel_event.is_set():
+                    job.journal.record({
+                        str(img_path): {"": caption, **extra_captions[str(img_path)]}
+                        for img_path, caption in zip(prepared.paths, captions[::prepared.fanout])
+                    })
 
-            final_caption = "".join(full_caption_parts)
-            self.generation_finished.emit(final_caption)
+            self.job_finished.emit(job.job_id, out_paths, out_captions, extra_captions)
+            if draft is not None and prepared.images:
+                self.speculative_stats.emit(job.job_id, draft.last_stats.describe())
 
         except Exception as e:
             import traceback
-            error_msg = f"Error in generation worker: {e}\n{traceback.format_exc()}"
+            error_msg = f"Error in inference service: {e}\n{traceback.format_exc()}"
             print(error_msg)
-            self.error_occurred.emit(str(e))
+            self.error_occurred.emit(job.job_id, str(e))
         finally:
             if torch.cuda.is_available():
                 torch.cuda.empty_cache()
@@ -421,27 +523,50 @@ class GenerationWorker(QObject):
 
 # --- Main Application Window ---
 class CaptionApp(QMainWindow):
-    def __init__(self):
+    def __init__(self, default_precision: str = DEFAULT_PRECISION):
         super().__init__()
         self.model = None
         self.processor = None
         self.models_loaded = False
+        self.model_load_worker: Optional[ModelLoadWorker] = None
+        self.default_precision = default_precision
+        self.loaded_precision: Optional[str] = None # Profile name the current model was loaded with
+        self.draft_model = None # joycaption_speculative.DraftModel, loaded with the model when speculation is enabled
         
         self.current_image_path: Optional[Path] = None
         self.current_pil_image: Optional[Image.Image] = None
+        self.image_cache = DecodedImageCache(DECODED_IMAGE_CACHE_MB * 1024 * 1024)
+        # Sidecars are written off the UI thread as results arrive; see on_captions_written.
+        self.caption_writer_bridge = CaptionWriterBridge()
+        self.caption_writer_bridge.written.connect(self.on_captions_written)
+        self.caption_writer = CaptionWriter(on_written=self.caption_writer_bridge.written.emit)
         
-        self.generation_thread: Optional[QThread] = None
-        self.generation_worker: Optional[GenerationWorker] = None
+        self.inference_thread: Optional[QThread] = None
+        self.inference_service: Optional[InferenceService] = None
+        self.feature_cache: Optional[FeatureCache] = None # Created once the model (and so its namespace) is known
+        self.active_job_id: Optional[int] = None # Job whose output is on screen; None while idle
+        self.batch_jobs_in_flight: List[int] = [] # Submitted batch job ids, oldest first
+        self.batch_start_time: float = 0.0
+        self.next_job_id = 0
 
         self.image_files: List[Path] = [] # List of paths for batch mode
+        self.dataset_dir: Optional[Path] = None # Directory chosen with Load Directory (journal / thumbnail cache location)
+        self.scan_worker: Optional[ScanWorker] = None
         self.captions_cache: Dict[str, str] = {} # str(image_path): caption_text
+        self.extra_captions_cache: Dict[str, Dict[str, str]] = {} # str(image_path): {slug: caption_text}
         self.is_batch_mode: bool = False
         self.is_generating_batch: bool = False
         self.batch_generation_queue: List[Path] = []
         self.current_batch_item_path: Optional[Path] = None
+        self.current_batch_chunk: List[Path] = [] # Paths in the batched generate call currently running
+        self.batch_prefetcher: Optional[BatchPrefetcher] = None
+        self.batch_extra_slugs: List[str] = [] # Sidecar slugs of the additional caption types in the running batch
+        self.batch_journal: Optional[BatchJournal] = None # Progress journal of the running batch (resume support)
+        self.batch_prompts: List[str] = []
+        self.batch_duplicates: Dict[Path, List[Path]] = {} # Captioned image -> byte-identical copies that reuse its caption
+        self.dedup_worker: Optional[DedupWorker] = None
 
         self.is_dark_mode_enabled = False
-        self.thumbnail_widgets: List[ClickableLabel] = []
 
 
         self.logo_label = QLabel()
@@ -501,6 +626,16 @@ class CaptionApp(QMainWindow):
         self.load_models_button.setMaximumWidth(180)
         top_buttons_layout.addWidget(self.load_models_button)
 
+        self.precision_combo = QComboBox()
+        self.precision_combo.addItem("Auto (bf16 on CUDA, bf16/fp32 on CPU)", PRECISION_AUTO)
+        for profile in PRECISION_PROFILES.values():
+            self.precision_combo.addItem(profile.label, profile.name)
+        self.precision_combo.setCurrentIndex(max(0, self.precision_combo.findData(self.default_precision)))
+        self.precision_combo.setToolTip("How the weights are stored and computed. Pick another profile and press "
+                                        "Reload Model to switch.")
+        self.precision_combo.currentIndexChanged.connect(self.update_button_states)
+        top_buttons_layout.addWidget(self.precision_combo)
+
         self.select_image_button = QPushButton("Select Image")
         self.select_image_button.clicked.connect(self.select_image_action)
         self.select_image_button.setMaximumWidth(180)
@@ -512,24 +647,44 @@ class CaptionApp(QMainWindow):
         top_buttons_layout.addWidget(self.load_directory_button)
         top_buttons_layout.addStretch()
         left_panel_layout.addLayout(top_buttons_layout)
+
+        scan_options_layout = QHBoxLayout()
+        self.recursive_scan_checkbox = QCheckBox("Include Subfolders")
+        self.recursive_scan_checkbox.setToolTip("Load Directory also scans nested folders (hidden folders are skipped).")
+        scan_options_layout.addWidget(self.recursive_scan_checkbox)
+        self.scan_filter_line = QLineEdit()
+        self.scan_filter_line.setPlaceholderText("Filter globs, e.g.  *.png  !*_mask.png  !raw/*")
+        self.scan_filter_line.setToolTip("Space-separated globs on the file name or relative path. Prefix with ! to exclude.")
+        scan_options_layout.addWidget(self.scan_filter_line)
+        left_panel_layout.addLayout(scan_options_layout)
         
         self.image_path_label = QLabel("No image selected.")
         self.image_path_label.setWordWrap(True)
         left_panel_layout.addWidget(self.image_path_label)
 
         # --- Image Gallery (for batch mode) ---
-        self.gallery_scroll_area = QScrollArea()
-        self.gallery_scroll_area.setObjectName("GalleryScrollArea")
-        self.gallery_scroll_area.setWidgetResizable(True)
-        self.gallery_scroll_area.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
-        self.gallery_scroll_area.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded)
-        self.gallery_widget = QWidget() 
-        self.gallery_layout = QVBoxLayout(self.gallery_widget) 
-        self.gallery_layout.setAlignment(Qt.AlignTop)
-        self.gallery_scroll_area.setWidget(self.gallery_widget)
-        self.gallery_scroll_area.setMinimumHeight(150) 
-        self.gallery_scroll_area.setVisible(False) 
-        left_panel_layout.addWidget(self.gallery_scroll_area)
+        # Virtualized: the view only asks the model for rows it paints, and thumbnails decode in the background.
+        self.gallery_model = ThumbnailListModel(THUMBNAIL_HEIGHT, self)
+        self.gallery_view = QListView()
+        self.gallery_view.setObjectName("GalleryView")
+        self.gallery_view.setModel(self.gallery_model)
+        self.gallery_view.setViewMode(QListView.ListMode)
+        self.gallery_view.setFlow(QListView.TopToBottom)
+        self.gallery_view.setUniformItemSizes(True)
+        self.gallery_view.setLayoutMode(QListView.Batched)
+        self.gallery_view.setBatchSize(200)
+        self.gallery_view.setIconSize(QSize(THUMBNAIL_HEIGHT * 2, THUMBNAIL_HEIGHT))
+        self.gallery_view.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.gallery_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.gallery_view.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.gallery_view.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded)
+        self.gallery_view.setCursor(Qt.PointingHandCursor)
+        self.gallery_view.clicked.connect(
+            lambda index: self._on_thumbnail_clicked(index.data(ThumbnailListModel.PathRole))
+        )
+        self.gallery_view.setMinimumHeight(150) 
+        self.gallery_view.setVisible(False) 
+        left_panel_layout.addWidget(self.gallery_view)
 
 
         # --- Captioning Controls ---
@@ -573,6 +728,20 @@ class CaptionApp(QMainWindow):
         self.extra_options_group.setLayout(extra_options_layout_container)
         left_panel_layout.addWidget(self.extra_options_group)
 
+        # Each checked type is generated alongside the main one during batch runs, sharing the image encoding,
+        # and saved to its own sidecar (img.<slug>.txt).
+        self.additional_types_group = QGroupBox("Additional Caption Types (Batch)")
+        self.additional_types_group.setCheckable(True)
+        self.additional_types_group.setChecked(False)
+        additional_types_layout = QGridLayout()
+        self.additional_type_checkboxes: Dict[str, QCheckBox] = {}
+        for idx, caption_type in enumerate(CAPTION_TYPE_MAP.keys()):
+            cb = QCheckBox(f"{caption_type} (.{CAPTION_TYPE_SLUGS[caption_type]}.txt)")
+            additional_types_layout.addWidget(cb, idx // 2, idx % 2)
+            self.additional_type_checkboxes[caption_type] = cb
+        self.additional_types_group.setLayout(additional_types_layout)
+        left_panel_layout.addWidget(self.additional_types_group)
+
 
         self.name_input_label = QLabel("Person / Character Name:")
         self.name_input_line = QLineEdit()
@@ -626,6 +795,34 @@ class CaptionApp(QMainWindow):
         max_tok_layout.addWidget(self.max_tokens_value_label)
         gen_settings_layout.addLayout(max_tok_layout)
 
+        batch_size_layout = QHBoxLayout()
+        batch_size_layout.addWidget(QLabel("Batch Size (1-16):"))
+        self.batch_size_slider = QSlider(Qt.Horizontal)
+        self.batch_size_slider.setRange(1, 16)
+        self.batch_size_slider.setValue(1)
+        self.batch_size_slider.setTickInterval(1)
+        self.batch_size_slider.setTickPosition(QSlider.TicksBelow)
+        self.batch_size_slider.setToolTip("Images per generate call in batch mode. Values above 1 disable live token streaming.")
+        self.batch_size_value_label = QLabel(str(self.batch_size_slider.value()))
+        self.batch_size_slider.valueChanged.connect(lambda v: self.batch_size_value_label.setText(str(v)))
+        batch_size_layout.addWidget(self.batch_size_slider)
+        batch_size_layout.addWidget(self.batch_size_value_label)
+        gen_settings_layout.addLayout(batch_size_layout)
+
+        prefetch_layout = QHBoxLayout()
+        prefetch_layout.addWidget(QLabel("Prefetch Depth (1-8):"))
+        self.prefetch_depth_slider = QSlider(Qt.Horizontal)
+        self.prefetch_depth_slider.setRange(1, 8)
+        self.prefetch_depth_slider.setValue(2)
+        self.prefetch_depth_slider.setTickInterval(1)
+        self.prefetch_depth_slider.setTickPosition(QSlider.TicksBelow)
+        self.prefetch_depth_slider.setToolTip("Batches decoded and preprocessed ahead of the one currently generating.")
+        self.prefetch_depth_value_label = QLabel(str(self.prefetch_depth_slider.value()))
+        self.prefetch_depth_slider.valueChanged.connect(lambda v: self.prefetch_depth_value_label.setText(str(v)))
+        prefetch_layout.addWidget(self.prefetch_depth_slider)
+        prefetch_layout.addWidget(self.prefetch_depth_value_label)
+        gen_settings_layout.addLayout(prefetch_layout)
+
         gen_settings_group.setLayout(gen_settings_layout)
         left_panel_layout.addWidget(gen_settings_group)
 
@@ -634,6 +831,33 @@ class CaptionApp(QMainWindow):
         self.log_prompt_checkbox.setChecked(True)
         misc_options_layout.addWidget(self.log_prompt_checkbox)
 
+        self.live_preview_checkbox = QCheckBox("Live Preview in Batch")
+        self.live_preview_checkbox.setChecked(True)
+        self.live_preview_checkbox.setToolTip("Stream tokens into the caption view during batch runs. Uncheck to skip all per-token UI work.")
+        misc_options_layout.addWidget(self.live_preview_checkbox)
+
+        self.dedup_checkbox = QCheckBox("Skip Duplicate Images")
+        self.dedup_checkbox.setChecked(True)
+        self.dedup_checkbox.setToolTip("Hash the batch first; byte-identical copies get the caption of the first one instead of a generation.")
+        misc_options_layout.addWidget(self.dedup_checkbox)
+
+        self.feature_cache_checkbox = QCheckBox("Cache Vision Features")
+        self.feature_cache_checkbox.setChecked(False)
+        self.feature_cache_checkbox.setToolTip(
+            f"Keep encoded images on disk (up to {FEATURE_CACHE_BUDGET_GB} GB) so re-captioning with a new prompt skips the vision encoder."
+        )
+        misc_options_layout.addWidget(self.feature_cache_checkbox)
+
+        self.speculative_checkbox = QCheckBox("Speculative Decoding")
+        self.speculative_checkbox.setChecked(False)
+        self.speculative_checkbox.setToolTip(
+            f"A small draft model ({DRAFT_MODEL_PATH}) proposes {NUM_DRAFT_TOKENS} tokens at a time for the captioning model "
+            "to verify: lower latency for long captions, identical captions at temperature 0. Loaded with the model; "
+            "press Reload Model after enabling it."
+        )
+        self.speculative_checkbox.toggled.connect(self.update_button_states)
+        misc_options_layout.addWidget(self.speculative_checkbox)
+
         self.dark_mode_button = QPushButton("Enable Dark Mode")
         self.dark_mode_button.clicked.connect(self.toggle_dark_mode)
         misc_options_layout.addWidget(self.dark_mode_button)
@@ -700,18 +924,47 @@ class CaptionApp(QMainWindow):
         self.progress_bar = QProgressBar()
         self.status_bar.addPermanentWidget(self.progress_bar)
         self.progress_bar.hide()
+        self.metrics_label = QLabel()
+        self.metrics_label.setToolTip("Median time per pipeline stage since startup.")
+        self.status_bar.addPermanentWidget(self.metrics_label)
+        self.metrics_prometheus_path = _path_from_env(METRICS_PROMETHEUS_ENV)
+        metrics_trace_path = _path_from_env(METRICS_TRACE_ENV)
+        if metrics_trace_path:
+            try:
+                METRICS.start_trace(metrics_trace_path)
+            except OSError as e:
+                print(f"Error opening metrics trace {metrics_trace_path}: {e}")
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.timeout.connect(self.refresh_metrics)
+        self.metrics_timer.start(METRICS_REFRESH_MS)
         self.show_status("Ready. Please load the model first.", 5000)
 
     def show_status(self, message, timeout=0):
         self.status_bar.showMessage(message, timeout)
-        QApplication.processEvents()
+
+    def refresh_metrics(self):
+        self.metrics_label.setText(METRICS.summary())
+        if self.metrics_prometheus_path:
+            try:
+                METRICS.write_prometheus(self.metrics_prometheus_path)
+            except OSError as e:
+                print(f"Error writing metrics to {self.metrics_prometheus_path}: {e}")
+
+    def is_generating(self) -> bool:
+        return self.active_job_id is not None or bool(self.batch_jobs_in_flight) or self.dedup_worker is not None
 
     def update_button_states(self):
-        self.load_models_button.setEnabled(not self.models_loaded)
-        
-        is_generating_anything = self.generation_thread and self.generation_thread.isRunning()
+        is_generating_anything = self.is_generating()
+        precision_changed = self.precision_combo.currentData() != self.loaded_precision
+        draft_missing = self.speculative_checkbox.isChecked() and self.draft_model is None
+        self.load_models_button.setText("Reload Model" if self.models_loaded else "Load Model")
+        self.load_models_button.setEnabled(
+            (not self.models_loaded or precision_changed or draft_missing) and self.model_load_worker is None and not is_generating_anything
+        )
+        self.precision_combo.setEnabled(self.model_load_worker is None and not is_generating_anything)
         can_start_single_generation = self.models_loaded and self.current_pil_image is not None and not is_generating_anything
-        can_start_batch_generation = self.models_loaded and bool(self.image_files) and not self.is_generating_batch and not is_generating_anything
+        can_start_batch_generation = (self.models_loaded and bool(self.image_files) and self.scan_worker is None
+                                      and not self.is_generating_batch and not is_generating_anything)
 
         if is_generating_anything:
             current_op_text = "Generating Batch..." if self.is_generating_batch else "Generating Current..."
@@ -724,11 +977,11 @@ class CaptionApp(QMainWindow):
             self.generate_batch_button.setText("Generate Batch Captions")
             self.generate_batch_button.setEnabled(can_start_batch_generation)
         
-        self.select_image_button.setEnabled(self.models_loaded and not is_generating_anything)
-        self.load_directory_button.setEnabled(self.models_loaded and not is_generating_anything)
+        # Browsing does not need the model, so it stays available while the model loads.
+        self.select_image_button.setEnabled(not is_generating_anything)
+        self.load_directory_button.setEnabled(not is_generating_anything)
         
-        for thumb_label in self.thumbnail_widgets:
-            thumb_label.setEnabled(not is_generating_anything)
+        self.gallery_view.setEnabled(not is_generating_anything)
 
         self.save_caption_button.setEnabled(self.current_image_path is not None and not is_generating_anything)
         self.save_all_captions_button.setEnabled(
@@ -736,9 +989,10 @@ class CaptionApp(QMainWindow):
         )
         
         input_widgets_to_toggle = [
-            self.caption_type_combo, self.caption_length_combo, self.extra_options_group,
+            self.caption_type_combo, self.caption_length_combo, self.extra_options_group, self.additional_types_group,
             self.name_input_line, self.temp_slider, self.topp_slider, self.max_tokens_slider,
-            self.prompt_display_text
+            self.batch_size_slider, self.prefetch_depth_slider, self.live_preview_checkbox,
+            self.feature_cache_checkbox, self.speculative_checkbox, self.dedup_checkbox, self.prompt_display_text
         ]
         for widget in input_widgets_to_toggle:
             widget.setEnabled(not is_generating_anything)
@@ -765,61 +1019,48 @@ class CaptionApp(QMainWindow):
             self.prompt_display_text.setPlainText(built_prompt)
 
     def _clear_gallery(self):
-        for i in reversed(range(self.gallery_layout.count())):
-            widget_to_remove = self.gallery_layout.itemAt(i).widget()
-            if widget_to_remove:
-                widget_to_remove.setParent(None)
-                widget_to_remove.deleteLater()
-        self.thumbnail_widgets.clear()
-        self.gallery_scroll_area.setVisible(False)
+        self.gallery_model.set_paths([])
+        self.gallery_view.setVisible(False)
 
     def _populate_gallery(self):
-        self._clear_gallery()
-        if not self.image_files or not self.is_batch_mode:
-            self.gallery_scroll_area.setVisible(False)
+        if not self.is_batch_mode or self.dataset_dir is None:
+            self._clear_gallery()
             return
 
-        self.gallery_scroll_area.setVisible(True)
-        for img_path in self.image_files:
-            try:
-                pixmap = QPixmap(str(img_path))
-                if pixmap.isNull():
-                    thumb_label = ClickableLabel(img_path)
-                    thumb_label.setText(f"Err: {img_path.name[:15]}...")
-                    thumb_label.setToolTip(f"Error loading thumbnail for {img_path.name}")
-                else:
-                    scaled_pixmap = pixmap.scaledToHeight(THUMBNAIL_HEIGHT, Qt.SmoothTransformation)
-                    thumb_label = ClickableLabel(img_path)
-                    thumb_label.setPixmap(scaled_pixmap)
-                    thumb_label.setToolTip(img_path.name)
-                
-                thumb_label.clicked.connect(self._on_thumbnail_clicked)
-                self.gallery_layout.addWidget(thumb_label)
-                self.thumbnail_widgets.append(thumb_label)
-            except Exception as e:
-                print(f"Error creating thumbnail for {img_path}: {e}")
-        self.gallery_layout.addStretch() 
+        thumbnail_cache = None
+        try:
+            thumbnail_cache = ThumbnailCache(self.dataset_dir, THUMBNAIL_HEIGHT,
+                                             budget_bytes=THUMBNAIL_CACHE_BUDGET_MB * 1024 * 1024)
+        except Exception as e:
+            print(f"Thumbnail cache unavailable, thumbnails will be decoded from the originals: {e}")
+        # Instant: no decoding until rows become visible, and cached thumbnails skip the decoder entirely.
+        # Rows arriving later from the directory scan are appended in on_scan_images_found.
+        self.gallery_model.set_paths(self.image_files, cache=thumbnail_cache)
+        self.gallery_view.setVisible(True)
 
     def _update_gallery_selection_highlight(self, selected_path: Optional[Path]):
-        for thumb_label in self.thumbnail_widgets:
-            is_selected = thumb_label.image_path == selected_path
-            thumb_label.setSelected(is_selected)
+        index = self.gallery_model.index_of(selected_path)
+        if index.isValid():
+            self.gallery_view.setCurrentIndex(index)
+            self.gallery_view.scrollTo(index)
+        else:
+            self.gallery_view.clearSelection()
 
 
     def _on_thumbnail_clicked(self, image_path: Path):
-        if self.generation_thread and self.generation_thread.isRunning():
+        if self.is_generating():
             QMessageBox.warning(self, "Busy", "Cannot change image while generation is in progress.")
             return
-        if image_path in self.image_files:
-            idx = self.image_files.index(image_path)
-            self._load_image_for_display(image_path, idx) 
+        idx = self.gallery_model.row_of(image_path)
+        if idx >= 0:
+            self._load_image_for_display(image_path, idx)
         else:
             print(f"Clicked thumbnail path {image_path} not in current batch.")
 
     def _load_image_for_display(self, image_path: Path, index_in_batch: int = -1) -> bool:
         self.current_image_path = image_path # Set this early
         try:
-            self.current_pil_image = Image.open(self.current_image_path).convert("RGB")
+            self.current_pil_image = self.image_cache.get_pil(self.current_image_path) # Times image_load on a miss
             self.display_image(self.current_image_path)
             
             if self.is_batch_mode:
@@ -840,8 +1081,7 @@ class CaptionApp(QMainWindow):
                 caption_text_to_display = self.captions_cache[image_path_str]
                 # print(f"Loaded caption for {image_path_str} from cache.") # Debug
             else:
-                # MODIFIED LINE
-                caption_file_path = self.current_image_path.with_suffix(".txt")
+                caption_file_path = caption_path_for(self.current_image_path)
                 if caption_file_path.exists():
                     try:
                         with open(caption_file_path, "r", encoding="utf-8") as f:
@@ -874,7 +1114,7 @@ class CaptionApp(QMainWindow):
 
 
     def select_image_action(self):
-        if self.generation_thread and self.generation_thread.isRunning():
+        if self.is_generating():
             QMessageBox.warning(self, "Busy", "Cannot select image while generation is in progress.")
             return
             
@@ -882,6 +1122,8 @@ class CaptionApp(QMainWindow):
         if file_path_str:
             file_path = Path(file_path_str)
             
+            self._stop_directory_scan()
+            self.dataset_dir = None
             self.image_files = [] 
             self.is_batch_mode = False
             self._clear_gallery() 
@@ -889,48 +1131,81 @@ class CaptionApp(QMainWindow):
             self._load_image_for_display(file_path)
 
     def load_directory_action(self):
-        if self.generation_thread and self.generation_thread.isRunning():
+        if self.is_generating():
             QMessageBox.warning(self, "Busy", "Cannot load directory while generation is in progress.")
             return
 
         dir_path_str = QFileDialog.getExistingDirectory(self, "Select Image Directory")
         if dir_path_str:
-            dir_path = Path(dir_path_str)
-            image_extensions = [".png", ".jpg", ".jpeg", ".bmp", ".webp", ".gif"]
-            found_files = sorted([p for p in dir_path.iterdir() if p.is_file() and p.suffix.lower() in image_extensions])
-
-            if not found_files:
-                QMessageBox.information(self, "No Images", f"No supported image files found in {dir_path.name}.")
-                self.image_path_label.setText("No images found in selected directory.")
-                self.is_batch_mode = False
-                self.image_files = []
-                self._clear_gallery()
-            else:
-                self.image_files = found_files
-                self.is_batch_mode = True
-                self.captions_cache.clear() # Clear old cache for the new batch directory
-                self._populate_gallery()
-                if self.image_files:
-                    self._load_image_for_display(self.image_files[0], 0) # Load first image
-                self.show_status(f"{len(self.image_files)} images loaded from directory.", 3000)
-            
-            self.update_button_states()
+            self._start_directory_scan(Path(dir_path_str))
+
+    def _stop_directory_scan(self):
+        if self.scan_worker:
+            self.scan_worker.cancel()
+            self.scan_worker.wait()
+            self.scan_worker = None
+
+    def _start_directory_scan(self, dir_path: Path):
+        """Scans in the background; the gallery and image list grow as chunks arrive."""
+        self._stop_directory_scan()
+        filter_globs = self.scan_filter_line.text().split()
+        include = [g for g in filter_globs if not g.startswith("!")]
+        exclude = [g[1:] for g in filter_globs if g.startswith("!") and len(g) > 1]
+
+        self.dataset_dir = dir_path
+        self.image_files = []
+        self.is_batch_mode = True
+        self.captions_cache.clear() # Clear old cache for the new batch directory
+        self.extra_captions_cache.clear()
+        self.image_cache.clear()
+        self._populate_gallery()
+        self.image_path_label.setText(f"Scanning {dir_path.name}...")
+
+        self.scan_worker = ScanWorker(dir_path, self.recursive_scan_checkbox.isChecked(), include, exclude, self)
+        self.scan_worker.images_found.connect(self.on_scan_images_found)
+        self.scan_worker.scan_finished.connect(self.on_scan_finished)
+        self.scan_worker.start()
+        self.show_status(f"Scanning {dir_path}...", 0)
+        self.update_button_states()
+
+    def on_scan_images_found(self, paths):
+        if self.sender() is not self.scan_worker:
+            return # Chunk from a scan that was replaced
+        is_first_chunk = not self.image_files
+        self.image_files.extend(paths)
+        self.gallery_model.append_paths(paths)
+        if is_first_chunk:
+            self._load_image_for_display(self.image_files[0], 0) # Load first image
+        self.show_status(f"Scanning... {len(self.image_files)} images found.", 0)
+
+    def on_scan_finished(self, found_count, cancelled):
+        if self.sender() is not self.scan_worker:
+            return
+        self.scan_worker.wait()
+        self.scan_worker = None
+        if found_count == 0 and not cancelled:
+            QMessageBox.information(self, "No Images", f"No supported image files found in {self.dataset_dir.name}.")
+            self.image_path_label.setText("No images found in selected directory.")
+            self.is_batch_mode = False
+            self.image_files = []
+            self._clear_gallery()
+        else:
+            self.show_status(f"{len(self.image_files)} images loaded from directory.", 3000)
+        self.update_button_states()
 
     def display_image(self, image_path: Path):
-        pixmap = QPixmap(str(image_path))
+        # Served from the decoded-image cache: no disk read or decode on navigation back / resize.
+        try:
+            pixmap = self.image_cache.scaled_pixmap(
+                image_path, self.image_display_label.width(), self.image_display_label.height()
+            )
+        except Exception as e:
+            print(f"Error displaying {image_path}: {e}")
+            pixmap = QPixmap()
         if pixmap.isNull():
             self.image_display_label.setText("Cannot display image.")
             return
-
-        lbl_w = self.image_display_label.width()
-        lbl_h = self.image_display_label.height()
-        
-        if lbl_w <=0 or lbl_h <= 0:
-            self.image_display_label.setPixmap(pixmap) 
-            return
-
-        scaled_pixmap = pixmap.scaled(lbl_w, lbl_h, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-        self.image_display_label.setPixmap(scaled_pixmap)
+        self.image_display_label.setPixmap(pixmap)
 
     def resizeEvent(self, event):
         super().resizeEvent(event)
@@ -938,57 +1213,125 @@ class CaptionApp(QMainWindow):
              self.display_image(self.current_image_path)
 
     def load_models_action(self):
-        self.show_status(f"Loading Llava model ({MODEL_PATH})... This may take time.", 0)
-        self.progress_bar.setRange(0,0)
+        """Starts loading in a ModelLoadWorker; the gallery and prompt controls stay usable meanwhile."""
+        if self.model_load_worker is not None or self.is_generating():
+            return
+        if self.models_loaded:
+            self._unload_model() # Switching precision: free the old weights before loading the new ones
+        precision = self.precision_combo.currentData()
+        self.show_status(f"Loading Llava model ({MODEL_PATH}, {precision})... You can browse images while it loads.", 0)
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setValue(0)
         self.progress_bar.show()
-        self.load_models_button.setEnabled(False)
-        QApplication.processEvents()
 
-        try:
-            self.processor = AutoProcessor.from_pretrained(MODEL_PATH)
-            self.show_status("Processor loaded. Loading model weights...", 0); QApplication.processEvents()
-
-            device = "cuda" if torch.cuda.is_available() else "cpu"
-            torch_dtype = torch.bfloat16 if device == "cuda" else torch.float32
-            if device == "cpu" and not hasattr(torch, 'bfloat16'):
-                torch_dtype = torch.float32
-                print("CPU mode: Using float32 for model.")
-            
-            print(f"Attempting to load model on device: {device} with dtype: {torch_dtype}")
+        draft_path = DRAFT_MODEL_PATH if self.speculative_checkbox.isChecked() else None
+        self.model_load_worker = ModelLoadWorker(MODEL_PATH, precision, draft_path, self)
+        self.model_load_worker.load_progress.connect(self.on_model_load_progress)
+        self.model_load_worker.status_message.connect(lambda msg: self.show_status(msg, 0))
+        self.model_load_worker.model_loaded.connect(self.on_model_loaded)
+        self.model_load_worker.load_failed.connect(self.on_model_load_failed)
+        self.model_load_worker.start()
+        self.update_button_states()
 
-            self.model = LlavaForConditionalGeneration.from_pretrained(
-                MODEL_PATH,
-                torch_dtype=torch_dtype,
-                low_cpu_mem_usage=True,
-                device_map="auto"
-            )
-            self.model.eval()
+    def on_model_load_progress(self, percent, stage_text):
+        self.progress_bar.setValue(percent)
+        self.show_status(stage_text, 0)
 
-            if LIGER_AVAILABLE and hasattr(self.model, 'language_model'):
-                self.show_status("Applying LIGER kernel...", 0); QApplication.processEvents()
-                apply_liger_kernel_to_llama(model=self.model.language_model)
+    def _finish_model_load(self):
+        self.model_load_worker.wait()
+        self.model_load_worker = None
+        self.progress_bar.hide()
+        self.progress_bar.setRange(0,100)
+
+    def on_model_loaded(self, processor, model, draft_model, model_load_message):
+        self.loaded_precision = self.model_load_worker.precision
+        self._finish_model_load()
+        self.processor, self.model, self.draft_model = processor, model, draft_model
+        self.models_loaded = True
+        self._start_inference_service()
+        self.show_status(model_load_message, 5000)
+        self.update_button_states()
+        QMessageBox.information(self, "Model Loaded", model_load_message)
 
-            self.models_loaded = True
-            self.show_status("Model loaded successfully!", 5000)
-            QMessageBox.information(self, "Model Loaded", f"{MODEL_PATH} loaded.")
-        except Exception as e:
-            self.models_loaded = False
-            error_detail = f"Failed to load model: {e}\nCheck console."
-            self.show_status(error_detail, 0)
-            QMessageBox.critical(self, "Model Load Error", error_detail)
-            import traceback
-            traceback.print_exc()
-        finally:
-            self.progress_bar.hide()
-            self.progress_bar.setRange(0,100)
-            self.update_button_states()
+    def on_model_load_failed(self, error_message):
+        self._finish_model_load()
+        self.models_loaded = False
+        error_detail = f"Failed to load model: {error_message}\nCheck console."
+        self.show_status(error_detail, 0)
+        self.update_button_states()
+        QMessageBox.critical(self, "Model Load Error", error_detail)
+
+    def _stop_inference_service(self):
+        if self.inference_thread and self.inference_thread.isRunning():
+            self.inference_service.shutdown()
+            self.inference_thread.quit()
+            if not self.inference_thread.wait(2000):
+                print("Inference thread did not stop gracefully, terminating.")
+                self.inference_thread.terminate()
+                self.inference_thread.wait()
+        self.inference_thread = None
+        self.inference_service = None
+
+    def _unload_model(self):
+        self._stop_inference_service()
+        if self.feature_cache:
+            self.feature_cache.close()
+            self.feature_cache = None
+        self.model, self.processor, self.draft_model = None, None, None
+        self.models_loaded = False
+        self.loaded_precision = None
+        import gc
+        import torch
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def _start_inference_service(self):
+        self.feature_cache = FeatureCache(
+            feature_namespace(self.model, self.processor), budget_bytes=FEATURE_CACHE_BUDGET_GB * 1024 ** 3
+        )
+        self.inference_thread = QThread(self)
+        self.inference_service = InferenceService(self.model, self.processor, self.draft_model)
+        self.inference_service.moveToThread(self.inference_thread)
+
+        self.inference_service.job_started.connect(self.on_job_started)
+        self.inference_service.new_token.connect(self.on_job_token)
+        self.inference_service.job_finished.connect(self.on_generation_finished)
+        self.inference_service.error_occurred.connect(self.on_generation_error)
+        self.inference_service.speculative_stats.connect(lambda job_id, stats: self.show_status(f"Speculative decoding: {stats}", 5000))
+
+        self.inference_thread.started.connect(self.inference_service.run)
+        self.inference_thread.start()
+
+    def _make_job(self, **job_inputs) -> CaptionJob:
+        self.next_job_id += 1
+        return CaptionJob(
+            job_id=self.next_job_id,
+            prompt=self.prompt_display_text.toPlainText(),
+            temperature=self.temp_slider.value() / 100.0,
+            top_p=self.topp_slider.value() / 100.0,
+            max_new_tokens=self.max_tokens_slider.value(),
+            log_prompt=self.log_prompt_checkbox.isChecked(),
+            feature_cache=self._active_feature_cache(),
+            speculative=self.speculative_checkbox.isChecked(),
+            **job_inputs
+        )
+
+    def _additional_caption_types(self) -> List[str]:
+        if not self.additional_types_group.isChecked():
+            return []
+        main_type = self.caption_type_combo.currentText()
+        return [t for t, cb in self.additional_type_checkboxes.items() if cb.isChecked() and t != main_type]
+
+    def _active_feature_cache(self) -> Optional[FeatureCache]:
+        return self.feature_cache if self.feature_cache_checkbox.isChecked() else None
 
     def generate_caption_action(self):
         if not self.models_loaded or not self.current_pil_image:
             QMessageBox.warning(self, "Not Ready", "Load model and select an image.")
             return
 
-        if self.generation_thread and self.generation_thread.isRunning():
+        if self.is_generating():
             QMessageBox.information(self, "Busy", "Generation in progress.")
             return
 
@@ -997,35 +1340,16 @@ class CaptionApp(QMainWindow):
         self.progress_bar.setRange(0,0)
         self.progress_bar.show()
 
-        prompt = self.prompt_display_text.toPlainText()
-        temp = self.temp_slider.value() / 100.0
-        top_p_val = self.topp_slider.value() / 100.0
-        max_tokens = self.max_tokens_slider.value()
-        log_prompt = self.log_prompt_checkbox.isChecked()
-
-        self.generation_thread = QThread(self)
-        self.generation_worker = GenerationWorker(
-            self.model, self.processor, self.current_pil_image, prompt,
-            temp, top_p_val, max_tokens, log_prompt
-        )
-        self.generation_worker.moveToThread(self.generation_thread)
-
-        self.generation_worker.new_token.connect(self.append_token_to_caption)
-        self.generation_worker.generation_finished.connect(self.on_generation_finished)
-        self.generation_worker.error_occurred.connect(self.on_generation_error)
-
-        self.generation_thread.started.connect(self.generation_worker.run)
-        self.generation_thread.finished.connect(self.generation_worker.deleteLater) 
-        self.generation_thread.finished.connect(self.generation_thread.deleteLater)
-
-        self.generation_thread.start()
+        job = self._make_job(image_path=self.current_image_path, image=self.current_pil_image)
+        self.active_job_id = job.job_id
+        self.inference_service.submit(job)
         self.update_button_states()
 
     def generate_batch_captions_action(self):
         if not self.image_files or not self.is_batch_mode:
             QMessageBox.warning(self, "No Batch", "Load a directory for batch processing.")
             return
-        if self.generation_thread and self.generation_thread.isRunning():
+        if self.is_generating():
             QMessageBox.information(self, "Busy", "Generation process already running.")
             return
 
@@ -1035,93 +1359,263 @@ class CaptionApp(QMainWindow):
         if reply == QMessageBox.No:
             return
 
+        extra_types = self._additional_caption_types()
+        prompts = [self.prompt_display_text.toPlainText()] + [
+            build_prompt_str(
+                caption_type, self.caption_length_combo.currentText(),
+                [cb.text() for cb in self.extra_checkboxes if cb.isChecked()], self.name_input_line.text()
+            )
+            for caption_type in extra_types
+        ]
+        self.batch_extra_slugs = [CAPTION_TYPE_SLUGS[caption_type] for caption_type in extra_types]
+
+        journal = BatchJournal(self.dataset_dir or self.image_files[0].parent, prompts_key(prompts))
+        pending_files = list(self.image_files)
+        try:
+            done = journal.completed()
+        except OSError as e:
+            print(f"Error reading batch journal {journal.path}: {e}")
+            done = {}
+        done_here = [p for p in self.image_files if str(p) in done]
+        if done_here:
+            reply = QMessageBox.question(
+                self, "Resume Batch",
+                f"{len(done_here)} of {len(self.image_files)} images were already captioned with these settings "
+                f"in an earlier run.\n\nYes: resume and skip them.\nNo: start over and caption everything.",
+                QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel, QMessageBox.Yes
+            )
+            if reply == QMessageBox.Cancel:
+                return
+            if reply == QMessageBox.Yes:
+                for img_path in done_here:
+                    captions_by_slug = dict(done[str(img_path)])
+                    for slug, caption in captions_by_slug.items():
+                        if not caption_path_for(img_path, slug or None).exists(): # Crashed before the write landed
+                            self.caption_writer.submit(caption_path_for(img_path, slug or None), caption, block=False)
+                    self.captions_cache[str(img_path)] = captions_by_slug.pop("", "")
+                    if captions_by_slug:
+                        self.extra_captions_cache[str(img_path)] = captions_by_slug
+                pending_files = [p for p in self.image_files if str(p) not in done]
+            else:
+                journal.reset()
+        if not pending_files:
+            QMessageBox.information(self, "Batch Complete", "Every image in this directory is already captioned.")
+            return
+        self.batch_journal = journal
+        self.batch_prompts = prompts
         self.is_generating_batch = True
-        self.batch_generation_queue = list(self.image_files) 
-        self.caption_output_text.clear() 
-        self.update_button_states()
-        self._start_next_batch_generation_item()
-
-    def _start_next_batch_generation_item(self):
-        if not self.batch_generation_queue:
-            self.is_generating_batch = False
-            self.current_batch_item_path = None
-            self.show_status("Batch generation complete.", 5000)
-            QMessageBox.information(self, "Batch Complete", f"All {len(self.image_files)} batch captions processed.")
+        self.caption_output_text.clear()
+        self.batch_start_time = time.perf_counter()
+
+        if self.dedup_checkbox.isChecked() and len(pending_files) > 1:
+            self.show_status(f"Checking {len(pending_files)} images for duplicates...", 0)
+            self.progress_bar.setRange(0, 0)
+            self.progress_bar.show()
+            self.dedup_worker = DedupWorker(pending_files, self)
+            self.dedup_worker.progress.connect(self.on_dedup_progress)
+            self.dedup_worker.finished_dedup.connect(self.on_dedup_finished)
+            self.dedup_worker.start()
             self.update_button_states()
-            if self.image_files: 
-                self._load_image_for_display(self.image_files[0], 0)
-            return
-
-        self.current_batch_item_path = self.batch_generation_queue.pop(0)
-        current_idx_in_full_list = self.image_files.index(self.current_batch_item_path)
-        
-        self.image_path_label.setText( 
-             f"Batch Processing {current_idx_in_full_list + 1}/{len(self.image_files)}: {self.current_batch_item_path.name}"
+        else:
+            self._start_batch(DedupResult(unique=pending_files))
+
+    def on_dedup_progress(self, done_count, total):
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(done_count)
+        self.show_status(f"Hashing same-size images for duplicates: {done_count}/{total}", 0)
+
+    def on_dedup_finished(self, result):
+        self.dedup_worker.wait()
+        self.dedup_worker = None
+        if result.duplicate_count:
+            print(f"Deduplication: {len(result.unique)} unique images, {result.duplicate_count} duplicates "
+                  f"({result.hashed_count} files hashed).")
+        self._start_batch(result)
+
+    def _start_batch(self, dedup: DedupResult):
+        self.batch_duplicates = dedup.duplicates
+        self.batch_generation_queue = dedup.unique
+        self.batch_prefetcher = BatchPrefetcher(
+            self.processor, chunk_paths(self.batch_generation_queue, self.batch_size_slider.value()),
+            self.batch_prompts,
+            depth=max(self.prefetch_depth_slider.value(), BATCH_JOBS_IN_FLIGHT),
+            feature_cache=self._active_feature_cache(), content_hashes=dedup.digests
         )
-        self.show_status(f"Batch: Loading {self.current_batch_item_path.name}...")
-        
-        if not self._load_image_for_display(self.current_batch_item_path, current_idx_in_full_list):
-            error_caption = "[Error: Could not load this image for processing]"
-            self.captions_cache[str(self.current_batch_item_path)] = error_caption
-            self.caption_output_text.setPlainText(error_caption)
-            self.show_status(f"Skipping {self.current_batch_item_path.name} due to load error.", 3000)
-            QTimer.singleShot(100, self._start_next_batch_generation_item)
+        self.progress_bar.setRange(0,0)
+        self.progress_bar.show()
+        self.inference_service.reset_scheduling_clock()
+        self.inference_service.take_scheduling_gaps()
+        self._submit_batch_jobs()
+        self.update_button_states()
+
+    def _submit_batch_jobs(self):
+        """Tops up the service queue; completion is detected when nothing is left in flight."""
+        while len(self.batch_jobs_in_flight) < BATCH_JOBS_IN_FLIGHT:
+            prepared_future = self.batch_prefetcher.next_future() if self.batch_prefetcher else None
+            if prepared_future is None:
+                break
+            job = self._make_job(
+                prepared_future=prepared_future, stream=self.live_preview_checkbox.isChecked(),
+                extra_slugs=list(self.batch_extra_slugs), journal=self.batch_journal
+            )
+            self.batch_jobs_in_flight.append(job.job_id)
+            self.inference_service.submit(job)
+
+        if not self.batch_jobs_in_flight:
+            self._finish_batch()
+
+    def _finish_batch(self):
+        if self.batch_prefetcher:
+            self.batch_prefetcher.close()
+            self.batch_prefetcher = None
+        if self.batch_journal:
+            self.batch_journal.close()
+            self.batch_journal = None
+        num_items = len(self.batch_generation_queue)
+        duplicate_count = sum(len(copies) for copies in self.batch_duplicates.values())
+        self.batch_duplicates = {}
+        self.is_generating_batch = False
+        self.batch_generation_queue = []
+        self.current_batch_item_path = None
+        self.current_batch_chunk = []
+        self.active_job_id = None
+        self.progress_bar.hide()
+
+        elapsed = time.perf_counter() - self.batch_start_time
+        scheduling_gaps = self.inference_service.take_scheduling_gaps()
+        avg_gap_ms = 1000 * sum(scheduling_gaps) / len(scheduling_gaps) if scheduling_gaps else 0.0
+        removed_s = LEGACY_BATCH_ITEM_DELAY_S * num_items - sum(scheduling_gaps)
+        overhead_msg = (f"Scheduling overhead: {avg_gap_ms:.1f} ms per job between {len(scheduling_gaps) + 1} jobs "
+                        f"(the old fixed {int(LEGACY_BATCH_ITEM_DELAY_S * 1000)} ms/item delay would have added "
+                        f"~{removed_s:.1f}s to this batch).")
+        if duplicate_count:
+            overhead_msg += f"\nDeduplication: {duplicate_count} duplicate images reused a caption ({duplicate_count} generations saved)."
+        print(f"Batch of {num_items} images finished in {elapsed:.1f}s. {overhead_msg}")
+
+        self.show_status(f"Batch generation complete in {elapsed:.1f}s.", 5000)
+        QMessageBox.information(self, "Batch Complete",
+                                f"All {num_items} batch captions processed in {elapsed:.1f}s.\n{overhead_msg}")
+        self.update_button_states()
+        if self.image_files: 
+            self._load_image_for_display(self.image_files[0], 0)
+
+    def on_job_started(self, job_id, image_paths, pil_images):
+        if job_id not in self.batch_jobs_in_flight:
+            return # Single-image jobs are already on screen
+        self.active_job_id = job_id
+        self.current_batch_chunk = list(image_paths)
+        self.caption_output_text.clear()
+        if not image_paths:
+            self.show_status("Skipping batch: no image could be loaded.", 3000)
             return
 
-        self.generate_caption_action()
+        first_path = image_paths[0]
+        self.current_batch_item_path = first_path
+        self.current_image_path = first_path
+        self.current_pil_image = pil_images[0]
+        for img_path, pil_image in zip(image_paths, pil_images):
+            self.image_cache.put_pil(img_path, pil_image) # Already decoded by the prefetcher; no second decode here
+        self.display_image(first_path)
+        self._update_gallery_selection_highlight(first_path)
+        first_idx = self.gallery_model.row_of(first_path)
+        if len(image_paths) == 1:
+            self.image_path_label.setText(
+                f"Batch Processing {first_idx + 1}/{len(self.image_files)}: {first_path.name}"
+            )
+            self.show_status(f"Batch: Generating caption for {first_path.name}...", 0)
+        else:
+            last_idx = self.gallery_model.row_of(image_paths[-1])
+            self.image_path_label.setText(
+                f"Batch Processing {first_idx + 1}-{last_idx + 1}/{len(self.image_files)} ({len(image_paths)} images)"
+            )
+            self.show_status(f"Batch: Generating {len(image_paths)} captions in one pass...", 0)
+
+    def on_job_token(self, job_id, token):
+        if job_id == self.active_job_id:
+            self.append_token_to_caption(token)
 
     def append_token_to_caption(self, token):
         cursor = self.caption_output_text.textCursor()
         cursor.movePosition(QTextCursor.End)
         cursor.insertText(token)
         self.caption_output_text.ensureCursorVisible()
-        QApplication.processEvents()
 
-    def on_generation_finished(self, full_caption):
-        current_processed_path = self.current_batch_item_path if self.is_generating_batch else self.current_image_path
-        
-        if current_processed_path:
-            self.captions_cache[str(current_processed_path)] = full_caption
-            if self.is_generating_batch:
-                 self.show_status(f"Caption for {current_processed_path.name} generated.", 3000)
-            else:
-                 self.show_status("Caption generation complete.", 5000)
-        else: 
-            self.show_status("Caption generation finished (unknown image context).", 5000)
+    def on_generation_finished(self, job_id, image_paths, captions, extra_captions):
+        if job_id not in self.batch_jobs_in_flight and job_id != self.active_job_id:
+            return
+        for img_path, caption in zip(image_paths, captions):
+            self.captions_cache[str(img_path)] = caption
+        for image_path_str, captions_by_slug in extra_captions.items():
+            if captions_by_slug:
+                self.extra_captions_cache[image_path_str] = captions_by_slug
+        if self.is_generating_batch:
+            copied = {}
+            for img_path, caption in zip(image_paths, captions):
+                captions_by_slug = extra_captions.get(str(img_path), {})
+                # Byte-identical copies were not queued; they get the same captions.
+                for target_path in [img_path] + self.batch_duplicates.get(img_path, []):
+                    if target_path != img_path:
+                        self.captions_cache[str(target_path)] = caption
+                        if captions_by_slug:
+                            self.extra_captions_cache[str(target_path)] = dict(captions_by_slug)
+                        if is_persistable_caption(caption):
+                            copied[str(target_path)] = {"": caption, **captions_by_slug}
+                    if is_persistable_caption(caption):
+                        self.caption_writer.submit(caption_path_for(target_path), caption, block=False)
+                    for slug, extra_caption in captions_by_slug.items():
+                        if is_persistable_caption(extra_caption):
+                            self.caption_writer.submit(caption_path_for(target_path, slug), extra_caption, block=False)
+            if copied and self.batch_journal:
+                self.batch_journal.record(copied)
+        self.current_batch_chunk = []
 
-        self.progress_bar.hide()
-        
-        if self.generation_thread and self.generation_thread.isRunning():
-            self.generation_thread.quit()
-            self.generation_thread.wait(500) 
-        self.generation_thread = None 
-        self.generation_worker = None
-        
         if self.is_generating_batch:
-            QTimer.singleShot(100, self._start_next_batch_generation_item)
+            if self.current_image_path and str(self.current_image_path) in self.captions_cache:
+                self.caption_output_text.setPlainText(self.captions_cache[str(self.current_image_path)])
+            self.show_status(f"Captions for {len(image_paths)} images generated.", 3000)
         else:
+            self.show_status("Caption generation complete.", 5000)
+
+        if self.is_generating_batch:
+            self._on_batch_job_done(job_id)
+        else:
+            self.progress_bar.hide()
+            self.active_job_id = None
             self.update_button_states()
 
+    def _on_batch_job_done(self, job_id):
+        # The service has already moved on to the next queued job; just keep its queue topped up.
+        if job_id in self.batch_jobs_in_flight:
+            self.batch_jobs_in_flight.remove(job_id)
+        self._submit_batch_jobs()
 
-    def on_generation_error(self, error_message):
+
+    def on_generation_error(self, job_id, error_message):
+        if job_id not in self.batch_jobs_in_flight and job_id != self.active_job_id:
+            return
         error_msg_display = f"Error during generation: {error_message}"
         self.show_status(error_msg_display, 0)
-        self.progress_bar.hide()
-        QMessageBox.critical(self, "Generation Error", f"An error occurred: {error_message}\nCheck console.")
+        if self.is_generating_batch:
+            # Don't block the batch on a modal dialog; the error is recorded as the caption.
+            print(f"Batch job {job_id} failed: {error_message}")
+        else:
+            self.progress_bar.hide()
+            QMessageBox.critical(self, "Generation Error", f"An error occurred: {error_message}\nCheck console.")
 
-        current_processed_path = self.current_batch_item_path if self.is_generating_batch else self.current_image_path
-        if current_processed_path:
-            self.captions_cache[str(current_processed_path)] = f"[Generation Error: {error_message}]"
-        
-        if self.generation_thread and self.generation_thread.isRunning():
-            self.generation_thread.quit()
-            self.generation_thread.wait(500)
-        self.generation_thread = None
-        self.generation_worker = None
+        if self.is_generating_batch:
+            # A job that failed before job_started (e.g. in prefetch) never told us its paths.
+            failed_paths = list(self.current_batch_chunk) if job_id == self.active_job_id else []
+        else:
+            failed_paths = [self.current_image_path] if self.current_image_path else []
+        for failed_path in failed_paths:
+            self.captions_cache[str(failed_path)] = f"[Generation Error: {error_message}]"
+        if job_id == self.active_job_id:
+            self.current_batch_chunk = []
         
         if self.is_generating_batch:
-            QTimer.singleShot(100, self._start_next_batch_generation_item) 
+            self._on_batch_job_done(job_id)
         else:
+            self.active_job_id = None
             self.update_button_states()
 
     def save_current_caption_action(self):
@@ -1133,11 +1627,9 @@ class CaptionApp(QMainWindow):
         image_path_str = str(self.current_image_path)
         self.captions_cache[image_path_str] = caption_text 
 
-        # MODIFIED LINE
-        caption_file_path = self.current_image_path.with_suffix(".txt")
+        caption_file_path = caption_path_for(self.current_image_path)
         try:
-            with open(caption_file_path, "w", encoding="utf-8") as f:
-                f.write(caption_text)
+            write_text_atomic(caption_file_path, caption_text)
             self.show_status(f"Caption saved: {caption_file_path.name}", 3000)
         except Exception as e:
             QMessageBox.critical(self, "Save Error", f"Could not save caption: {e}")
@@ -1153,30 +1645,26 @@ class CaptionApp(QMainWindow):
              return
 
         reply = QMessageBox.question(self, "Confirm Save All",
-                                     f"Save all {len(self.captions_cache)} captions in memory to .txt files?",
+                                     f"Save all {len(self.captions_cache) + sum(map(len, self.extra_captions_cache.values()))} captions in memory to .txt files?",
                                      QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         if reply == QMessageBox.No:
             return
 
-        saved_count = 0
-        error_count = 0
-        for image_path_str, caption_text in self.captions_cache.items():
-            try:
-                image_path = Path(image_path_str)
-                # MODIFIED LINE
-                caption_file_path = image_path.with_suffix(".txt")
-                with open(caption_file_path, "w", encoding="utf-8") as f:
-                    f.write(caption_text)
-                saved_count += 1
-            except Exception as e:
-                print(f"Error saving caption for {image_path_str}: {e}")
-                error_count += 1
-        
-        msg = f"Saved {saved_count} captions."
-        if error_count > 0:
-            msg += f" Failed to save {error_count} (see console)."
-        QMessageBox.information(self, "Batch Save Complete", msg)
-        self.show_status(msg, 5000)
+        sidecars = [(image_path_str, None, caption_text) for image_path_str, caption_text in self.captions_cache.items()]
+        sidecars += [
+            (image_path_str, slug, caption_text)
+            for image_path_str, captions_by_slug in self.extra_captions_cache.items()
+            for slug, caption_text in captions_by_slug.items()
+        ]
+        for image_path_str, slug, caption_text in sidecars:
+            self.caption_writer.submit(caption_path_for(Path(image_path_str), slug), caption_text, block=False)
+        self.show_status(f"Saving {len(sidecars)} captions in the background...", 5000)
+
+    def on_captions_written(self, written_count, errors):
+        if errors:
+            self.show_status(f"Failed to save {len(errors)} captions (see console).", 0)
+        elif not self.is_generating():
+            self.show_status(f"Saved {written_count} captions.", 3000)
 
     def toggle_dark_mode(self):
         self.is_dark_mode_enabled = not self.is_dark_mode_enabled
@@ -1194,34 +1682,47 @@ class CaptionApp(QMainWindow):
         # Re-polish relevant widgets to ensure stylesheet changes apply correctly
         self.image_display_label.style().unpolish(self.image_display_label)
         self.image_display_label.style().polish(self.image_display_label)
-        for thumb in self.thumbnail_widgets:
-            thumb.style().unpolish(thumb)
-            thumb.style().polish(thumb)
-        self.gallery_scroll_area.style().unpolish(self.gallery_scroll_area) # And its viewport
-        self.gallery_scroll_area.style().polish(self.gallery_scroll_area)
-        if self.gallery_scroll_area.widget():
-            self.gallery_scroll_area.widget().style().unpolish(self.gallery_scroll_area.widget())
-            self.gallery_scroll_area.widget().style().polish(self.gallery_scroll_area.widget())
+        self.gallery_view.style().unpolish(self.gallery_view)
+        self.gallery_view.style().polish(self.gallery_view)
+        self.gallery_view.viewport().update()
 
 
     def closeEvent(self, event):
-        if self.generation_thread and self.generation_thread.isRunning():
+        if self.model_load_worker:
+            self.show_status("Waiting for the model load to finish before exit...", 0)
+            self.model_load_worker.blockSignals(True) # Do not start the inference service on a closing window
+            self.model_load_worker.wait() # from_pretrained cannot be interrupted
+        self._stop_directory_scan()
+        self.gallery_model.shutdown()
+        if self.dedup_worker:
+            self.dedup_worker.wait() # Hashing cannot be interrupted; a running QThread must not be destroyed
+        if self.batch_prefetcher:
+            self.batch_prefetcher.close()
+            self.batch_prefetcher = None
+        if self.is_generating():
             self.show_status("Stopping generation before exit...", 0)
-            if self.generation_worker:
-                self.generation_worker.stop()
-            self.generation_thread.quit()
-            if not self.generation_thread.wait(2000):
-                print("Generation thread did not stop gracefully, terminating.")
-                self.generation_thread.terminate()
-                self.generation_thread.wait()
+        self._stop_inference_service()
+        if self.batch_journal:
+            self.batch_journal.close() # Everything finished so far is already fsynced; Resume picks up from there
+        self.show_status("Writing pending captions...", 0)
+        self.caption_writer.close() # Flushes everything still queued
+        if self.feature_cache:
+            self.feature_cache.close()
+        self.metrics_timer.stop()
+        self.refresh_metrics() # Final Prometheus snapshot
+        METRICS.stop_trace()
         super().closeEvent(event)
 
 
-if __name__ == "__main__":
+def main(default_precision: str = DEFAULT_PRECISION) -> int:
     QApplication.setAttribute(Qt.AA_EnableHighDpiScaling, True)
     QApplication.setAttribute(Qt.AA_UseHighDpiPixmaps, True)
     app = QApplication(sys.argv)
 
-    window = CaptionApp()
+    window = CaptionApp(default_precision)
     window.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    return app.exec_()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
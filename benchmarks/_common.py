@@ -0,0 +1,43 @@
+# Helpers shared by the benchmark scripts: synthetic test images, the git revision a result belongs to and
+# peak memory. Importing this module also puts the repository root on sys.path.
+import subprocess
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+
+from joycaption_metrics import peak_memory_bytes
+
+
+def make_images(directory: Path, count: int, size: int) -> List[Path]:
+    """`count` solid-colour size x size PNGs, a different colour each."""
+    from PIL import Image
+    paths = []
+    for idx in range(count):
+        path = directory / f"img_{idx:05d}.png"
+        Image.new("RGB", (size, size), ((idx * 37) % 256, (idx * 91) % 256, (idx * 13) % 256)).save(path)
+        paths.append(path)
+    return paths
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty", "--tags"], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def peak_memory_mb() -> dict:
+    """peak_rss_mb (None on Windows), plus peak_cuda_mb when CUDA is available."""
+    peak = peak_memory_bytes()
+
+    def mb(value: Optional[int]) -> Optional[float]:
+        return None if value is None else round(value / 1024 ** 2, 1)
+
+    result = {"peak_rss_mb": mb(peak["rss"])}
+    if peak["cuda"] is not None:
+        result["peak_cuda_mb"] = mb(peak["cuda"])
+    return result
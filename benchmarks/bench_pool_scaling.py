@@ -0,0 +1,61 @@
+# Scaling efficiency of the multi-replica pool on a CPU-only machine, using the tiny stand-in model.
+#   python benchmarks/bench_pool_scaling.py --replicas 1 2 4 --images 64
+# Prints one JSON object: images/s per replica count and efficiency relative to a single replica.
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from _common import make_images
+from joycaption_core import MODEL_PATH, build_prompt_str, chunk_paths
+from joycaption_pool import CaptionPool, plan_replicas
+
+
+def run(num_replicas: int, paths, prompts, args) -> dict:
+    specs = plan_replicas(num_replicas, use_cuda=False)
+    model_config = {"model_path": args.model_path, "tiny": True}
+    gen_config = {"temperature": 0.6, "top_p": 0.9, "max_new_tokens": args.max_tokens}
+    with CaptionPool(specs, model_config, gen_config) as pool:
+        pool.wait_ready()
+        # One warm-up batch per replica so one-off costs (first kernels, allocator) are not measured.
+        for _ in specs:
+            pool.submit(paths[:args.batch_size], prompts)
+        list(pool.results())
+
+        start = time.perf_counter()
+        captioned = sum(len(result.paths) for result in pool.map_batches(chunk_paths(paths, args.batch_size), prompts))
+        elapsed = time.perf_counter() - start
+    return {"replicas": len(specs), "threads_per_replica": len(specs[0].cpu_cores or []),
+            "images": captioned, "seconds": round(elapsed, 3), "images_per_s": round(captioned / elapsed, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-replica pool scaling on CPU with the tiny stand-in model.")
+    parser.add_argument("--replicas", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=2)
+    parser.add_argument("--max-tokens", type=int, default=32)
+    parser.add_argument("--model-path", default=MODEL_PATH, help="Only the processor (tokenizer + chat template) is loaded.")
+    args = parser.parse_args()
+
+    prompts = [build_prompt_str("Descriptive", "short", [], "")]
+    runs = []
+    with tempfile.TemporaryDirectory(prefix="joycaption_bench_") as tmp:
+        paths = make_images(Path(tmp), args.images, 96)
+        for num_replicas in args.replicas:
+            runs.append(run(num_replicas, paths, prompts, args))
+            print(f"{runs[-1]['replicas']} replicas: {runs[-1]['images_per_s']} images/s", file=sys.stderr)
+
+    baseline = runs[0]["images_per_s"] / runs[0]["replicas"]
+    for entry in runs:
+        entry["scaling_efficiency"] = round(entry["images_per_s"] / (baseline * entry["replicas"]), 3)
+    print(json.dumps({"cpu_count": len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count(),
+                      "images": args.images, "batch_size": args.batch_size, "max_new_tokens": args.max_tokens,
+                      "runs": runs}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
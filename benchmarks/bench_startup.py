@@ -0,0 +1,105 @@
+# Time-to-first-window of the GUI, tracked across releases.
+#   python benchmarks/bench_startup.py                                  # 5 cold-process runs, printed
+#   python benchmarks/bench_startup.py --output startup_history.jsonl   # also append, with the change vs. the last entry
+# Each run is a fresh interpreter: it imports the GUI script, builds CaptionApp, shows it and stops at the
+# first event-loop iteration. Also reports whether torch / transformers were imported on the way (they must not be).
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from _common import REPO_DIR, git_revision
+
+HEAVY_MODULES = ("torch", "transformers", "liger_kernel", "bitsandbytes")
+
+CHILD_CODE = r"""
+import importlib, json, sys, time
+t_spawn, repo_dir, module_name = float(sys.argv[1]), sys.argv[2], sys.argv[3]
+sys.path.insert(0, repo_dir)
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import QApplication
+t_import_start = time.time()
+gui = importlib.import_module(module_name)
+t_imported = time.time()
+app = QApplication(sys.argv[:1])
+window = gui.CaptionApp()
+window.show()
+
+def first_iteration():
+    t_window = time.time()
+    print(json.dumps({
+        "time_to_window_s": t_window - t_spawn,
+        "import_s": t_imported - t_import_start,
+        "window_init_s": t_window - t_imported,
+        "heavy_modules": [m for m in %r if m in sys.modules],
+    }))
+    window.close()
+    app.quit()
+
+QTimer.singleShot(0, first_iteration)
+app.exec_()
+""" % (HEAVY_MODULES,)
+
+
+def run_once(module_name: str, env: dict) -> dict:
+    result = subprocess.run([sys.executable, "-c", CHILD_CODE, repr(time.time()), str(REPO_DIR), module_name],
+                            capture_output=True, text=True, env=env, cwd=REPO_DIR)
+    if result.returncode != 0:
+        raise RuntimeError(f"Startup run failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure GUI time-to-first-window.")
+    parser.add_argument("--script", default="Run_GUI", help="GUI module to start (Run_GUI or Run_gui_4bit).")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", type=Path, default=None,
+                        help="Append the result as one JSON line to this history file and report the change vs. its last entry.")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if not env.get("DISPLAY") and not env.get("WAYLAND_DISPLAY") and sys.platform.startswith("linux"):
+        env.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+    runs = [run_once(args.script, env) for _ in range(args.runs)]
+    window_times = [r["time_to_window_s"] for r in runs]
+    entry = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "script": args.script,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "runs": args.runs,
+        "time_to_window_s": {"median": round(statistics.median(window_times), 3),
+                             "min": round(min(window_times), 3), "max": round(max(window_times), 3)},
+        "import_s_median": round(statistics.median(r["import_s"] for r in runs), 3),
+        "heavy_modules": sorted({m for r in runs for m in r["heavy_modules"]}),
+    }
+
+    previous = None
+    if args.output and args.output.exists():
+        lines = [line for line in args.output.read_text(encoding="utf-8").splitlines() if line.strip()]
+        for line in reversed(lines):
+            candidate = json.loads(line)
+            if candidate.get("script") == args.script:
+                previous = candidate
+                break
+    if previous:
+        before, now = previous["time_to_window_s"]["median"], entry["time_to_window_s"]["median"]
+        entry["change_vs_previous"] = {"revision": previous["revision"], "delta_s": round(now - before, 3)}
+
+    print(json.dumps(entry, indent=2))
+    if entry["heavy_modules"]:
+        print(f"Warning: startup imported {', '.join(entry['heavy_modules'])}.", file=sys.stderr)
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+if __name__ == "__main__":
+    main()
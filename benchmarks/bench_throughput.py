@@ -0,0 +1,228 @@
+# End-to-end captioning throughput, runnable on CPU-only CI with the tiny stand-in model.
+#   python benchmarks/bench_throughput.py                            # tiny model, core pipeline (what Run_CLI.py runs)
+#   python benchmarks/bench_throughput.py --path service             # the GUI's InferenceService + batch job scheduling
+#   python benchmarks/bench_throughput.py --real --precision nf4     # the real checkpoint
+#   python benchmarks/bench_throughput.py --output results.jsonl     # also append the result as one JSON line
+# Covers prompt building, decode + preprocessing (BatchPrefetcher), generation and sidecar writes. Reports images/s,
+# generated tokens/s, time to first token, p50/p95/p99 per-image latency and peak memory as one JSON object.
+# Latency of an image = time from the pipeline asking for its batch (the previous batch finishing) to its caption
+# being written; TTFT uses the same starting point.
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from _common import git_revision, make_images, peak_memory_mb
+from joycaption_core import (
+    CAPTION_LENGTH_CHOICES, CAPTION_TYPE_MAP, MODEL_PATH, PRECISION_AUTO, PRECISION_CHOICES,
+    BatchPrefetcher, PrefixKVCache, build_prompt_str, caption_path_for, chunk_paths, generate_from_inputs, load_model,
+)
+from joycaption_writer import write_text_atomic
+
+_qt_app = None # --path service: one QCoreApplication for the warm-up and the measured run
+
+
+class TimingStreamer:
+    """generate() streamer that only timestamps decode steps and counts non-padding tokens; any batch size."""
+
+    def __init__(self, pad_token_id: int):
+        self.pad_token_id = pad_token_id
+        self.prompt_seen = False
+        self.first_token_time: Optional[float] = None
+        self.tokens = 0
+
+    def put(self, value):
+        if not self.prompt_seen: # generate() passes the prompt first
+            self.prompt_seen = True
+            return
+        if self.first_token_time is None:
+            self.first_token_time = time.perf_counter()
+        self.tokens += int((value != self.pad_token_id).sum())
+
+    def end(self):
+        pass
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Linear interpolation between closest ranks (numpy's default)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q / 100
+    lower = int(pos)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (pos - lower)
+
+
+def run_core(model, processor, paths: List[Path], prompt: str, args) -> dict:
+    """BatchPrefetcher -> generate_from_inputs -> sidecar, as in Run_CLI.py."""
+    prefix_cache = PrefixKVCache(model)
+    prefetcher = BatchPrefetcher(processor, chunk_paths(paths, args.batch_size), prompt,
+                                 depth=args.prefetch_depth, num_workers=args.prefetch_workers)
+    latencies, ttfts, tokens, captioned = [], [], 0, 0
+    start = requested = time.perf_counter()
+    for prepared in prefetcher:
+        streamer = TimingStreamer(processor.tokenizer.pad_token_id)
+        captions = generate_from_inputs(model, processor, prepared.inputs, args.temperature, args.top_p, args.max_tokens,
+                                        streamer=streamer, prefix_cache=prefix_cache)
+        for img_path, caption in zip(prepared.paths, captions):
+            write_text_atomic(caption_path_for(img_path), caption)
+        finished = time.perf_counter()
+        latencies += [finished - requested] * len(prepared.paths)
+        if streamer.first_token_time is not None:
+            ttfts += [streamer.first_token_time - requested] * len(prepared.paths)
+        tokens += streamer.tokens
+        captioned += len(prepared.paths)
+        requested = finished
+    elapsed = time.perf_counter() - start
+    prefetcher.close()
+    return {"images": captioned, "tokens": tokens, "seconds": elapsed, "latencies": latencies, "ttfts": ttfts}
+
+
+def run_service(model, processor, paths: List[Path], prompt: str, args) -> dict:
+    """Run_GUI's InferenceService on its own QThread, fed like CaptionApp feeds batch jobs (no window)."""
+    from PyQt5.QtCore import QCoreApplication, QEventLoop, QThread
+    from Run_GUI import BATCH_JOBS_IN_FLIGHT, CaptionJob, InferenceService
+
+    global _qt_app
+    _qt_app = QCoreApplication.instance() or QCoreApplication(sys.argv[:1])
+    thread = QThread()
+    service = InferenceService(model, processor)
+    service.moveToThread(thread)
+    prefetcher = BatchPrefetcher(processor, chunk_paths(paths, args.batch_size), [prompt],
+                                 depth=max(args.prefetch_depth, BATCH_JOBS_IN_FLIGHT), num_workers=args.prefetch_workers)
+    loop = QEventLoop()
+    in_flight: List[int] = []
+    first_token_times = {}
+    stats = {"latencies": [], "ttfts": [], "tokens": 0, "images": 0, "next_job_id": 0, "requested": 0.0, "error": None}
+
+    def submit_jobs():
+        while len(in_flight) < BATCH_JOBS_IN_FLIGHT:
+            prepared_future = prefetcher.next_future()
+            if prepared_future is None:
+                break
+            stats["next_job_id"] += 1
+            job = CaptionJob(job_id=stats["next_job_id"], prompt=prompt, temperature=args.temperature, top_p=args.top_p,
+                             max_new_tokens=args.max_tokens, log_prompt=False, prepared_future=prepared_future,
+                             stream=args.batch_size == 1) # The GUI only streams single-image jobs
+            in_flight.append(job.job_id)
+            service.submit(job)
+        if not in_flight:
+            loop.quit()
+
+    def on_token(job_id, text):
+        first_token_times.setdefault(job_id, time.perf_counter())
+
+    def on_finished(job_id, out_paths, out_captions, extra_captions):
+        for img_path, caption in zip(out_paths, out_captions):
+            write_text_atomic(caption_path_for(img_path), caption)
+            stats["tokens"] += len(processor.tokenizer.encode(caption, add_special_tokens=False))
+        finished = time.perf_counter()
+        stats["latencies"] += [finished - stats["requested"]] * len(out_paths)
+        if job_id in first_token_times:
+            stats["ttfts"] += [first_token_times.pop(job_id) - stats["requested"]] * len(out_paths)
+        stats["images"] += len(out_paths)
+        stats["requested"] = finished
+        in_flight.remove(job_id)
+        submit_jobs()
+
+    def on_error(job_id, message):
+        stats["error"] = message
+        loop.quit()
+
+    service.new_token.connect(on_token)
+    service.job_finished.connect(on_finished)
+    service.error_occurred.connect(on_error)
+    thread.started.connect(service.run)
+    thread.start()
+
+    start = stats["requested"] = time.perf_counter()
+    submit_jobs()
+    if in_flight:
+        loop.exec_()
+    elapsed = time.perf_counter() - start
+    service.shutdown()
+    thread.wait()
+    prefetcher.close()
+    if stats["error"]:
+        raise RuntimeError(f"Generation failed: {stats['error']}")
+    return {"images": stats["images"], "tokens": stats["tokens"], "seconds": elapsed,
+            "latencies": stats["latencies"], "ttfts": stats["ttfts"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end captioning throughput (tiny stand-in model by default).")
+    parser.add_argument("--path", choices=["core", "service"], default="core",
+                        help="core: BatchPrefetcher + generate_from_inputs (Run_CLI.py). service: Run_GUI's InferenceService.")
+    parser.add_argument("--real", action="store_true", help="Benchmark the real checkpoint instead of the tiny stand-in.")
+    parser.add_argument("--precision", default=PRECISION_AUTO, choices=PRECISION_CHOICES, help="With --real.")
+    parser.add_argument("--model-path", default=MODEL_PATH, help="Without --real only the processor is loaded from it.")
+    parser.add_argument("--images", type=int, default=32)
+    parser.add_argument("--image-size", type=int, default=512, help="Side of the generated test images (decode/resize cost).")
+    parser.add_argument("--warmup-images", type=int, default=4, help="Captioned first and not measured.")
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--prefetch-depth", type=int, default=2)
+    parser.add_argument("--prefetch-workers", type=int, default=2)
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--temperature", type=float, default=0.0, help="0 = greedy, so runs are comparable.")
+    parser.add_argument("--top-p", type=float, default=0.9)
+    parser.add_argument("--caption-type", default="Descriptive", choices=list(CAPTION_TYPE_MAP.keys()))
+    parser.add_argument("--caption-length", default="long", choices=CAPTION_LENGTH_CHOICES)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None, help="Append the result as one JSON line to this file.")
+    args = parser.parse_args()
+
+    import torch
+    torch.manual_seed(args.seed)
+    load_start = time.perf_counter()
+    if args.real:
+        processor, model, load_message = load_model(args.model_path, precision=args.precision)
+    else:
+        from joycaption_tiny import build_tiny_model
+        processor, model, load_message = build_tiny_model(args.model_path, seed=args.seed)
+    load_seconds = time.perf_counter() - load_start
+    print(load_message, file=sys.stderr)
+
+    prompt = build_prompt_str(args.caption_type, args.caption_length, [], "")
+    run = run_service if args.path == "service" else run_core
+    with tempfile.TemporaryDirectory(prefix="joycaption_bench_") as tmp:
+        paths = make_images(Path(tmp), args.warmup_images + args.images, args.image_size)
+        if args.warmup_images:
+            run(model, processor, paths[:args.warmup_images], prompt, args)
+        result = run(model, processor, paths[args.warmup_images:], prompt, args)
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return None if value is None else round(value * 1000, 1)
+
+    latencies, ttfts = result["latencies"], result["ttfts"]
+    entry = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "platform": platform.platform(),
+        "device": str(model.device),
+        "model": load_message,
+        "config": {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()},
+        "load_s": round(load_seconds, 2),
+        "images": result["images"],
+        "seconds": round(result["seconds"], 3),
+        "images_per_s": round(result["images"] / result["seconds"], 3),
+        "tokens_per_s": round(result["tokens"] / result["seconds"], 1),
+        "ttft_ms": {"p50": ms(percentile(ttfts, 50)), "p95": ms(percentile(ttfts, 95))},
+        "latency_ms": {"p50": ms(percentile(latencies, 50)), "p95": ms(percentile(latencies, 95)),
+                       "p99": ms(percentile(latencies, 99))},
+        **peak_memory_mb(),
+    }
+    print(json.dumps(entry, indent=2))
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+# File content hashing shared by the dedup pre-pass and the vision feature cache, so an image hashed by one
+# is never hashed again by the other. Equality is all that matters, so the fastest available hash is used.
+import hashlib
+from pathlib import Path
+
+# BLAKE3 > xxh3-128 > BLAKE2b (stdlib).
+try:
+    import blake3
+    HASH_NAME = "blake3"
+    def _new_hasher():
+        return blake3.blake3()
+except ImportError:
+    try:
+        import xxhash
+        HASH_NAME = "xxh3_128"
+        def _new_hasher():
+            return xxhash.xxh3_128()
+    except ImportError:
+        HASH_NAME = "blake2b"
+        def _new_hasher():
+            return hashlib.blake2b(digest_size=20)
+
+HASH_BUFFER_BYTES = 1024 * 1024
+
+
+def hash_file_contents(path: Path) -> str:
+    """Hex digest of the file's bytes; renames and copies hash the same."""
+    hasher = _new_hasher()
+    buffer = bytearray(HASH_BUFFER_BYTES)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            hasher.update(view[:n])
+    return hasher.hexdigest()
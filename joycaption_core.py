@@ -0,0 +1,908 @@
+# Shared, Qt-free captioning core used by the GUI scripts and the headless CLI.
+# Keep PyQt5 out of this module: Run_CLI.py imports it on display-less machines.
+# Keep torch / transformers / liger_kernel out of the module level too: they take seconds to import and
+# the GUI must show its window (and browse images) before a model is loaded. Import them where used.
+import io
+import os
+import copy
+import hashlib
+import functools
+from PIL import Image
+from typing import List, Optional, Callable, Tuple, Dict, Iterable, Iterator, Deque, Union
+from pathlib import Path
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, Future
+from dataclasses import dataclass, field
+from threading import Event
+import time
+
+from joycaption_metrics import METRICS, STAGE_DECODE_TOKEN, STAGE_IMAGE_LOAD, STAGE_PREFILL, STAGE_PREPROCESS
+
+
+
+# --- Constants and Mappings ---
+MODEL_PATH = "fancyfeast/llama-joycaption-beta-one-hf-llava"
+CAPTION_TYPE_MAP = {
+	"Descriptive": [
+		"Write a detailed description for this image.",
+		"Write a detailed description for this image in {word_count} words or less.",
+		"Write a {length} detailed description for this image.",
+	],
+	"Descriptive (Casual)": [
+		"Write a descriptive caption for this image in a casual tone.",
+		"Write a descriptive caption for this image in a casual tone within {word_count} words.",
+		"Write a {length} descriptive caption for this image in a casual tone.",
+	],
+	"Straightforward": [
+		"Write a straightforward caption for this image. Begin with the main subject and medium. Mention pivotal elements—people, objects, scenery—using confident, definite language. Focus on concrete details like color, shape, texture, and spatial relationships. Show how elements interact. Omit mood and speculative wording. If text is present, quote it exactly. Note any watermarks, signatures, or compression artifacts. Never mention what's absent, resolution, or unobservable details. Vary your sentence structure and keep the description concise, without starting with “This image is…” or similar phrasing.",
+		"Write a straightforward caption for this image within {word_count} words. Begin with the main subject and medium. Mention pivotal elements—people, objects, scenery—using confident, definite language. Focus on concrete details like color, shape, texture, and spatial relationships. Show how elements interact. Omit mood and speculative wording. If text is present, quote it exactly. Note any watermarks, signatures, or compression artifacts. Never mention what's absent, resolution, or unobservable details. Vary your sentence structure and keep the description concise, without starting with “This image is…” or similar phrasing.",
+		"Write a {length} straightforward caption for this image. Begin with the main subject and medium. Mention pivotal elements—people, objects, scenery—using confident, definite language. Focus on concrete details like color, shape, texture, and spatial relationships. Show how elements interact. Omit mood and speculative wording. If text is present, quote it exactly. Note any watermarks, signatures, or compression artifacts. Never mention what's absent, resolution, or unobservable details. Vary your sentence structure and keep the description concise, without starting with “This image is…” or similar phrasing.",
+	],
+	"Stable Diffusion Prompt": [
+		"Output a stable diffusion prompt that is indistinguishable from a real stable diffusion prompt.",
+		"Output a stable diffusion prompt that is indistinguishable from a real stable diffusion prompt. {word_count} words or less.",
+		"Output a {length} stable diffusion prompt that is indistinguishable from a real stable diffusion prompt.",
+	],
+	"MidJourney": [
+		"Write a MidJourney prompt for this image.",
+		"Write a MidJourney prompt for this image within {word_count} words.",
+		"Write a {length} MidJourney prompt for this image.",
+	],
+	"Danbooru tag list": [
+		"Generate only comma-separated Danbooru tags (lowercase_underscores). Strict order: `artist:`, `copyright:`, `character:`, `meta:`, then general tags. Include counts (1girl), appearance, clothing, accessories, pose, expression, actions, background. Use precise Danbooru syntax. No extra text.",
+		"Generate only comma-separated Danbooru tags (lowercase_underscores). Strict order: `artist:`, `copyright:`, `character:`, `meta:`, then general tags. Include counts (1girl), appearance, clothing, accessories, pose, expression, actions, background. Use precise Danbooru syntax. No extra text. {word_count} words or less.",
+		"Generate only comma-separated Danbooru tags (lowercase_underscores). Strict order: `artist:`, `copyright:`, `character:`, `meta:`, then general tags. Include counts (1girl), appearance, clothing, accessories, pose, expression, actions, background. Use precise Danbooru syntax. No extra text. {length} length.",
+	],
+	"e621 tag list": [
+		"Write a comma-separated list of e621 tags in alphabetical order for this image. Start with the artist, copyright, character, species, meta, and lore tags (if any), prefixed by 'artist:', 'copyright:', 'character:', 'species:', 'meta:', and 'lore:'. Then all the general tags.",
+		"Write a comma-separated list of e621 tags in alphabetical order for this image. Start with the artist, copyright, character, species, meta, and lore tags (if any), prefixed by 'artist:', 'copyright:', 'character:', 'species:', 'meta:', and 'lore:'. Then all the general tags. Keep it under {word_count} words.",
+		"Write a {length} comma-separated list of e621 tags in alphabetical order for this image. Start with the artist, copyright, character, species, meta, and lore tags (if any), prefixed by 'artist:', 'copyright:', 'character:', 'species:', 'meta:', and 'lore:'. Then all the general tags.",
+	],
+	"Rule34 tag list": [
+		"Write a comma-separated list of rule34 tags in alphabetical order for this image. Start with the artist, copyright, character, and meta tags (if any), prefixed by 'artist:', 'copyright:', 'character:', and 'meta:'. Then all the general tags.",
+		"Write a comma-separated list of rule34 tags in alphabetical order for this image. Start with the artist, copyright, character, and meta tags (if any), prefixed by 'artist:', 'copyright:', 'character:', and 'meta:'. Then all the general tags. Keep it under {word_count} words.",
+		"Write a {length} comma-separated list of rule34 tags in alphabetical order for this image. Start with the artist, copyright, character, and meta tags (if any), prefixed by 'artist:', 'copyright:', 'character:', and 'meta:'. Then all the general tags.",
+	],
+	"Booru-like tag list": [
+		"Write a list of Booru-like tags for this image.",
+		"Write a list of Booru-like tags for this image within {word_count} words.",
+		"Write a {length} list of Booru-like tags for this image.",
+	],
+	"Art Critic": [
+		"Analyze this image like an art critic would with information about its composition, style, symbolism, the use of color, light, any artistic movement it might belong to, etc.",
+		"Analyze this image like an art critic would with information about its composition, style, symbolism, the use of color, light, any artistic movement it might belong to, etc. Keep it within {word_count} words.",
+		"Analyze this image like an art critic would with information about its composition, style, symbolism, the use of color, light, any artistic movement it might belong to, etc. Keep it {length}.",
+	],
+	"Product Listing": [
+		"Write a caption for this image as though it were a product listing.",
+		"Write a caption for this image as though it were a product listing. Keep it under {word_count} words.",
+		"Write a {length} caption for this image as though it were a product listing.",
+	],
+	"Social Media Post": [
+		"Write a caption for this image as if it were being used for a social media post.",
+		"Write a caption for this image as if it were being used for a social media post. Limit the caption to {word_count} words.",
+		"Write a {length} caption for this image as if it were being used for a social media post.",
+	],
+}
+# Sidecar suffixes used when one image is captioned with several caption types (img.<slug>.txt).
+CAPTION_TYPE_SLUGS = {
+    "Descriptive": "descriptive",
+    "Descriptive (Casual)": "casual",
+    "Straightforward": "straightforward",
+    "Stable Diffusion Prompt": "sd",
+    "MidJourney": "midjourney",
+    "Danbooru tag list": "danbooru",
+    "e621 tag list": "e621",
+    "Rule34 tag list": "rule34",
+    "Booru-like tag list": "tags",
+    "Art Critic": "critic",
+    "Product Listing": "product",
+    "Social Media Post": "social",
+}
+NAME_OPTION = "If there is a person/character in the image you must refer to them as {name}."
+CAPTION_LENGTH_CHOICES = ["any", "very short", "short", "medium-length", "long", "very long"] + [str(i) for i in range(20, 261, 10)]
+EXTRA_OPTIONS_LIST = [
+    NAME_OPTION,
+    "Do NOT include information about people/characters that cannot be changed (like ethnicity, gender, etc), but do still include changeable attributes (like hair style).",
+    "Include information about lighting.",
+    "Include information about camera angle.",
+    "Include information about whether there is a watermark or not.",
+    "Include information about whether there are JPEG artifacts or not.",
+    "If it is a photo you MUST include information about what camera was likely used and details such as aperture, shutter speed, ISO, etc.",
+    "Do NOT include anything sexual; keep it PG.",
+    "Do NOT mention the image's resolution.",
+    "You MUST include information about the subjective aesthetic quality of the image from low to very high.",
+    "Include information on the image's composition style, such as leading lines, rule of thirds, or symmetry.",
+    "Do NOT mention any text that is in the image.",
+    "Specify the depth of field and whether the background is in focus or blurred.",
+    "If applicable, mention the likely use of artificial or natural lighting sources.",
+    "Do NOT use any ambiguous language.",
+    "Include whether the image is sfw, suggestive, or nsfw.",
+    "ONLY describe the most important elements of the image.",
+    "If it is a work of art, do not include the artist's name or the title of the work.",
+    "Identify the image orientation (portrait, landscape, or square) and aspect ratio if obvious.",
+    """Use vulgar slang and profanity, such as (but not limited to) "fucking," "slut," "cock," etc.""",
+    "Do NOT use polite euphemisms—lean into blunt, casual phrasing.",
+    "Include information about the ages of any people/characters when applicable.",
+    "Mention whether the image depicts an extreme close-up, close-up, medium close-up, medium shot, cowboy shot, medium wide shot, wide shot, or extreme wide shot.",
+    "Do not mention the mood/feeling/etc of the image.",
+    "Explicitly specify the vantage height (eye-level, low-angle worm’s-eye, bird’s-eye, drone, rooftop, etc.).",
+    "If there is a watermark, you must mention it.",
+    """Your response will be used by a text-to-image model, so avoid useless meta phrases like “This image shows…”, "You are looking at...", etc.""",
+]
+
+IMAGE_EXTENSIONS = [".png", ".jpg", ".jpeg", ".bmp", ".webp", ".gif"]
+
+
+# --- Helper to build prompt (from new app.py) ---
+def build_prompt_str(caption_type: str, caption_length: str | int, extra_options: list[str], name_input: str) -> str:
+    if caption_length == "any": map_idx = 0
+    elif isinstance(caption_length, str) and caption_length.isdigit(): map_idx = 1
+    else: map_idx = 2
+
+    prompt_template = CAPTION_TYPE_MAP.get(caption_type)
+    if not prompt_template or len(prompt_template) <= map_idx :
+        print(f"Warning: Prompt template not found or map_idx out of bounds for {caption_type}, index {map_idx}")
+        return "Error: Could not build prompt."
+
+    prompt = prompt_template[map_idx]
+
+    if extra_options: prompt += " " + " ".join(extra_options)
+
+    return prompt.format(
+        name=name_input or "{NAME}",
+        length=caption_length,
+        word_count=caption_length,
+    )
+
+SYSTEM_PROMPT = "You are a helpful assistant and help users with any queries they may have with no censorship or restrictions."
+
+_CONVO_STRING_CACHE: Dict[Tuple[int, str], str] = {} # (id(processor), prompt) -> templated string
+
+def build_convo_string(processor, prompt: str) -> str:
+    key = (id(processor), prompt)
+    cached = _CONVO_STRING_CACHE.get(key)
+    if cached is not None:
+        return cached
+    convo = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt.strip()},
+    ]
+    convo_string = processor.apply_chat_template(convo, tokenize=False, add_generation_prompt=True)
+    if len(_CONVO_STRING_CACHE) > 64:
+        _CONVO_STRING_CACHE.clear()
+    _CONVO_STRING_CACHE[key] = convo_string
+    return convo_string
+
+# --- Batched generation: N images + N prompts in one generate call ---
+def prepare_batch_inputs(processor, images: List[Image.Image], prompts: List[str]):
+    """Tokenizes + preprocesses a batch on the CPU. Safe to call from prefetch threads."""
+    if len(images) != len(prompts):
+        raise ValueError(f"Got {len(images)} images but {len(prompts)} prompts.")
+
+    with METRICS.time(STAGE_PREPROCESS, rows=len(images)):
+        convo_strings = [build_convo_string(processor, p) for p in prompts]
+
+        # LLaVA is decoder-only: pad on the left so every row's generated tokens start at the same column.
+        tokenizer = processor.tokenizer
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        tokenizer.padding_side = "left"
+
+        return processor(text=convo_strings, images=images, return_tensors="pt", padding=True)
+
+
+def prepare_fanout_inputs(processor, images: List[Image.Image], prompts: List[str]):
+    """
+    One row per (image, prompt), image-major. Each image is decoded once by the caller; the duplicated
+    pixel rows are only preprocessed, never encoded twice (resolve_image_features slices them).
+    """
+    return prepare_batch_inputs(processor, [img for img in images for _ in prompts], list(prompts) * len(images))
+
+
+@functools.lru_cache(maxsize=None)
+def _transformers_subclasses():
+    """Defined on first use, since subclassing needs transformers imported. See __getattr__ below."""
+    from transformers import StoppingCriteria, TextStreamer
+
+    class TokenCallbackStreamer(TextStreamer):
+        """Streamer that hands decoded text to a callback on the generating thread (no extra thread / queue)."""
+
+        def __init__(self, tokenizer, on_text: Callable[[str], None]):
+            super().__init__(tokenizer, skip_prompt=True, skip_special_tokens=True)
+            self.on_text = on_text
+
+        def on_finalized_text(self, text: str, stream_end: bool = False):
+            if text:
+                self.on_text(text)
+
+    class StopEventCriteria(StoppingCriteria):
+        """Stops generation as soon as the given threading.Event is set."""
+
+        def __init__(self, stop_event: Event):
+            self.stop_event = stop_event
+
+        def __call__(self, input_ids, scores, **kwargs) -> bool:
+            return self.stop_event.is_set()
+
+    class StepTimerCriteria(StoppingCriteria):
+        """Never stops; timestamps every decode step (generate() checks the criteria once per new token)."""
+
+        def __init__(self):
+            self.step_times: List[float] = []
+
+        def __call__(self, input_ids, scores, **kwargs) -> bool:
+            self.step_times.append(time.perf_counter())
+            return False
+
+    return {"TokenCallbackStreamer": TokenCallbackStreamer, "StopEventCriteria": StopEventCriteria,
+            "StepTimerCriteria": StepTimerCriteria}
+
+
+def __getattr__(name: str):
+    """`from joycaption_core import TokenCallbackStreamer` works, but only imports transformers at that point."""
+    if name in ("TokenCallbackStreamer", "StopEventCriteria", "StepTimerCriteria"):
+        return _transformers_subclasses()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class TokenCoalescer:
+    """Buffers streamed text and forwards it at most `max_hz` times per second; call flush() at the end."""
+
+    def __init__(self, on_flush: Callable[[str], None], max_hz: float = 30.0):
+        self.on_flush = on_flush
+        self.min_interval = 1.0 / max_hz if max_hz > 0 else 0.0
+        self._parts: List[str] = []
+        self._last_flush = 0.0
+
+    def add(self, text: str):
+        self._parts.append(text)
+        now = time.monotonic()
+        if now - self._last_flush >= self.min_interval:
+            self._last_flush = now
+            self.flush()
+
+    def flush(self):
+        if self._parts:
+            text, self._parts = "".join(self._parts), []
+            self.on_flush(text)
+
+
+def _image_token_id(model) -> int:
+    config = model.config
+    token_id = getattr(config, "image_token_index", None) # Renamed to image_token_id in newer transformers
+    return token_id if token_id is not None else config.image_token_id
+
+
+def _language_backbone(model):
+    """The decoder without its LM head, so prefill does not materialize vocab-sized logits for every prompt token."""
+    language_model = model.language_model
+    return getattr(language_model, "model", language_model) # Older transformers wrap it in LlamaForCausalLM
+
+
+def compute_image_features(model, pixel_values):
+    """Projected vision features, shape (num_images, image_tokens, hidden)."""
+    import torch
+    features = model.get_image_features(
+        pixel_values=pixel_values.to(model.device, model.dtype),
+        vision_feature_layer=model.config.vision_feature_layer,
+        vision_feature_select_strategy=model.config.vision_feature_select_strategy,
+    )
+    if isinstance(features, (list, tuple)): # Newer transformers return one tensor per image
+        features = torch.stack(list(features))
+    return features
+
+
+class PrefixKVCache:
+    """
+    Prefills the prompt text that precedes the image tokens once and hands out copies of its KV cache.
+
+    Everything after the first image token attends to that image, so only the leading text (system
+    message + user header) is shared between rows; the prompt suffix is still prefilled per row.
+    Owned by whoever owns the model and only used from the generating thread.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._prefix_key: Optional[Tuple[int, ...]] = None
+        self._prefix_cache = None
+        self.hits = 0
+        self.misses = 0
+
+    def shared_prefix_len(self, input_ids, attention_mask) -> int:
+        """Length of the text before the first image token if every row shares it unpadded, else 0."""
+        if attention_mask is not None and not bool(attention_mask.all()):
+            return 0 # Left padding shifts the prefix by a different amount per row
+        image_positions = (input_ids[0] == _image_token_id(self.model)).nonzero()
+        if len(image_positions) == 0:
+            return 0
+        prefix_len = int(image_positions[0])
+        if prefix_len >= input_ids.shape[1] - 1 or not bool((input_ids[:, :prefix_len] == input_ids[0, :prefix_len]).all()):
+            return 0
+        return prefix_len
+
+    def cache_for(self, prefix_ids, batch_size: int):
+        key = tuple(prefix_ids.tolist())
+        if key != self._prefix_key:
+            out = _language_backbone(self.model)(input_ids=prefix_ids.unsqueeze(0), use_cache=True)
+            self._prefix_key, self._prefix_cache = key, out.past_key_values
+            self.misses += 1
+        else:
+            self.hits += 1
+        # generate() appends to the cache in place, so every call works on its own copy.
+        cache = copy.deepcopy(self._prefix_cache)
+        if batch_size > 1:
+            cache.batch_repeat_interleave(batch_size)
+        return cache
+
+
+def prefill_prompt(model, inputs, image_features=None, prefix_cache: Optional[PrefixKVCache] = None):
+    """
+    Fills a KV cache for all but the last prompt token of every row, with image features merged into the
+    embeddings, so generate() continues from text tokens only and never needs pixel_values. Reuses
+    prefix_cache when the rows share an unpadded prefix. Returns None if the image tokens and features disagree.
+    """
+    import torch
+    input_ids = inputs["input_ids"]
+    batch_size, prompt_len = input_ids.shape
+    attention_mask = inputs.get("attention_mask")
+    if attention_mask is None:
+        attention_mask = torch.ones_like(input_ids)
+    prefix_len = prefix_cache.shared_prefix_len(input_ids, attention_mask) if prefix_cache is not None else 0
+
+    if image_features is None:
+        image_features = compute_image_features(model, inputs["pixel_values"])
+    rest_ids = input_ids[:, prefix_len:prompt_len - 1] # The last token is left for generate() to consume
+    embeds = model.get_input_embeddings()(rest_ids)
+    image_mask = (rest_ids == _image_token_id(model)).unsqueeze(-1).expand_as(embeds)
+    flat_features = image_features.reshape(-1, embeds.shape[-1]).to(embeds.device, embeds.dtype)
+    if int(image_mask.sum()) != flat_features.numel():
+        return None
+
+    cache = prefix_cache.cache_for(input_ids[0, :prefix_len], batch_size) if prefix_len else None
+    # Same positions generate() derives for left-padded rows.
+    position_ids = (attention_mask.long().cumsum(-1) - 1).clamp(min=0)[:, prefix_len:prompt_len - 1]
+    out = _language_backbone(model)(
+        inputs_embeds=embeds.masked_scatter(image_mask, flat_features),
+        attention_mask=attention_mask[:, :prompt_len - 1],
+        position_ids=position_ids,
+        past_key_values=cache,
+        cache_position=torch.arange(prefix_len, prompt_len - 1, device=input_ids.device),
+        use_cache=True,
+    )
+    return out.past_key_values
+
+
+def resolve_image_features(model, inputs, fanout: int = 1, feature_cache=None,
+                           content_hashes: Optional[List[str]] = None, cached_features: Optional[List[Optional[object]]] = None):
+    """
+    Features for every row of `inputs`, encoding each distinct image once. Rows are image-major with
+    `fanout` consecutive rows per image (see prepare_fanout_inputs). With a feature_cache, cached
+    features are reused and only the misses go through the vision tower (and are stored).
+    """
+    import torch
+    pixel_values = inputs["pixel_values"][::fanout]
+    if feature_cache is None:
+        with torch.no_grad():
+            features = compute_image_features(model, pixel_values)
+    else:
+        missing = [i for i, cached in enumerate(cached_features) if cached is None]
+        rows = list(cached_features)
+        if missing:
+            with torch.no_grad():
+                computed = compute_image_features(model, pixel_values[missing])
+            for image_idx, image_features in zip(missing, computed):
+                rows[image_idx] = image_features
+                feature_cache.put(content_hashes[image_idx], image_features)
+        features = torch.stack([image_features.to(model.device, model.dtype) for image_features in rows])
+    return features.repeat_interleave(fanout, dim=0) if fanout > 1 else features
+
+
+def generate_from_inputs(model, processor, inputs, temperature: float, top_p: float, max_new_tokens: int,
+                         streamer=None, stop_event: Optional[Event] = None,
+                         prefix_cache: Optional[PrefixKVCache] = None, image_features=None, draft=None) -> List[str]:
+    """
+    Runs generate on inputs from prepare_batch_inputs. A streamer requires a batch of one.
+    With a prefix_cache or precomputed image_features the prompt goes through prefill_prompt first.
+    With a draft (joycaption_speculative.DraftModel) decoding is speculative; stats land in draft.last_stats.
+    Prefill (to the first token) and mean per-token decode time are recorded in METRICS.
+    """
+    import torch
+    from transformers import StoppingCriteriaList
+    tokenizer = processor.tokenizer
+    step_timer = _transformers_subclasses()["StepTimerCriteria"]()
+    stopping_criteria = StoppingCriteriaList([step_timer])
+    if stop_event is not None:
+        stopping_criteria.append(_transformers_subclasses()["StopEventCriteria"](stop_event))
+    start_time = time.perf_counter()
+    inputs = inputs.to(model.device)
+    inputs['pixel_values'] = inputs['pixel_values'].to(model.dtype)
+
+    with torch.no_grad():
+        if draft is not None:
+            from joycaption_speculative import speculative_generate
+            return speculative_generate(model, processor, draft, inputs, image_features, temperature, top_p,
+                                        max_new_tokens, streamer, stop_event, prefix_cache)
+        past_key_values = None
+        if prefix_cache is not None or image_features is not None:
+            past_key_values = prefill_prompt(model, inputs, image_features, prefix_cache)
+        if past_key_values is not None:
+            # The image is already in the cache; generate() starts from the final prompt token.
+            generate_inputs = {"input_ids": inputs["input_ids"], "attention_mask": inputs["attention_mask"],
+                               "past_key_values": past_key_values}
+        else:
+            generate_inputs = dict(inputs)
+        output_ids = model.generate(
+            **generate_inputs,
+            max_new_tokens=max_new_tokens,
+            do_sample=True if temperature > 0 else False,
+            use_cache=True,
+            temperature=temperature if temperature > 0 else None,
+            top_k=None,
+            top_p=top_p if temperature > 0 else None,
+            pad_token_id=tokenizer.pad_token_id,
+            streamer=streamer,
+            stopping_criteria=stopping_criteria,
+        )
+
+    rows = inputs['input_ids'].shape[0]
+    step_times = step_timer.step_times
+    if step_times:
+        METRICS.observe(STAGE_PREFILL, step_times[0] - start_time, rows=rows)
+    if len(step_times) > 1:
+        METRICS.observe(STAGE_DECODE_TOKEN, (step_times[-1] - step_times[0]) / (len(step_times) - 1),
+                        rows=rows, steps=len(step_times))
+    prompt_len = inputs['input_ids'].shape[1]
+    captions = tokenizer.batch_decode(output_ids[:, prompt_len:], skip_special_tokens=True)
+    return [c.strip() for c in captions]
+
+
+def generate_captions_batch(model, processor, images: List[Image.Image], prompts: List[str],
+                            temperature: float, top_p: float, max_new_tokens: int) -> List[str]:
+    inputs = prepare_batch_inputs(processor, images, prompts)
+    return generate_from_inputs(model, processor, inputs, temperature, top_p, max_new_tokens)
+
+
+# --- Prefetching: decode + preprocess upcoming batches while the current one generates ---
+LOAD_ERROR_CAPTION = "[Error: Could not load this image for processing]"
+
+@dataclass
+class PreparedBatch:
+    paths: List[Path] # Images that decoded successfully, in order
+    images: List[Image.Image]
+    inputs: Optional[object] # CPU BatchFeature from prepare_batch_inputs, None if nothing decoded
+    failed: Dict[Path, str] = field(default_factory=dict) # path -> error message
+    fanout: int = 1 # Rows per image in inputs (one per prompt), image-major
+    content_hashes: List[str] = field(default_factory=list) # Parallel to paths; only filled with a feature cache
+    cached_features: List[Optional[object]] = field(default_factory=list) # Parallel to paths; None on a miss
+
+
+def chunk_paths(paths: Iterable[Path], batch_size: int) -> Iterator[List[Path]]:
+    """Lazy, so a streaming scan can feed BatchPrefetcher before it has finished."""
+    chunk: List[Path] = []
+    for path in paths:
+        chunk.append(path)
+        if len(chunk) >= batch_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class BatchPrefetcher:
+    """
+    Keeps up to `depth` batches decoded, RGB-converted and preprocessed ahead of the consumer.
+    `prompt` may be a list, in which case every image fans out to one row per prompt.
+    `content_hashes` (path -> hash_file_contents digest, e.g. DedupResult.digests) spares the feature cache
+    from hashing those files again.
+    """
+
+    def __init__(self, processor, batches: Iterable[List[Path]], prompt: Union[str, List[str]], depth: int = 2,
+                 num_workers: int = 2, feature_cache=None, content_hashes: Optional[Dict[Path, str]] = None):
+        self.processor = processor
+        self.feature_cache = feature_cache # Optional FeatureCache; lookups happen here, off the generating thread
+        self.content_hashes = content_hashes or {}
+        self.prompts = [prompt] if isinstance(prompt, str) else list(prompt)
+        self.depth = max(1, depth)
+        self._batches = iter(batches)
+        self._pending: Deque[Future] = deque()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, num_workers), thread_name_prefix="prefetch")
+        # Configure padding once up front so worker threads never race on tokenizer settings.
+        if processor.tokenizer.pad_token is None:
+            processor.tokenizer.pad_token = processor.tokenizer.eos_token
+        processor.tokenizer.padding_side = "left"
+        self._fill()
+
+    def _prepare(self, batch_paths: List[Path]) -> PreparedBatch:
+        prepared = PreparedBatch(paths=[], images=[], inputs=None, fanout=len(self.prompts))
+        for img_path in batch_paths:
+            try:
+                with METRICS.time(STAGE_IMAGE_LOAD):
+                    prepared.images.append(Image.open(img_path).convert("RGB"))
+                prepared.paths.append(img_path)
+            except Exception as e:
+                print(f"Error loading {img_path}: {e}")
+                prepared.failed[img_path] = str(e)
+        if prepared.images:
+            try:
+                prepared.inputs = prepare_fanout_inputs(self.processor, prepared.images, self.prompts)
+            except Exception as e:
+                print(f"Error preprocessing batch {[p.name for p in prepared.paths]}: {e}")
+                prepared.failed.update({img_path: str(e) for img_path in prepared.paths})
+                prepared.paths, prepared.images = [], []
+        if self.feature_cache is not None:
+            for img_path in prepared.paths:
+                content_hash, features = self.feature_cache.lookup(img_path, self.content_hashes.get(img_path))
+                prepared.content_hashes.append(content_hash)
+                prepared.cached_features.append(features)
+        return prepared
+
+    def _fill(self):
+        while len(self._pending) < self.depth:
+            batch_paths = next(self._batches, None)
+            if batch_paths is None:
+                return
+            self._pending.append(self._executor.submit(self._prepare, batch_paths))
+
+    def next_future(self) -> Optional[Future]:
+        """Non-blocking: returns the Future of the next PreparedBatch, or None when exhausted."""
+        if not self._pending:
+            return None
+        future = self._pending.popleft()
+        self._fill()
+        return future
+
+    def __iter__(self) -> Iterator[PreparedBatch]:
+        while True:
+            future = self.next_future()
+            if future is None:
+                return
+            yield future.result()
+
+    def close(self):
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._executor.shutdown(wait=False)
+
+
+def caption_path_for(image_path: Path, slug: Optional[str] = None) -> Path:
+    """img.txt, or img.<slug>.txt for one of several caption types (see CAPTION_TYPE_SLUGS)."""
+    return image_path.with_suffix(f".{slug}.txt" if slug else ".txt")
+
+
+def dataset_state_path(dataset_dir: Path, filename: str, fallback_dir: Path) -> Path:
+    """
+    Where per-dataset state (thumbnail cache, batch journal) is kept: `filename` inside the dataset if it is writable,
+    else a file in `fallback_dir` (under the user cache dir) named after the dataset's resolved path.
+    """
+    if os.access(dataset_dir, os.W_OK):
+        return dataset_dir / filename
+    fallback_dir.mkdir(parents=True, exist_ok=True)
+    dir_hash = hashlib.sha1(str(dataset_dir.resolve()).encode("utf-8")).hexdigest()[:16]
+    return fallback_dir / f"{dir_hash}{Path(filename).suffix}"
+
+
+def load_thumbnail_image(image_path: Path, height: int) -> Image.Image:
+    """Decodes an RGB thumbnail `height` px tall, letting JPEG decode at reduced scale (draft) and reduce() the rest."""
+    with Image.open(image_path) as img:
+        target_w = max(1, round(img.width * height / max(1, img.height)))
+        img.draft("RGB", (target_w, height)) # No-op for non-JPEG formats
+        thumb = img.convert("RGB")
+    thumb.thumbnail((target_w, height), Image.BILINEAR, reducing_gap=2.0)
+    return thumb
+
+
+def encode_thumbnail(thumb: Image.Image) -> bytes:
+    """Compact JPEG encoding used for the persistent thumbnail cache."""
+    buffer = io.BytesIO()
+    thumb.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+# --- Model loading (shared by both GUI variants and the CLI) ---
+# Stages reported through load_model's progress_callback(stage, done, total), in this order.
+LOAD_STAGE_CONFIG = "config"
+LOAD_STAGE_SHARDS = "shards" # done/total = checkpoint shards loaded / shard count
+LOAD_STAGE_LIGER = "liger"
+LOAD_STAGE_AUTOTUNE = "autotune" # done/total = CPU thread configurations timed / candidates; CPU first loads only
+LOAD_STAGE_WARMUP = "warmup"
+LOAD_STAGES = (LOAD_STAGE_CONFIG, LOAD_STAGE_SHARDS, LOAD_STAGE_LIGER, LOAD_STAGE_AUTOTUNE, LOAD_STAGE_WARMUP)
+
+
+class _ShardProgressBar:
+    """Proxies transformers' "Loading checkpoint shards" tqdm bar and reports every finished shard."""
+
+    def __init__(self, bar, callback: Callable[[int, int], None]):
+        self._bar = bar
+        self._callback = callback
+
+    def __iter__(self):
+        for done_count, item in enumerate(self._bar, start=1):
+            yield item
+            self._callback(done_count, self._bar.total or done_count) # Resumed after the shard was loaded
+
+    def update(self, n=1):
+        result = self._bar.update(n)
+        self._callback(self._bar.n, self._bar.total or self._bar.n)
+        return result
+
+    def __enter__(self):
+        self._bar.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._bar.__exit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self._bar, name)
+
+
+def _import_liger_kernel() -> Optional[Callable]:
+    """apply_liger_kernel_to_llama, or None (with a warning) if liger_kernel is not installed."""
+    try:
+        from liger_kernel.transformers import apply_liger_kernel_to_llama
+    except ImportError:
+        print("Warning: liger_kernel not found. LLM optimizations will be disabled.")
+        return None
+    return apply_liger_kernel_to_llama
+
+
+def bitsandbytes_available() -> bool:
+    """Checked without importing bitsandbytes (it initialises CUDA on import)."""
+    import importlib.util
+    return importlib.util.find_spec("bitsandbytes") is not None
+
+
+@contextmanager
+def _report_shard_progress(callback: Optional[Callable[[int, int], None]]):
+    """
+    from_pretrained has no progress hook, but it loads shards inside transformers.utils.logging.tqdm;
+    swap that factory for one whose shard bar reports to `callback`. Other bars pass through untouched.
+    """
+    from transformers.utils import logging as hf_logging
+    original_tqdm = getattr(hf_logging, "tqdm", None)
+    if callback is None or original_tqdm is None:
+        yield
+        return
+
+    def reporting_tqdm(*args, **kwargs):
+        bar = original_tqdm(*args, **kwargs)
+        if "shard" in str(kwargs.get("desc", "")).lower():
+            callback(0, bar.total or 0)
+            return _ShardProgressBar(bar, callback)
+        return bar
+
+    hf_logging.tqdm = reporting_tqdm
+    try:
+        yield
+    finally:
+        hf_logging.tqdm = original_tqdm
+
+
+def warm_up_model(model, processor):
+    """One tiny generate so CUDA kernels, cuBLAS handles and the allocator are ready before the first real caption."""
+    inputs = prepare_batch_inputs(processor, [Image.new("RGB", (64, 64), (128, 128, 128))], ["Describe this image."])
+    generate_from_inputs(model, processor, inputs, temperature=0.6, top_p=0.9, max_new_tokens=2)
+
+
+# BitsAndBytesConfig arguments of the quantized profiles (dtypes by name); also part of the quantized-checkpoint
+# cache key. The vision tower and projector stay unquantized in both.
+NF4_QUANTIZATION_SETTINGS = {
+    "load_in_4bit": True,
+    "bnb_4bit_quant_type": "nf4",
+    "bnb_4bit_compute_dtype": "float16", # As per user's example
+    "bnb_4bit_use_double_quant": True,
+    "llm_int8_skip_modules": ["vision_tower", "multi_modal_projector"], # Crucial
+}
+INT8_QUANTIZATION_SETTINGS = {
+    "load_in_8bit": True,
+    "llm_int8_skip_modules": ["vision_tower", "multi_modal_projector"],
+}
+
+
+@dataclass(frozen=True)
+class PrecisionProfile:
+    """How the weights are stored and computed. Every profile goes through the same load_model / generate path."""
+    name: str
+    label: str # Shown in the GUI
+    device: str # "cuda" or "cpu"
+    torch_dtype: str # torch dtype name of the unquantized weights
+    quantization: Optional[dict] = None # BitsAndBytesConfig kwargs, see NF4_QUANTIZATION_SETTINGS
+    cpu_int8: bool = False # int8 weight-only language model after loading (joycaption_cpu)
+
+
+PRECISION_PROFILES: Dict[str, PrecisionProfile] = {profile.name: profile for profile in (
+    PrecisionProfile("bf16", "bf16 (CUDA)", "cuda", "bfloat16"),
+    PrecisionProfile("fp16", "fp16 (CUDA)", "cuda", "float16"),
+    PrecisionProfile("int8", "8-bit LLM.int8 (CUDA, bitsandbytes)", "cuda", "float16", INT8_QUANTIZATION_SETTINGS),
+    PrecisionProfile("nf4", "NF4 4-bit (CUDA, bitsandbytes)", "cuda", "float16", NF4_QUANTIZATION_SETTINGS),
+    PrecisionProfile("cpu-fp32", "fp32 (CPU)", "cpu", "float32"),
+    PrecisionProfile("cpu-bf16", "bf16 (CPU)", "cpu", "bfloat16"),
+    PrecisionProfile("cpu-int8", "int8 weight-only (CPU)", "cpu", "float32", cpu_int8=True),
+)}
+PRECISION_AUTO = "auto" # bf16 on CUDA; on CPU bf16 where it is native (AVX512-BF16 / AMX), else fp32
+PRECISION_CHOICES = [PRECISION_AUTO] + list(PRECISION_PROFILES)
+
+
+def resolve_precision_profile(precision: str = PRECISION_AUTO, status_callback: Optional[Callable[[str], None]] = None,
+                              device: Optional[str] = None) -> PrecisionProfile:
+    """
+    Maps a profile name to a profile this machine (or `device`, for "auto") can run: without CUDA, CUDA profiles fall back to
+    cpu-fp32; without bitsandbytes, quantized profiles fall back to bf16. Fallbacks are reported.
+    """
+    import torch
+
+    def warn(msg: str):
+        print(f"Warning: {msg}")
+        if status_callback:
+            status_callback(msg)
+
+    cuda_available = torch.cuda.is_available()
+    if precision == PRECISION_AUTO:
+        if cuda_available and device != "cpu":
+            return PRECISION_PROFILES["bf16"]
+        from joycaption_cpu import cpu_supports_fast_bf16
+        profile = PRECISION_PROFILES["cpu-bf16" if cpu_supports_fast_bf16() else "cpu-fp32"]
+        if device != "cpu":
+            warn(f"CUDA is not available; running on CPU with '{profile.name}' (try 'cpu-int8' for faster decoding).")
+        return profile
+    if precision not in PRECISION_PROFILES:
+        raise ValueError(f"Unknown precision profile {precision!r}. Choices: {', '.join(PRECISION_CHOICES)}.")
+    profile = PRECISION_PROFILES[precision]
+    if profile.device == "cuda" and not cuda_available:
+        warn(f"CUDA is not available; precision '{precision}' falls back to 'cpu-fp32'.")
+        return PRECISION_PROFILES["cpu-fp32"]
+    if profile.quantization and not bitsandbytes_available():
+        warn(f"bitsandbytes library not found; precision '{precision}' falls back to 'bf16'.")
+        return PRECISION_PROFILES["bf16"]
+    return profile
+
+
+def load_model(model_path: str = MODEL_PATH, load_in_4bit: bool = False,
+               status_callback: Optional[Callable[[str], None]] = None,
+               device: Optional[str] = None,
+               progress_callback: Optional[Callable[[str, int, int], None]] = None,
+               warm_up: bool = False,
+               use_quantized_cache: bool = True,
+               precision: Optional[str] = None,
+               cpu_tuning=None, cpu_autotune: bool = False) -> Tuple[object, object, str]:
+    """
+    Loads processor + model. Returns (processor, model, human readable load message).
+    `precision` names one of PRECISION_CHOICES; when None, `load_in_4bit` selects "nf4" over "auto".
+    `device` (e.g. "cuda:1") places the whole model on one device instead of device_map="auto".
+    `progress_callback(stage, done, total)` is called for each of LOAD_STAGES; it and `status_callback`
+    run on the loading thread. `warm_up` runs warm_up_model before returning.
+    With `use_quantized_cache`, quantized profiles reuse (or create) a pre-quantized checkpoint, see joycaption_quantcache.
+    CPU profiles pin threads with `cpu_tuning` (a joycaption_cpu.CpuTuning), else the cached autotune result, else
+    node-local physical cores; `cpu_autotune` times the candidates after loading if nothing is cached yet.
+    """
+    import torch
+    from transformers import AutoProcessor, BitsAndBytesConfig, LlavaForConditionalGeneration
+
+    if precision is None:
+        precision = "nf4" if load_in_4bit else PRECISION_AUTO
+
+    def status(msg: str):
+        print(msg)
+        if status_callback:
+            status_callback(msg)
+
+    def progress(stage: str, done_count: int, total: int):
+        if progress_callback:
+            progress_callback(stage, done_count, total)
+
+    progress(LOAD_STAGE_CONFIG, 0, 1)
+    processor = AutoProcessor.from_pretrained(model_path)
+    progress(LOAD_STAGE_CONFIG, 1, 1)
+    status("Processor loaded. Loading model weights...")
+
+    profile = resolve_precision_profile(precision, status_callback, device)
+    if device is None:
+        device = profile.device
+        device_map = "auto" if profile.device == "cuda" else {"": "cpu"}
+    elif device.startswith(profile.device):
+        device_map = {"": device}
+    else:
+        raise ValueError(f"Precision '{profile.name}' runs on {profile.device}, not on {device}.")
+    quantization_applied = profile.quantization is not None # Flag to track if quantization is applied
+    quant_cache, quant_cache_key, quantized_dir = None, None, None
+
+    model_load_kwargs = {
+        "low_cpu_mem_usage": True,
+        "device_map": device_map,
+        "torch_dtype": getattr(torch, profile.torch_dtype),
+    }
+
+    if quantization_applied:
+        status(f"CUDA detected. Preparing {profile.name} quantization...")
+        q_settings = dict(profile.quantization)
+        if "bnb_4bit_compute_dtype" in q_settings:
+            q_settings["bnb_4bit_compute_dtype"] = getattr(torch, q_settings["bnb_4bit_compute_dtype"])
+        model_load_kwargs["quantization_config"] = BitsAndBytesConfig(**q_settings)
+        model_load_kwargs["torch_dtype"] = "auto" # Recommended with quantization_config
+        if use_quantized_cache:
+            from joycaption_quantcache import QuantizedModelCache, quantized_cache_key
+            quant_cache = QuantizedModelCache()
+            quant_cache_key = quantized_cache_key(model_path, profile.quantization)
+            quantized_dir = quant_cache.lookup(quant_cache_key) if quant_cache_key else None
+
+    tuning_source = None
+    if profile.device == "cpu":
+        from joycaption_cpu import apply_cpu_tuning, cached_cpu_tuning, default_cpu_tuning
+        tuning_source = "given" if cpu_tuning is not None else "autotuned"
+        if cpu_tuning is None:
+            cpu_tuning = cached_cpu_tuning(profile.name)
+        if cpu_tuning is None:
+            cpu_tuning, tuning_source = default_cpu_tuning(), "default"
+        apply_cpu_tuning(cpu_tuning) # Before the weights are allocated, so they land on the pinned NUMA node
+        status(f"CPU threads ({tuning_source}): {cpu_tuning.describe()}")
+
+    model = None
+    if quantized_dir is not None:
+        # The 4-bit weights and their quantization_config are stored in the entry; nothing to quantize.
+        cached_kwargs = {k: v for k, v in model_load_kwargs.items() if k != "quantization_config"}
+        status(f"Loading pre-quantized {profile.name} checkpoint from cache...")
+        print(f"Loading LlavaForConditionalGeneration.from_pretrained('{quantized_dir}', **{cached_kwargs}) on {device}")
+        try:
+            with _report_shard_progress(lambda done_count, total: progress(LOAD_STAGE_SHARDS, done_count, total)):
+                model = LlavaForConditionalGeneration.from_pretrained(quantized_dir, **cached_kwargs)
+            # Keep the original identity, e.g. for the feature cache namespace.
+            model.config._name_or_path = model_path
+            model.config._commit_hash = quant_cache.manifest(quant_cache_key).get("revision")
+        except Exception as e:
+            print(f"Discarding unusable quantized checkpoint {quantized_dir}: {e}")
+            quant_cache.remove(quant_cache_key)
+            quantized_dir, model = None, None
+
+    if model is None:
+        print(f"Loading LlavaForConditionalGeneration.from_pretrained('{model_path}', **{model_load_kwargs}) on {device}")
+        with _report_shard_progress(lambda done_count, total: progress(LOAD_STAGE_SHARDS, done_count, total)):
+            model = LlavaForConditionalGeneration.from_pretrained(model_path, **model_load_kwargs)
+        if quant_cache_key is not None:
+            status("Saving the quantized checkpoint so later launches skip quantization...")
+            try:
+                print(f"Quantized checkpoint saved to {quant_cache.export(quant_cache_key, model, processor, model_path, profile.quantization)}")
+            except Exception as e:
+                print(f"Warning: could not save the quantized checkpoint: {e}")
+    model.eval()
+
+    if profile.cpu_int8:
+        from joycaption_cpu import quantize_language_model_int8
+        status("Quantizing language model weights to int8...")
+        print(f"Language model quantized ({quantize_language_model_int8(model)}).")
+
+    progress(LOAD_STAGE_LIGER, 0, 1)
+    apply_liger_kernel_to_llama = _import_liger_kernel()
+    if apply_liger_kernel_to_llama is not None and hasattr(model, 'language_model'):
+        if profile.device == "cpu":
+            print("LIGER kernel application skipped: its Triton kernels need CUDA.")
+        elif quantization_applied:
+            print(f"LIGER kernel application skipped due to active {profile.name} quantization.")
+        else:
+            status("Applying LIGER kernel...")
+            apply_liger_kernel_to_llama(model=model.language_model)
+    progress(LOAD_STAGE_LIGER, 1, 1)
+
+    if profile.device == "cpu" and cpu_autotune and tuning_source == "default":
+        from joycaption_cpu import autotune_cpu_threads
+        cpu_tuning = autotune_cpu_threads(model, processor, profile.name, status,
+                                          lambda done_count, total: progress(LOAD_STAGE_AUTOTUNE, done_count, total))
+        status(f"CPU threads (autotuned): {cpu_tuning.describe()}")
+
+    if warm_up:
+        status("Warming up...")
+        progress(LOAD_STAGE_WARMUP, 0, 1)
+        warm_up_model(model, processor)
+        progress(LOAD_STAGE_WARMUP, 1, 1)
+
+    load_message = f"{model_path} loaded [{profile.name}]"
+    if quantized_dir is not None:
+        load_message += f" with {profile.name} quantization (pre-quantized cache)."
+    elif quantization_applied:
+        load_message += f" with {profile.name} quantization."
+    else:
+        final_dtype = str(model.dtype if hasattr(model, 'dtype') else model_load_kwargs.get('torch_dtype', 'unknown'))
+        load_message += f" (dtype: {final_dtype}, {device})."
+    return processor, model, load_message
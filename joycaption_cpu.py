@@ -0,0 +1,236 @@
+# CPU execution tuning: thread counts, NUMA-aware core pinning, int8 weight-only quantization of the
+# language model, and a one-off autotune of the thread configuration whose result is cached per machine.
+# Linux topology is read from /sys; elsewhere everything degrades to "all cores, default threading". Qt-free.
+import json
+import os
+import platform
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+AUTOTUNE_CACHE_PATH = Path.home() / ".cache" / "joycaption" / "cpu_autotune.json"
+AUTOTUNE_NEW_TOKENS = 8 # Tokens generated per trial; decode speed is what incremental jobs wait on
+AUTOTUNE_REPEATS = 2 # Trials per configuration; the fastest counts
+
+
+@dataclass
+class CpuTuning:
+    intra_op_threads: int
+    inter_op_threads: int = 1 # generate() is a sequential chain of ops; extra inter-op threads rarely help
+    cores: List[int] = field(default_factory=list) # Affinity; empty = leave as is
+
+    def describe(self) -> str:
+        cores = f", cores {format_cpulist(self.cores)}" if self.cores else ""
+        return f"{self.intra_op_threads} intra-op / {self.inter_op_threads} inter-op threads{cores}"
+
+
+def parse_cpulist(text: str) -> List[int]:
+    """'0-3,8,10-11' -> [0, 1, 2, 3, 8, 10, 11] (the /sys and taskset format)."""
+    cores = []
+    for part in text.strip().split(","):
+        if "-" in part:
+            first, last = part.split("-")
+            cores.extend(range(int(first), int(last) + 1))
+        elif part:
+            cores.append(int(part))
+    return cores
+
+
+def format_cpulist(cores: List[int]) -> str:
+    ranges, start = [], None
+    for idx, core in enumerate(sorted(cores)):
+        if start is None:
+            start = prev = core
+        elif core != prev + 1:
+            ranges.append(f"{start}-{prev}" if prev != start else str(start))
+            start = core
+        prev = core
+        if idx == len(cores) - 1:
+            ranges.append(f"{start}-{prev}" if prev != start else str(start))
+    return ",".join(ranges)
+
+
+def available_cores() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def numa_nodes() -> List[List[int]]:
+    """Usable cores per NUMA node; a single node with every usable core if the topology is unknown."""
+    usable = set(available_cores())
+    nodes = []
+    for node_dir in sorted(Path("/sys/devices/system/node").glob("node[0-9]*"), key=lambda p: int(p.name[4:])):
+        try:
+            cores = [c for c in parse_cpulist((node_dir / "cpulist").read_text()) if c in usable]
+        except OSError:
+            continue
+        if cores:
+            nodes.append(cores)
+    return nodes or [sorted(usable)]
+
+
+def physical_cores(cores: List[int]) -> List[int]:
+    """One logical CPU per physical core (SMT siblings share execution units, so they add little for GEMMs)."""
+    seen, result = set(), []
+    for core in cores:
+        try:
+            siblings = tuple(parse_cpulist(Path(f"/sys/devices/system/cpu/cpu{core}/topology/thread_siblings_list").read_text()))
+        except OSError:
+            siblings = (core,)
+        if siblings not in seen:
+            seen.add(siblings)
+            result.append(core)
+    return result
+
+
+def cpu_supports_fast_bf16() -> bool:
+    """AVX512-BF16 or AMX: bf16 matmuls run natively instead of being emulated (slower than fp32)."""
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8") as f:
+            flags = next((line.split(":", 1)[1].split() for line in f if line.startswith("flags")), [])
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+
+def default_cpu_tuning() -> CpuTuning:
+    """Physical cores of the first NUMA node: decode is memory-bound, and remote-node memory is slower."""
+    cores = physical_cores(numa_nodes()[0])
+    return CpuTuning(intra_op_threads=len(cores), cores=cores)
+
+
+def apply_cpu_tuning(tuning: CpuTuning):
+    """
+    Pins every thread of the process (threads created later inherit the mask) and sets torch's thread
+    counts. Call before loading weights so first-touch allocation puts them on the pinned node.
+    """
+    import torch
+    if tuning.cores and hasattr(os, "sched_setaffinity"):
+        try:
+            thread_ids = [int(tid) for tid in os.listdir("/proc/self/task")]
+        except OSError:
+            thread_ids = [0]
+        for tid in thread_ids:
+            try:
+                os.sched_setaffinity(tid, tuning.cores)
+            except OSError:
+                pass # Thread exited meanwhile
+    torch.set_num_threads(tuning.intra_op_threads)
+    try:
+        torch.set_num_interop_threads(tuning.inter_op_threads)
+    except RuntimeError:
+        pass # Only settable once per process, before the first inter-op parallel work
+
+
+def quantize_language_model_int8(model):
+    """
+    int8 weight-only quantization of the language model's Linear layers (including the LM head), in place.
+    Uses torchao when installed, else torch's built-in dynamic quantization. The vision tower stays as is.
+    Never reassigns `model.language_model`: on newer transformers it is a read-only property.
+    """
+    import torch
+    lm_head = getattr(model, "lm_head", None) # Newer transformers keep the head outside language_model
+    try:
+        from torchao.quantization import int8_weight_only, quantize_
+        quantize_(model.language_model, int8_weight_only())
+        if lm_head is not None:
+            quantize_(lm_head, int8_weight_only())
+        return "torchao int8 weight-only"
+    except ImportError:
+        pass
+    # inplace=True swaps the Linear children in place instead of deep-copying the 8B language model first.
+    torch.ao.quantization.quantize_dynamic(model.language_model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    if lm_head is not None:
+        # convert() only replaces children, never the root module, so quantize the head as a child of a holder.
+        holder = torch.nn.ModuleDict({"lm_head": lm_head})
+        torch.ao.quantization.quantize_dynamic(holder, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        model.lm_head = holder["lm_head"]
+    return "torch dynamic int8"
+
+
+def _machine_key(profile_name: str) -> str:
+    import torch
+    cpu_name = platform.processor()
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8") as f:
+            cpu_name = next((line.split(":", 1)[1].strip() for line in f if line.startswith("model name")), cpu_name)
+    except OSError:
+        pass
+    return f"{cpu_name}|{format_cpulist(available_cores())}|{profile_name}|torch {torch.__version__}"
+
+
+def _load_autotune_cache() -> Dict[str, dict]:
+    try:
+        with open(AUTOTUNE_CACHE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def cached_cpu_tuning(profile_name: str) -> Optional[CpuTuning]:
+    entry = _load_autotune_cache().get(_machine_key(profile_name))
+    if entry is None:
+        return None
+    return CpuTuning(entry["intra_op_threads"], entry["inter_op_threads"], entry["cores"])
+
+
+def candidate_tunings() -> List[CpuTuning]:
+    """Node-local vs all nodes, physical cores vs all logical CPUs, full vs half thread count."""
+    nodes = numa_nodes()
+    all_cores = [c for node in nodes for c in node]
+    core_sets = [physical_cores(nodes[0]), nodes[0]]
+    if len(nodes) > 1:
+        core_sets += [physical_cores(all_cores), all_cores]
+    candidates, seen = [], set()
+    for cores in core_sets:
+        for threads in (len(cores), max(1, len(cores) // 2)):
+            key = (threads, tuple(cores))
+            if key not in seen:
+                seen.add(key)
+                candidates.append(CpuTuning(intra_op_threads=threads, cores=cores))
+    return candidates
+
+
+def autotune_cpu_threads(model, processor, profile_name: str,
+                         status_callback: Optional[Callable[[str], None]] = None,
+                         progress_callback: Optional[Callable[[int, int], None]] = None) -> CpuTuning:
+    """
+    Times a short generate under each candidate, applies the fastest and caches it for this machine and
+    profile. Inter-op threads are not varied: torch only lets a process set them once.
+    `progress_callback(done, total)` is called before the first candidate and after each one.
+    """
+    from joycaption_core import generate_from_inputs, prepare_batch_inputs
+    from PIL import Image
+
+    inputs = prepare_batch_inputs(processor, [Image.new("RGB", (64, 64), (128, 128, 128))], ["Describe this image."])
+    results = []
+    candidates = candidate_tunings()
+    if progress_callback:
+        progress_callback(0, len(candidates))
+    for idx, tuning in enumerate(candidates, start=1):
+        if status_callback:
+            status_callback(f"Autotuning CPU threads ({idx}/{len(candidates)}): {tuning.describe()}...")
+        apply_cpu_tuning(tuning)
+        best = float("inf")
+        for _ in range(AUTOTUNE_REPEATS):
+            start = time.perf_counter()
+            generate_from_inputs(model, processor, inputs, temperature=0.0, top_p=1.0, max_new_tokens=AUTOTUNE_NEW_TOKENS)
+            best = min(best, time.perf_counter() - start)
+        results.append((best, tuning))
+        print(f"CPU autotune: {tuning.describe()}: {best:.2f}s")
+        if progress_callback:
+            progress_callback(idx, len(candidates))
+
+    best_seconds, best_tuning = min(results, key=lambda r: r[0])
+    apply_cpu_tuning(best_tuning)
+    cache = _load_autotune_cache()
+    cache[_machine_key(profile_name)] = {**asdict(best_tuning), "seconds": round(best_seconds, 3),
+                                         "tuned": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    AUTOTUNE_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = AUTOTUNE_CACHE_PATH.with_name(f".{AUTOTUNE_CACHE_PATH.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_path, AUTOTUNE_CACHE_PATH)
+    return best_tuning
@@ -0,0 +1,66 @@
+# Content-hash deduplication pre-pass: byte-identical images are captioned once and the caption is
+# copied to every duplicate. Files are grouped by size first, so only same-size candidates are hashed.
+# Qt-free; used by the GUI batch and the CLI.
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from joycaption_contenthash import hash_file_contents
+
+DEFAULT_HASH_WORKERS = min(16, (os.cpu_count() or 4) * 2) # I/O bound; more threads help on network shares
+
+
+@dataclass
+class DedupResult:
+    unique: List[Path] # First occurrence of every distinct content, in input order
+    duplicates: Dict[Path, List[Path]] = field(default_factory=dict) # representative -> its byte-identical copies
+    hashed_count: int = 0 # Files that actually had to be hashed (size collisions)
+    digests: Dict[Path, str] = field(default_factory=dict) # hash_file_contents() of every hashed file, for the feature cache
+
+    @property
+    def duplicate_count(self) -> int:
+        """Generations saved by captioning each content once."""
+        return sum(len(copies) for copies in self.duplicates.values())
+
+
+def find_duplicates(paths: List[Path], num_workers: int = DEFAULT_HASH_WORKERS,
+                    progress_callback: Optional[Callable[[int, int], None]] = None) -> DedupResult:
+    """
+    Groups `paths` by content. Files whose size is unique are never read. Unreadable files are
+    treated as unique so the caption pass reports their error as usual.
+    """
+    by_size: Dict[int, List[Path]] = defaultdict(list)
+    for path in paths:
+        try:
+            by_size[path.stat().st_size].append(path)
+        except OSError:
+            continue # Never hashed, so it stays unique
+    candidates = [path for group in by_size.values() if len(group) > 1 for path in group]
+
+    digests: Dict[Path, str] = {}
+    if candidates:
+        with ThreadPoolExecutor(max_workers=max(1, num_workers), thread_name_prefix="dedup") as executor:
+            futures = {path: executor.submit(hash_file_contents, path) for path in candidates}
+            for done_count, (path, future) in enumerate(futures.items(), start=1):
+                try:
+                    digests[path] = future.result()
+                except OSError as e:
+                    print(f"Error hashing {path}: {e}")
+                if progress_callback:
+                    progress_callback(done_count, len(candidates))
+
+    result = DedupResult(unique=[], hashed_count=len(candidates), digests=digests)
+    representative_of: Dict[str, Path] = {}
+    for path in paths:
+        digest = digests.get(path)
+        if digest is None:
+            result.unique.append(path)
+        elif digest in representative_of:
+            result.duplicates.setdefault(representative_of[digest], []).append(path)
+        else:
+            representative_of[digest] = path
+            result.unique.append(path)
+    return result
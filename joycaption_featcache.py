@@ -0,0 +1,156 @@
+# Persistent cache of projected vision features (vision tower + multi_modal_projector output).
+# One safetensors file per image, keyed by the image's content hash, under a namespace derived from the
+# model revision and processor config so a different checkpoint or preprocessing never reuses stale features.
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional, Tuple
+
+from joycaption_contenthash import hash_file_contents
+
+if TYPE_CHECKING:
+    import torch # Imported lazily at runtime; see joycaption_core
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "joycaption" / "features"
+DEFAULT_BUDGET_BYTES = 8 * 1024 * 1024 * 1024 # ~1300 images at 729 x 4096 bf16
+PRUNE_TARGET_FRACTION = 0.9 # Evict down to this share of the budget, so a full cache is not rescanned on every write
+
+
+def feature_namespace(model, processor) -> str:
+    """Identifies everything that influences the features besides the pixels."""
+    config = model.config
+    parts = {
+        "model": getattr(config, "name_or_path", None),
+        "revision": getattr(config, "_commit_hash", None), # Set by from_pretrained for hub snapshots
+        "dtype": str(model.dtype),
+        "load_in_4bit": bool(getattr(model, "is_loaded_in_4bit", False)),
+        "vision_feature_layer": getattr(config, "vision_feature_layer", None),
+        "vision_feature_select_strategy": getattr(config, "vision_feature_select_strategy", None),
+        "image_processor": processor.image_processor.to_dict(),
+    }
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+class FeatureCache:
+    """
+    Thread-safe. lookup()/get() run on prefetch threads; put() hands the write to a background thread
+    so the generating thread never waits on disk. The writer keeps a running size total and prunes least
+    recently used entries (by mtime) as soon as the byte budget is exceeded; close() prunes once more.
+    """
+
+    def __init__(self, namespace: str, cache_dir: Path = DEFAULT_CACHE_DIR, budget_bytes: int = DEFAULT_BUDGET_BYTES):
+        self.cache_dir = cache_dir / namespace
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.budget_bytes = budget_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._writing = set() # Keys queued for writing; avoids duplicate writes for repeated images
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="featcache")
+        self._closed = False
+        self._total_bytes: Optional[int] = None # Writer thread only; measured before the first write
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.safetensors"
+
+    def get(self, key: str) -> Optional["torch.Tensor"]:
+        """Returns the (image_tokens, hidden) CPU tensor, or None on a miss."""
+        from safetensors.torch import load_file
+        entry_path = self._entry_path(key)
+        try:
+            features = load_file(str(entry_path))["features"]
+            os.utime(entry_path) # mtime doubles as the LRU timestamp
+        except FileNotFoundError:
+            features = None
+        except Exception as e:
+            print(f"Discarding unreadable feature cache entry {entry_path}: {e}")
+            entry_path.unlink(missing_ok=True)
+            features = None
+        with self._lock:
+            if features is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return features
+
+    def lookup(self, image_path: Path, content_hash: Optional[str] = None) -> Tuple[str, Optional["torch.Tensor"]]:
+        """`content_hash`: hash_file_contents() of the file if already known (e.g. from the dedup pre-pass)."""
+        key = content_hash or hash_file_contents(image_path)
+        return key, self.get(key)
+
+    def put(self, key: str, features: "torch.Tensor"):
+        features = features.detach().to("cpu").contiguous()
+        with self._lock:
+            if self._closed or key in self._writing:
+                return
+            self._writing.add(key)
+        self._writer.submit(self._write, key, features)
+
+    def _write(self, key: str, features: "torch.Tensor"):
+        from safetensors.torch import save_file
+        entry_path = self._entry_path(key)
+        tmp_path = entry_path.with_suffix(".tmp")
+        try:
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, size, _ in self._entries())
+            try:
+                replaced_bytes = entry_path.stat().st_size
+            except FileNotFoundError:
+                replaced_bytes = 0
+            entry_path.parent.mkdir(exist_ok=True)
+            save_file({"features": features}, str(tmp_path))
+            os.replace(tmp_path, entry_path) # Readers never see a half-written file
+            self._total_bytes += entry_path.stat().st_size - replaced_bytes
+            if self._total_bytes > self.budget_bytes:
+                self.prune()
+        except OSError as e:
+            print(f"Error writing feature cache entry {entry_path}: {e}")
+            tmp_path.unlink(missing_ok=True)
+        finally:
+            with self._lock:
+                self._writing.discard(key)
+
+    def _entries(self):
+        entries = []
+        for entry_path in self.cache_dir.glob("*/*.safetensors"):
+            try:
+                st = entry_path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry_path))
+        return entries
+
+    def prune(self):
+        """
+        If the cache exceeds the byte budget, evicts least-recently-used entries down to PRUNE_TARGET_FRACTION
+        of it. Runs on the writer thread (or from close() once the writer has stopped).
+        """
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        if total > self.budget_bytes:
+            target = self.budget_bytes * PRUNE_TARGET_FRACTION
+            entries.sort()
+            freed, evicted = 0, 0
+            for _, size, entry_path in entries:
+                if total - freed <= target:
+                    break
+                entry_path.unlink(missing_ok=True)
+                freed += size
+                evicted += 1
+            total -= freed
+            print(f"Feature cache: evicted {evicted} entries ({freed / 1e6:.1f} MB) from {self.cache_dir}")
+        self._total_bytes = total
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._writer.shutdown(wait=True)
+        try:
+            self.prune() # Safety net; normally a no-op since writes already keep the cache within budget
+        except OSError as e:
+            print(f"Error pruning feature cache {self.cache_dir}: {e}")
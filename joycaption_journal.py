@@ -0,0 +1,78 @@
+# Append-only progress journal for batch runs: one JSON line per captioned image, fsynced per batch,
+# so a crash or a closed window never costs the GPU time already spent. Qt-free; used by the GUI and CLI.
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from joycaption_core import dataset_state_path
+
+JOURNAL_FILENAME = ".joycaption_journal.jsonl"
+FALLBACK_JOURNAL_DIR = Path.home() / ".cache" / "joycaption" / "journals"
+
+# Captions of one image: sidecar slug -> caption. "" is the plain img.txt caption.
+CaptionsBySlug = Dict[str, str]
+
+
+def prompts_key(prompts: List[str]) -> str:
+    """Identifies a run configuration; only entries written with the same prompts count as done."""
+    return hashlib.sha1("\x1f".join(prompts).encode("utf-8")).hexdigest()[:16]
+
+
+class BatchJournal:
+    """Thread-safe; record() is called from the inference thread, completed() from the UI thread."""
+
+    def __init__(self, dataset_dir: Path, key: str):
+        self.path = dataset_state_path(dataset_dir, JOURNAL_FILENAME, FALLBACK_JOURNAL_DIR)
+        self.key = key
+        self._lock = threading.Lock()
+        self._file = None
+
+    def completed(self) -> Dict[str, CaptionsBySlug]:
+        """Images already captioned with this run's prompts (str(path) -> captions); later entries win."""
+        done: Dict[str, CaptionsBySlug] = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue # Torn final line from a crash mid-write
+                    if entry.get("key") == self.key:
+                        done[entry["path"]] = entry["captions"]
+        except FileNotFoundError:
+            pass
+        return done
+
+    def record(self, captions_by_path: Dict[str, CaptionsBySlug]):
+        """Appends one line per image and fsyncs once for the whole batch."""
+        if not captions_by_path:
+            return
+        now = time.time()
+        lines = "".join(
+            json.dumps({"key": self.key, "path": path, "captions": captions, "t": now}, ensure_ascii=False) + "\n"
+            for path, captions in captions_by_path.items()
+        )
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(lines)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def reset(self):
+        """Forgets every entry (all run configurations); used when the user starts over."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self.path.unlink(missing_ok=True)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
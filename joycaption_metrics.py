@@ -0,0 +1,161 @@
+# Per-stage timing of the captioning hot path: image load, preprocessing (processor call), prefill, per-token
+# decode and caption save. Timings go into fixed-bucket histograms (cheap to update from any thread) and,
+# optionally, a JSONL trace with one event per timed call. Histograms can be written as a Prometheus textfile
+# for node_exporter's textfile collector. Also reports the process's peak memory (CLI summary, benchmarks).
+# Qt-free; the GUI polls summary() for its status bar.
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+STAGE_IMAGE_LOAD = "image_load" # Decode + RGB convert (gallery display or prefetch)
+STAGE_PREPROCESS = "preprocess" # Chat template + processor (tokenize, resize, normalize)
+STAGE_PREFILL = "prefill" # generate() start to first token, per batch
+STAGE_DECODE_TOKEN = "decode_token" # Mean time per decode step after the first token, per batch
+STAGE_CAPTION_SAVE = "caption_save" # Atomic sidecar write
+STAGES = (STAGE_IMAGE_LOAD, STAGE_PREPROCESS, STAGE_PREFILL, STAGE_DECODE_TOKEN, STAGE_CAPTION_SAVE)
+STAGE_SHORT_NAMES = {STAGE_IMAGE_LOAD: "load", STAGE_PREPROCESS: "prep", STAGE_PREFILL: "prefill",
+                     STAGE_DECODE_TOKEN: "decode/tok", STAGE_CAPTION_SAVE: "save"}
+
+# Upper bounds in seconds; 0.5 ms (a cached decode step) up to a minute (a cold prefill of a large batch).
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PROMETHEUS_METRIC = "joycaption_stage_seconds"
+
+
+class Histogram:
+    """Prometheus-style histogram. Not locked itself; StageMetrics serializes access."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # Last slot: above the largest bound (+Inf)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        idx = 0
+        while idx < len(self.buckets) and value > self.buckets[idx]:
+            idx += 1
+        self.counts[idx] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimated by linear interpolation inside the bucket, like PromQL's histogram_quantile()."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for idx, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                if idx == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[idx - 1] if idx else 0.0
+                return lower + (self.buckets[idx] - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+
+class StageMetrics:
+    """Thread-safe registry of one histogram per stage, plus the optional JSONL trace."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+        self._trace_file = None
+
+    def observe(self, stage: str, seconds: float, **fields):
+        """Records one timing; `fields` (e.g. batch size, token count) only go into the trace."""
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+            if self._trace_file is not None:
+                event = {"ts": round(time.time(), 6), "stage": stage, "seconds": round(seconds, 6),
+                         "thread": threading.current_thread().name, **fields}
+                self._trace_file.write(json.dumps(event) + "\n")
+
+    @contextmanager
+    def time(self, stage: str, **fields) -> Iterator[None]:
+        """Times the block; a block that raises is not recorded."""
+        start = time.perf_counter()
+        yield
+        self.observe(stage, time.perf_counter() - start, **fields)
+
+    def quantile(self, stage: str, q: float) -> Optional[float]:
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            return histogram.quantile(q) if histogram else None
+
+    def summary(self) -> str:
+        """p50 per stage seen so far, e.g. 'load 12ms · prep 31ms · prefill 420ms · decode/tok 38ms'."""
+        parts = []
+        for stage in STAGES:
+            value = self.quantile(stage, 0.5)
+            if value is not None:
+                parts.append(f"{STAGE_SHORT_NAMES[stage]} {value * 1000:.0f}ms" if value >= 0.001 else
+                             f"{STAGE_SHORT_NAMES[stage]} {value * 1000:.1f}ms")
+        return " · ".join(parts)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def start_trace(self, path: Path):
+        """Appends one JSON line per observation to `path` until stop_trace(). Line-buffered, so it can be tailed."""
+        with self._lock:
+            if self._trace_file is not None:
+                self._trace_file.close()
+            self._trace_file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def stop_trace(self):
+        with self._lock:
+            if self._trace_file is not None:
+                self._trace_file.close()
+                self._trace_file = None
+
+    def prometheus_text(self) -> str:
+        lines = [f"# HELP {PROMETHEUS_METRIC} Time spent per captioning pipeline stage.",
+                 f"# TYPE {PROMETHEUS_METRIC} histogram"]
+        with self._lock:
+            for stage in sorted(self._histograms):
+                histogram = self._histograms[stage]
+                cumulative = 0
+                bounds: List[str] = [f"{bound:g}" for bound in histogram.buckets] + ["+Inf"]
+                for bound, bucket_count in zip(bounds, histogram.counts):
+                    cumulative += bucket_count
+                    lines.append(f'{PROMETHEUS_METRIC}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{PROMETHEUS_METRIC}_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+                lines.append(f'{PROMETHEUS_METRIC}_count{{stage="{stage}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: Path):
+        """Writes the textfile atomically; the collector must never read a partial file."""
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+
+def peak_memory_bytes() -> Dict[str, Optional[int]]:
+    """Peak host RSS and CUDA allocation of this process; None where unknown (RSS on Windows, CUDA without a GPU)."""
+    import torch
+    result: Dict[str, Optional[int]] = {"rss": None, "cuda": None}
+    try:
+        import resource
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        result["rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    except ImportError: # Windows
+        pass
+    if torch.cuda.is_available():
+        result["cuda"] = torch.cuda.max_memory_allocated()
+    return result
+
+
+# Process-wide registry used by the instrumented code paths (core, writer, GUI).
+METRICS = StageMetrics()
@@ -0,0 +1,275 @@
+# Multi-replica captioning: N model replicas in separate (spawned) processes, each pinned to one device
+# or to its own set of CPU cores. The parent hands each batch to the least busy replica through that replica's
+# own task queue, so it always knows which batches a replica owns; if a replica dies, they go to a survivor.
+# Results come back over one pipe per replica (no lock shared between replicas that a killed one could leave
+# held) and are collected in the parent as they complete. Qt-free; the CLI uses it for --replicas.
+import multiprocessing as mp
+import time
+from multiprocessing.connection import wait as wait_connections
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+READY_TIMEOUT_S = 1800 # Model loads from a cold disk cache can be slow
+MAX_TASK_RETRIES = 1 # A batch whose replica died is moved to a survivor this often, then failed (it may be the cause)
+
+
+@dataclass
+class ReplicaSpec:
+    device: str # "cuda:N" or "cpu"
+    cpu_cores: Optional[List[int]] = None # CPU affinity; also sets torch's thread count
+
+
+@dataclass
+class PoolResult:
+    task_id: int
+    worker_idx: int
+    paths: List[Path] # Images that decoded and generated, in order
+    captions: List[List[str]] # Per path: one caption per prompt
+    failed: Dict[Path, str] = field(default_factory=dict) # path -> error message
+    elapsed_s: float = 0.0
+
+
+@dataclass
+class _Task:
+    paths: List[Path]
+    prompts: List[str]
+    worker_idx: int # Replica that owns it
+    attempts: int = 1
+
+
+def plan_replicas(num_replicas: Optional[int] = None, use_cuda: Optional[bool] = None) -> List[ReplicaSpec]:
+    """
+    One replica per GPU by default; on CPU, the available cores are split into equal contiguous sets, listed
+    node by node so that a replica count that is a multiple of the NUMA node count keeps each replica node-local.
+    """
+    import torch
+    if use_cuda is None:
+        use_cuda = torch.cuda.is_available()
+    if use_cuda:
+        gpu_count = torch.cuda.device_count()
+        num_replicas = num_replicas or gpu_count
+        return [ReplicaSpec(device=f"cuda:{i % gpu_count}") for i in range(num_replicas)]
+
+    from joycaption_cpu import numa_nodes
+    cores = [core for node in numa_nodes() for core in node]
+    num_replicas = max(1, min(num_replicas or 1, len(cores)))
+    per_replica = len(cores) // num_replicas
+    return [ReplicaSpec(device="cpu", cpu_cores=cores[i * per_replica:(i + 1) * per_replica]) for i in range(num_replicas)]
+
+
+def _worker_main(worker_idx: int, spec: ReplicaSpec, model_config: dict, gen_config: dict,
+                 task_queue, result_conn):
+    """Runs in a spawned process: pin, load one replica, then caption tasks until a None sentinel."""
+    import torch
+    from PIL import Image
+    from joycaption_core import PrefixKVCache, load_model, prepare_fanout_inputs, generate_from_inputs, resolve_image_features
+    from joycaption_cpu import CpuTuning, apply_cpu_tuning
+
+    cpu_tuning = None
+    if spec.cpu_cores:
+        cpu_tuning = CpuTuning(intra_op_threads=len(spec.cpu_cores), cores=spec.cpu_cores)
+        apply_cpu_tuning(cpu_tuning)
+    if spec.device.startswith("cuda"):
+        torch.cuda.set_device(spec.device)
+
+    load_start = time.perf_counter()
+    try:
+        if model_config.get("tiny"):
+            from joycaption_tiny import build_tiny_model
+            processor, model, load_message = build_tiny_model(model_config["model_path"])
+            model.to(spec.device)
+        else:
+            processor, model, load_message = load_model(
+                model_config["model_path"], precision=model_config.get("precision", "auto"), device=spec.device,
+                use_quantized_cache=model_config.get("quantized_cache", True), cpu_tuning=cpu_tuning
+            )
+    except Exception as e:
+        result_conn.send(("load_error", worker_idx, str(e)))
+        return
+    result_conn.send(("ready", worker_idx, f"{load_message} [{spec.device}] in {time.perf_counter() - load_start:.1f}s"))
+    prefix_cache = PrefixKVCache(model) if gen_config.get("prefix_cache", True) else None
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            return
+        task_id, paths, prompts = task
+        start = time.perf_counter()
+        result = PoolResult(task_id=task_id, worker_idx=worker_idx, paths=[], captions=[])
+        images = []
+        for img_path in paths:
+            try:
+                images.append(Image.open(img_path).convert("RGB"))
+                result.paths.append(img_path)
+            except Exception as e:
+                result.failed[img_path] = str(e)
+        if images:
+            try:
+                inputs = prepare_fanout_inputs(processor, images, prompts)
+                image_features = resolve_image_features(model, inputs, len(prompts)) if len(prompts) > 1 else None
+                captions = generate_from_inputs(
+                    model, processor, inputs, gen_config["temperature"], gen_config["top_p"],
+                    gen_config["max_new_tokens"], prefix_cache=prefix_cache, image_features=image_features
+                )
+                result.captions = [captions[i * len(prompts):(i + 1) * len(prompts)] for i in range(len(images))]
+            except Exception as e:
+                result.failed.update({img_path: str(e) for img_path in result.paths})
+                result.paths, result.captions = [], []
+        result.elapsed_s = time.perf_counter() - start
+        result_conn.send(("result", worker_idx, result))
+
+
+class CaptionPool:
+    """
+    Owns the replica processes. submit() batches, then read results from results(); map_batches() does
+    both with a bounded number of batches in flight. Use as a context manager or call close().
+    A replica that dies has its batches moved to the others (or failed with its exit code, see MAX_TASK_RETRIES);
+    the pool only raises once no replica is left.
+    """
+
+    def __init__(self, specs: List[ReplicaSpec], model_config: dict, gen_config: dict):
+        ctx = mp.get_context("spawn") # CUDA cannot be re-initialised in a forked child
+        self.specs = specs
+        self._task_queues = [ctx.Queue() for _ in specs]
+        result_pipes = [ctx.Pipe(duplex=False) for _ in specs]
+        self._result_conns = {idx: reader for idx, (reader, _) in enumerate(result_pipes)} # Open ones only
+        self._messages: Deque[Tuple[str, int, object]] = deque() # Received, or made up for batches of dead replicas
+        self._tasks: Dict[int, _Task] = {} # In flight: submitted, no result yet
+        self._next_task_id = 0
+        self._ready: Set[int] = set()
+        self._dead: Set[int] = set()
+        self._processes = [
+            ctx.Process(target=_worker_main, args=(idx, spec, model_config, gen_config, self._task_queues[idx],
+                                                   result_pipes[idx][1]),
+                        name=f"caption-replica-{idx}", daemon=True)
+            for idx, spec in enumerate(specs)
+        ]
+        for process, (_, writer) in zip(self._processes, result_pipes):
+            process.start()
+            writer.close() # Only the replica writes; its end of the pipe then reports EOF when it dies
+
+    @property
+    def _in_flight(self) -> int:
+        return len(self._tasks)
+
+    def _get(self, timeout: float):
+        """Next message from the workers; raises on a load error and checks for dead replicas while waiting."""
+        deadline = time.monotonic() + timeout
+        while True:
+            self._check_workers() # Cheap (a non-blocking waitpid per replica), so a death is noticed under load too
+            if not self._messages:
+                for conn in wait_connections(list(self._result_conns.values()), timeout=1.0):
+                    try:
+                        self._messages.append(conn.recv())
+                    except (EOFError, OSError): # Replica exited; _check_workers() handles its batches
+                        idx = next(idx for idx, other in self._result_conns.items() if other is conn)
+                        del self._result_conns[idx]
+                        conn.close()
+            if not self._messages:
+                if time.monotonic() > deadline:
+                    raise TimeoutError("Timed out waiting for caption replicas.")
+                continue
+            message = self._messages.popleft()
+            kind, worker_idx, payload = message
+            if kind == "load_error":
+                raise RuntimeError(f"Replica {worker_idx} failed to load the model: {payload}")
+            if kind == "ready":
+                self._ready.add(worker_idx)
+            return message
+
+    def _check_workers(self):
+        """Moves the batches of newly dead replicas to live ones; raises if a replica died loading or none is left."""
+        for worker_idx, process in enumerate(self._processes):
+            if worker_idx in self._dead or process.is_alive():
+                continue
+            self._dead.add(worker_idx)
+            self._task_queues[worker_idx].cancel_join_thread() # Nobody reads it any more; don't block exit on it
+            if worker_idx not in self._ready:
+                raise RuntimeError(f"Replica {worker_idx} exited with code {process.exitcode} before loading the model.")
+            if len(self._dead) == len(self._processes):
+                exit_codes = ", ".join(str(p.exitcode) for p in self._processes)
+                raise RuntimeError(f"All caption replicas exited unexpectedly (exit codes {exit_codes}).")
+            for task_id, task in list(self._tasks.items()):
+                if task.worker_idx != worker_idx:
+                    continue
+                if task.attempts > MAX_TASK_RETRIES:
+                    message = f"Replica {worker_idx} exited with code {process.exitcode}"
+                    self._messages.append(("result", worker_idx, PoolResult(
+                        task_id=task_id, worker_idx=worker_idx, paths=[], captions=[],
+                        failed={img_path: message for img_path in task.paths}
+                    )))
+                else:
+                    print(f"Replica {worker_idx} exited with code {process.exitcode}; retrying batch {task_id}.")
+                    task.attempts += 1
+                    self._dispatch(task_id, task)
+
+    def _dispatch(self, task_id: int, task: _Task):
+        """Hands the task to the live replica that owns the fewest batches."""
+        load = {idx: 0 for idx in range(len(self._processes)) if idx not in self._dead}
+        for other in self._tasks.values():
+            if other is not task and other.worker_idx in load:
+                load[other.worker_idx] += 1
+        task.worker_idx = min(load, key=load.__getitem__)
+        self._tasks[task_id] = task
+        self._task_queues[task.worker_idx].put((task_id, task.paths, task.prompts))
+
+    def _next_result(self, timeout: float) -> PoolResult:
+        while True:
+            kind, _, payload = self._get(timeout)
+            # A result can arrive twice if its replica died right after sending it and the batch was retried
+            if kind == "result" and self._tasks.pop(payload.task_id, None) is not None:
+                return payload
+
+    def wait_ready(self, timeout: float = READY_TIMEOUT_S) -> List[str]:
+        """Blocks until every replica has loaded its model; returns their load messages."""
+        messages = []
+        while len(messages) < len(self._processes):
+            kind, _, payload = self._get(timeout)
+            if kind == "ready":
+                messages.append(payload)
+        return messages
+
+    def submit(self, paths: List[Path], prompts: List[str]) -> int:
+        task_id = self._next_task_id
+        self._next_task_id += 1
+        self._dispatch(task_id, _Task(paths=list(paths), prompts=list(prompts), worker_idx=-1))
+        return task_id
+
+    def results(self, timeout: float = READY_TIMEOUT_S) -> Iterator[PoolResult]:
+        """Yields results of submitted batches in completion order until none are in flight."""
+        while self._in_flight:
+            yield self._next_result(timeout)
+
+    def map_batches(self, batches: Iterable[List[Path]], prompts: List[str],
+                    max_in_flight: Optional[int] = None) -> Iterator[PoolResult]:
+        """Keeps every replica busy (two batches each by default) while pulling batches lazily."""
+        max_in_flight = max_in_flight or 2 * len(self._processes)
+        batches = iter(batches)
+        exhausted = False
+        while True:
+            while not exhausted and self._in_flight < max_in_flight:
+                batch = next(batches, None)
+                if batch is None:
+                    exhausted = True
+                else:
+                    self.submit(batch, prompts)
+            if not self._in_flight:
+                return
+            yield self._next_result(READY_TIMEOUT_S)
+
+    def close(self, timeout: float = 30.0):
+        for task_queue in self._task_queues:
+            task_queue.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                print(f"{process.name} did not exit, terminating.")
+                process.terminate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,266 @@
+# Qt helpers shared by Run_GUI.py and Run_gui_4bit.py (the headless CLI never imports this module).
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Dict, Optional
+
+from PIL import Image
+from PyQt5.QtCore import Qt, QObject, QAbstractListModel, QModelIndex, pyqtSignal
+from PyQt5.QtGui import QImage, QPixmap, QColor
+
+from joycaption_core import load_thumbnail_image, encode_thumbnail
+from joycaption_metrics import METRICS, STAGE_IMAGE_LOAD
+from joycaption_thumbcache import ThumbnailCache
+
+
+def pil_to_qimage(pil_image: Image.Image) -> QImage:
+    rgb_image = pil_image if pil_image.mode == "RGB" else pil_image.convert("RGB")
+    data = rgb_image.tobytes("raw", "RGB")
+    qimage = QImage(data, rgb_image.width, rgb_image.height, 3 * rgb_image.width, QImage.Format_RGB888)
+    return qimage.copy() # Detach from the Python bytes buffer
+
+
+# --- One decode per image, shared by inference (PIL) and the preview (QImage + scaled pixmaps) ---
+class _DecodedEntry:
+    __slots__ = ("pil", "qimage", "scaled")
+
+    def __init__(self, pil: Image.Image):
+        self.pil = pil
+        self.qimage: Optional[QImage] = None # Built lazily on first display
+        self.scaled: "OrderedDict[tuple, QPixmap]" = OrderedDict() # (w, h) -> pixmap
+
+    def nbytes(self) -> int:
+        # RGB PIL buffer + RGB888 QImage (when built); scaled pixmaps are label-sized and negligible
+        pil_bytes = self.pil.width * self.pil.height * 3
+        return pil_bytes * (2 if self.qimage is not None else 1)
+
+
+class DecodedImageCache:
+    """LRU of decoded images bounded by bytes. UI-thread only (QPixmap)."""
+    MAX_SCALED_PER_IMAGE = 4
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Path, _DecodedEntry]" = OrderedDict()
+
+    def get_pil(self, image_path: Path) -> Image.Image:
+        entry = self._entries.get(image_path)
+        if entry is None:
+            with METRICS.time(STAGE_IMAGE_LOAD, source="display"): # Misses only; hits would skew the stage
+                with Image.open(image_path) as img:
+                    pil_image = img.convert("RGB")
+            entry = self._insert(image_path, pil_image)
+        self._entries.move_to_end(image_path)
+        return entry.pil
+
+    def put_pil(self, image_path: Path, pil_image: Image.Image):
+        """Adopts an image decoded elsewhere (e.g. by the batch prefetcher) so the preview never re-decodes it."""
+        if image_path not in self._entries:
+            self._insert(image_path, pil_image)
+
+    def scaled_pixmap(self, image_path: Path, width: int, height: int) -> QPixmap:
+        self.get_pil(image_path) # Decodes once if needed
+        entry = self._entries[image_path]
+        if entry.qimage is None:
+            entry.qimage = pil_to_qimage(entry.pil)
+            self._evict()
+        if width <= 0 or height <= 0:
+            return QPixmap.fromImage(entry.qimage)
+
+        key = (width, height)
+        pixmap = entry.scaled.get(key)
+        if pixmap is None:
+            # Scale the QImage first: converting a 40+ MP image to a pixmap just to shrink it is wasted work
+            pixmap = QPixmap.fromImage(entry.qimage.scaled(width, height, Qt.KeepAspectRatio, Qt.SmoothTransformation))
+            entry.scaled[key] = pixmap
+            while len(entry.scaled) > self.MAX_SCALED_PER_IMAGE:
+                entry.scaled.popitem(last=False)
+        else:
+            entry.scaled.move_to_end(key)
+        return pixmap
+
+    def clear(self):
+        self._entries.clear()
+
+    def _insert(self, image_path: Path, pil_image: Image.Image) -> _DecodedEntry:
+        entry = _DecodedEntry(pil_image)
+        self._entries[image_path] = entry
+        self._evict()
+        return entry
+
+    def _evict(self):
+        total = sum(e.nbytes() for e in self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1: # Always keep the most recent image
+            _, evicted = self._entries.popitem(last=False)
+            total -= evicted.nbytes()
+
+
+# --- Background thumbnail decoding ---
+class ThumbnailLoader(QObject):
+    """Decodes thumbnails on a thread pool. Newest requests are served first, so scrolling stays snappy."""
+    thumbnail_ready = pyqtSignal(object, QImage) # Path, thumbnail (null QImage on failure)
+
+    MAX_PENDING = 512 # Older requests beyond this are dropped; they are re-requested if scrolled back into view
+
+    def __init__(self, height: int, num_workers: int = 4, parent=None):
+        super().__init__(parent)
+        self.height = height
+        self._executor = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="thumbs")
+        self._lock = threading.Lock()
+        self._pending: List[Path] = [] # Stack: last requested = next decoded
+        self._queued: set = set()
+        self._shut_down = False
+        self.cache: Optional[ThumbnailCache] = None
+
+    def set_cache(self, cache: Optional[ThumbnailCache]):
+        """
+        Swaps the persistent cache. The previous one is closed (pruned to its budget) on the worker pool, since
+        the prune scans the whole SQLite file and set_paths runs on the UI thread; after shutdown(), inline.
+        """
+        previous, self.cache = self.cache, cache
+        if previous is None:
+            return
+        if self._shut_down:
+            previous.close()
+        else:
+            self._executor.submit(previous.close) # Decodes still holding it see a closed cache and skip it
+
+    def request(self, image_path: Path):
+        with self._lock:
+            if image_path in self._queued:
+                return
+            self._queued.add(image_path)
+            self._pending.append(image_path)
+            if len(self._pending) > self.MAX_PENDING:
+                dropped = self._pending.pop(0)
+                self._queued.discard(dropped)
+        self._executor.submit(self._decode_newest)
+
+    def cancel_all(self):
+        with self._lock:
+            self._pending.clear()
+            self._queued.clear()
+
+    def shutdown(self):
+        self.cancel_all()
+        self._executor.shutdown(wait=True) # Also waits for closes handed to the pool by set_cache
+        self._shut_down = True
+        self.set_cache(None)
+
+    def _decode_newest(self):
+        with self._lock:
+            if not self._pending:
+                return
+            image_path = self._pending.pop()
+        try:
+            qimage = self._load(image_path)
+        except Exception as e:
+            print(f"Error creating thumbnail for {image_path}: {e}")
+            qimage = QImage()
+        with self._lock:
+            self._queued.discard(image_path)
+        self.thumbnail_ready.emit(image_path, qimage)
+
+    def _load(self, image_path: Path) -> QImage:
+        cache = self.cache
+        if cache is None:
+            return pil_to_qimage(load_thumbnail_image(image_path, self.height))
+
+        st = os.stat(image_path)
+        data = cache.get(image_path, st.st_size, st.st_mtime_ns)
+        if data is not None:
+            qimage = QImage.fromData(data, "JPEG")
+            if not qimage.isNull():
+                return qimage
+
+        thumb = load_thumbnail_image(image_path, self.height)
+        cache.put(image_path, st.st_size, st.st_mtime_ns, encode_thumbnail(thumb))
+        return pil_to_qimage(thumb)
+
+
+# --- Virtualized gallery model: only rows the view actually paints ever get decoded ---
+class ThumbnailListModel(QAbstractListModel):
+    PathRole = Qt.UserRole + 1
+    MAX_CACHED_PIXMAPS = 2000 # Bounds memory on huge directories; evicted rows are re-decoded on demand
+
+    def __init__(self, thumbnail_height: int, parent=None):
+        super().__init__(parent)
+        self.thumbnail_height = thumbnail_height
+        self._paths: List[Path] = []
+        self._row_of: Dict[Path, int] = {}
+        self._pixmaps: "OrderedDict[Path, QPixmap]" = OrderedDict()
+        self._failed: set = set()
+        self._placeholder = QPixmap(thumbnail_height, thumbnail_height)
+        self._placeholder.fill(QColor("#808080"))
+        self.loader = ThumbnailLoader(thumbnail_height, parent=self)
+        self.loader.thumbnail_ready.connect(self._on_thumbnail_ready)
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._paths)
+
+    def data(self, index: QModelIndex, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._paths):
+            return None
+        image_path = self._paths[index.row()]
+        if role == Qt.DecorationRole:
+            pixmap = self._pixmaps.get(image_path)
+            if pixmap is not None:
+                self._pixmaps.move_to_end(image_path)
+                return pixmap
+            if image_path not in self._failed:
+                self.loader.request(image_path)
+            return self._placeholder
+        if role == Qt.DisplayRole:
+            return f"Err: {image_path.name[:15]}..." if image_path in self._failed else None
+        if role == Qt.ToolTipRole:
+            return f"Error loading thumbnail for {image_path.name}" if image_path in self._failed else image_path.name
+        if role == self.PathRole:
+            return image_path
+        return None
+
+    def set_paths(self, paths: List[Path], cache: Optional[ThumbnailCache] = None):
+        self.beginResetModel()
+        self.loader.cancel_all()
+        self.loader.set_cache(cache)
+        self._paths = list(paths)
+        self._row_of = {p: i for i, p in enumerate(self._paths)}
+        self._pixmaps.clear()
+        self._failed.clear()
+        self.endResetModel()
+
+    def append_paths(self, paths: List[Path]):
+        """Adds rows at the end without resetting the model (streaming directory scans)."""
+        if not paths:
+            return
+        first_row = len(self._paths)
+        self.beginInsertRows(QModelIndex(), first_row, first_row + len(paths) - 1)
+        for row, image_path in enumerate(paths, start=first_row):
+            self._paths.append(image_path)
+            self._row_of[image_path] = row
+        self.endInsertRows()
+
+    def row_of(self, image_path: Optional[Path]) -> int:
+        """O(1) position lookup; -1 if the path is not in the model."""
+        return self._row_of.get(image_path, -1) if image_path is not None else -1
+
+    def index_of(self, image_path: Optional[Path]) -> QModelIndex:
+        row = self._row_of.get(image_path) if image_path is not None else None
+        return self.index(row, 0) if row is not None else QModelIndex()
+
+    def shutdown(self):
+        self.loader.shutdown()
+
+    def _on_thumbnail_ready(self, image_path: Path, qimage: QImage):
+        row = self._row_of.get(image_path)
+        if row is None:
+            return # Stale result from a previous directory
+        if qimage.isNull():
+            self._failed.add(image_path)
+        else:
+            self._pixmaps[image_path] = QPixmap.fromImage(qimage)
+            while len(self._pixmaps) > self.MAX_CACHED_PIXMAPS:
+                self._pixmaps.popitem(last=False)
+        index = self.index(row, 0)
+        self.dataChanged.emit(index, index, [Qt.DecorationRole, Qt.DisplayRole, Qt.ToolTipRole])
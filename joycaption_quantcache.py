@@ -0,0 +1,97 @@
+# Cache of pre-quantized (bitsandbytes NF4) checkpoints. The first 4-bit launch quantizes the bf16 weights as
+# usual and saves the result with save_pretrained; later launches load those packed 4-bit weights directly,
+# which reads ~4x less from disk and never holds the full-precision tensors in host RAM.
+# Entries are keyed by model revision + quantization settings + library versions. Qt-free.
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Optional
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "joycaption" / "quantized"
+MANIFEST_FILENAME = "joycaption_quantized.json" # Written last: an entry without it is incomplete
+
+
+def _library_versions() -> dict:
+    """The serialized 4-bit format has changed between releases, so versions are part of the key."""
+    import importlib.metadata
+    versions = {}
+    for package in ("transformers", "bitsandbytes"):
+        try:
+            versions[package] = importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+def _model_revision(model_path: str) -> Optional[str]:
+    """Hub snapshot commit, or for a local directory a fingerprint of its config and weight files."""
+    local_dir = Path(model_path)
+    if local_dir.is_dir():
+        digest = hashlib.sha1()
+        for path in sorted(local_dir.glob("*.json")) + sorted(local_dir.glob("*.safetensors")) + sorted(local_dir.glob("*.bin")):
+            stat = path.stat()
+            digest.update(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+        return f"local-{digest.hexdigest()[:16]}"
+    from transformers import AutoConfig
+    return getattr(AutoConfig.from_pretrained(model_path), "_commit_hash", None)
+
+
+def quantized_cache_key(model_path: str, quantization_settings: dict) -> Optional[str]:
+    """None if the model revision cannot be determined (then nothing is cached, to never serve stale weights)."""
+    revision = _model_revision(model_path)
+    if revision is None:
+        return None
+    parts = {"model": model_path, "revision": revision, "quantization": quantization_settings, **_library_versions()}
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+class QuantizedModelCache:
+    def __init__(self, cache_dir: Path = DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def entry_dir(self, key: str) -> Path:
+        return self.cache_dir / key
+
+    def lookup(self, key: str) -> Optional[Path]:
+        """Directory to pass to from_pretrained, or None if there is no complete entry."""
+        entry_dir = self.entry_dir(key)
+        return entry_dir if (entry_dir / MANIFEST_FILENAME).is_file() else None
+
+    def manifest(self, key: str) -> dict:
+        with open(self.entry_dir(key) / MANIFEST_FILENAME, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def export(self, key: str, model, processor, model_path: str, quantization_settings: dict) -> Path:
+        """
+        Saves a quantized model under `key`. Written to a temporary sibling directory and renamed into place,
+        so a crash or a concurrent launch never leaves a half-written entry behind.
+        """
+        entry_dir = self.entry_dir(key)
+        tmp_dir = self.cache_dir / f".{key}.{os.getpid()}.tmp"
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            model.save_pretrained(tmp_dir, safe_serialization=True)
+            processor.save_pretrained(tmp_dir)
+            manifest = {
+                "model": model_path,
+                "revision": getattr(model.config, "_commit_hash", None),
+                "quantization": quantization_settings,
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                **_library_versions(),
+            }
+            with open(tmp_dir / MANIFEST_FILENAME, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=2, default=str)
+            try:
+                os.rename(tmp_dir, entry_dir)
+            except OSError:
+                if self.lookup(key) is None: # Not just another process winning the race
+                    raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return entry_dir
+
+    def remove(self, key: str):
+        shutil.rmtree(self.entry_dir(key), ignore_errors=True)
@@ -0,0 +1,64 @@
+# Streaming image discovery for large (and nested) datasets. os.scandir reads entry types from the
+# directory listing itself, so no per-file stat; results are yielded directory by directory, so callers
+# can show the first images long before a multi-million file tree has been walked. Qt-free.
+import fnmatch
+import os
+import re
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
+
+from joycaption_core import IMAGE_EXTENSIONS
+
+_DIGITS_RE = re.compile(r"(\d+)")
+
+
+def natural_sort_key(name: str):
+    """'img2' sorts before 'img10'."""
+    return [(0, int(part), "") if part.isdigit() else (1, 0, part.lower()) for part in _DIGITS_RE.split(name) if part]
+
+
+def _matches_any(rel_path: str, name: str, patterns: Iterable[str]) -> bool:
+    """Patterns match either the path relative to the scan root ('sub/*.png') or the bare name ('*_mask.png')."""
+    return any(fnmatch.fnmatch(rel_path, pattern) or fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+
+def scan_images(root: Path, recursive: bool = False, include: Optional[List[str]] = None,
+                exclude: Optional[List[str]] = None, natural_sort: bool = True,
+                extensions: Iterable[str] = IMAGE_EXTENSIONS) -> Iterator[Path]:
+    """
+    Yields image files under `root`, depth-first. Each directory's listing is sorted on its own
+    (natural or plain order), so only one directory is held in memory at a time. `exclude` also
+    prunes matching directories; hidden directories (".name") are skipped when recursing.
+    """
+    extensions = {ext.lower() for ext in extensions}
+    sort_key = (lambda entry: natural_sort_key(entry.name)) if natural_sort else (lambda entry: entry.name)
+    pending_dirs = [root]
+    while pending_dirs:
+        current_dir = pending_dirs.pop()
+        try:
+            with os.scandir(current_dir) as it:
+                entries = sorted(it, key=sort_key)
+        except OSError as e:
+            print(f"Error scanning {current_dir}: {e}")
+            continue
+
+        subdirs = []
+        for entry in entries:
+            rel_path = os.path.relpath(entry.path, root).replace(os.sep, "/")
+            try:
+                if entry.is_dir():
+                    if recursive and not entry.name.startswith(".") and not (exclude and _matches_any(rel_path, entry.name, exclude)):
+                        subdirs.append(Path(entry.path))
+                    continue
+                if not entry.is_file():
+                    continue
+            except OSError:
+                continue
+            if os.path.splitext(entry.name)[1].lower() not in extensions:
+                continue
+            if include and not _matches_any(rel_path, entry.name, include):
+                continue
+            if exclude and _matches_any(rel_path, entry.name, exclude):
+                continue
+            yield Path(entry.path)
+        pending_dirs.extend(reversed(subdirs)) # Stack: visit subdirectories in sorted order
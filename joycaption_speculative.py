@@ -0,0 +1,230 @@
+# Speculative (assisted) decoding. A small text-only draft LM sharing JoyCaption's Llama 3 tokenizer proposes
+# a few tokens, and the captioning model checks them all in one forward pass. Greedy decoding accepts a draft
+# token only if it is the main model's argmax, so captions are the ones plain greedy decoding produces; with
+# sampling, drafts go through the standard rejection rule, so the output distribution is unchanged.
+# The draft never sees the image, so acceptance is highest on the generic parts of a caption. Qt-free.
+import time
+from dataclasses import dataclass
+from threading import Event
+from typing import List, Optional, Tuple
+
+from joycaption_metrics import METRICS, STAGE_DECODE_TOKEN, STAGE_PREFILL
+
+# Same tokenizer as JoyCaption's language model (Llama 3.1 8B), ~1/7 of the parameters.
+DEFAULT_DRAFT_MODEL = "meta-llama/Llama-3.2-1B-Instruct"
+DEFAULT_NUM_DRAFT_TOKENS = 5
+
+
+@dataclass
+class SpeculativeStats:
+    proposed: int = 0 # Draft tokens proposed
+    accepted: int = 0 # ...of which the main model accepted
+    verify_steps: int = 0 # Main model forward passes during decoding
+    generated: int = 0 # Tokens emitted
+
+    @property
+    def acceptance_rate(self) -> float:
+        return self.accepted / self.proposed if self.proposed else 0.0
+
+    @property
+    def tokens_per_step(self) -> float:
+        """Tokens emitted per main model forward; 1.0 is plain decoding."""
+        return self.generated / self.verify_steps if self.verify_steps else 0.0
+
+    def add(self, other: "SpeculativeStats"):
+        self.proposed += other.proposed
+        self.accepted += other.accepted
+        self.verify_steps += other.verify_steps
+        self.generated += other.generated
+
+    def describe(self) -> str:
+        return (f"draft acceptance {self.acceptance_rate:.0%} ({self.accepted}/{self.proposed}), "
+                f"{self.tokens_per_step:.2f} tokens per step")
+
+
+class DraftModel:
+    """A loaded draft LM plus its statistics: `last_stats` covers the latest generate call, `total_stats` all of them."""
+
+    def __init__(self, model, num_draft_tokens: int = DEFAULT_NUM_DRAFT_TOKENS):
+        self.model = model
+        self.num_draft_tokens = max(1, num_draft_tokens)
+        self.last_stats = SpeculativeStats()
+        self.total_stats = SpeculativeStats()
+
+
+def load_draft_model(draft_path: str, main_model, processor, num_draft_tokens: int = DEFAULT_NUM_DRAFT_TOKENS) -> DraftModel:
+    """Loads the draft next to the main model. Raises ValueError if its tokenizer does not match."""
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    draft_tokenizer = AutoTokenizer.from_pretrained(draft_path)
+    sample = "A photograph of a red bicycle leaning against a brick wall, taken at golden hour."
+    if draft_tokenizer.encode(sample, add_special_tokens=False) != processor.tokenizer.encode(sample, add_special_tokens=False):
+        raise ValueError(f"Draft model {draft_path} does not share the captioning model's tokenizer.")
+
+    dtype = main_model.dtype
+    if getattr(main_model, "is_loaded_in_4bit", False) or getattr(main_model, "is_loaded_in_8bit", False):
+        dtype = torch.float16 # The quantized models compute in fp16
+    model = AutoModelForCausalLM.from_pretrained(draft_path, torch_dtype=dtype, device_map={"": main_model.device},
+                                                 low_cpu_mem_usage=True)
+    model.eval()
+    return DraftModel(model, num_draft_tokens)
+
+
+def _probs(logits, temperature: float, top_p: float):
+    """Sampling distribution after temperature and nucleus filtering, like generate()'s warpers."""
+    import torch
+    probs = torch.softmax(logits.float() / temperature, dim=-1)
+    if top_p < 1.0:
+        sorted_probs, sorted_idx = probs.sort(descending=True)
+        outside = sorted_probs.cumsum(-1) - sorted_probs > top_p # Keeps the token that crosses top_p
+        sorted_probs[outside] = 0.0
+        probs = torch.zeros_like(probs).scatter_(-1, sorted_idx, sorted_probs)
+        probs = probs / probs.sum(-1, keepdim=True)
+    return probs
+
+
+def _speculative_row(model, draft: DraftModel, prompt_ids, cache, main_vocab: int, temperature: float, top_p: float,
+                     max_new_tokens: int, eos_ids: set, image_token_id: int, stop_event: Optional[Event],
+                     streamer, stats: SpeculativeStats) -> Tuple[List[int], Optional[float]]:
+    """
+    Decodes one unpadded row. `cache` holds the main model's KV for all prompt tokens but the last.
+    Invariant for both models: the cache covers everything except the newest committed token(s).
+    Returns the generated ids and the perf_counter() time the first of them was committed.
+    """
+    import torch
+    device = prompt_ids.device
+    greedy = temperature <= 0
+
+    # Draft prompt: the same text without the image placeholder tokens.
+    draft_seq = [t for t in prompt_ids.tolist() if t != image_token_id]
+    draft_cache, draft_cached_len = None, 0
+    main_cached_len = prompt_ids.shape[0] - 1
+    current = int(prompt_ids[-1])
+    generated: List[int] = []
+    first_token_time = None
+
+    while len(generated) < max_new_tokens and not (stop_event is not None and stop_event.is_set()):
+        num_draft = min(draft.num_draft_tokens, max_new_tokens - len(generated) - 1)
+
+        # 1. Draft proposes num_draft tokens autoregressively.
+        proposals, draft_probs = [], []
+        pending = draft_seq[draft_cached_len:]
+        for _ in range(num_draft):
+            out = draft.model(input_ids=torch.tensor([pending], device=device), past_key_values=draft_cache, use_cache=True)
+            draft_cache = out.past_key_values
+            draft_cached_len += len(pending)
+            logits = out.logits[0, -1, :main_vocab]
+            if greedy:
+                token = int(logits.argmax())
+            else:
+                q = torch.zeros(main_vocab, device=device)
+                q[:logits.shape[-1]] = _probs(logits, temperature, top_p)
+                token = int(torch.multinomial(q, 1))
+                draft_probs.append(q)
+            proposals.append(token)
+            pending = [token]
+
+        # 2. Main model scores the current token plus every proposal in one pass.
+        verify_ids = torch.tensor([[current] + proposals], device=device)
+        out = model(input_ids=verify_ids, past_key_values=cache, use_cache=True,
+                    cache_position=torch.arange(main_cached_len, main_cached_len + verify_ids.shape[1], device=device))
+        cache = out.past_key_values
+        main_logits = out.logits[0, :, :main_vocab]
+        stats.verify_steps += 1
+        stats.proposed += len(proposals)
+
+        # 3. Accept the longest agreeing prefix, then add one token from the main model.
+        accepted = 0
+        next_token = None
+        for idx, token in enumerate(proposals):
+            if greedy:
+                if int(main_logits[idx].argmax()) != token:
+                    next_token = int(main_logits[idx].argmax())
+                    break
+            else:
+                p = _probs(main_logits[idx], temperature, top_p)
+                q = draft_probs[idx]
+                if float(torch.rand(())) >= min(1.0, float(p[token] / q[token])):
+                    residual = (p - q).clamp(min=0)
+                    next_token = int(torch.multinomial(residual / residual.sum() if residual.sum() > 0 else p, 1))
+                    break
+            accepted += 1
+        if next_token is None: # Every proposal accepted: the last position gives a bonus token
+            last = main_logits[len(proposals)]
+            next_token = int(last.argmax()) if greedy else int(torch.multinomial(_probs(last, temperature, top_p), 1))
+        stats.accepted += accepted
+
+        new_tokens = proposals[:accepted] + [next_token]
+        for idx, token in enumerate(new_tokens):
+            if token in eos_ids:
+                new_tokens = new_tokens[:idx + 1]
+                break
+        new_tokens = new_tokens[:max_new_tokens - len(generated)]
+        if first_token_time is None:
+            first_token_time = time.perf_counter()
+        generated += new_tokens
+        stats.generated += len(new_tokens)
+        if streamer is not None:
+            streamer.put(torch.tensor(new_tokens))
+        if new_tokens[-1] in eos_ids:
+            break
+
+        # 4. Drop cache entries of rejected proposals. Main keeps current + accepted drafts; the draft model
+        #    keeps what it was fed (it never saw its own last proposal).
+        main_cached_len += 1 + accepted
+        cache.crop(main_cached_len)
+        draft_seq += new_tokens
+        draft_cached_len = min(draft_cached_len, len(draft_seq) - 1)
+        if draft_cache is not None:
+            draft_cache.crop(draft_cached_len)
+        current = new_tokens[-1]
+    return generated, first_token_time
+
+
+def speculative_generate(model, processor, draft: DraftModel, inputs, image_features, temperature: float, top_p: float,
+                         max_new_tokens: int, streamer=None, stop_event: Optional[Event] = None,
+                         prefix_cache=None) -> List[str]:
+    """
+    generate_from_inputs with a draft model. Rows run one after another (speculation cuts per-image latency,
+    not batch cost). `inputs` must already be on the model's device; `image_features` may be None.
+    """
+    import torch
+    from joycaption_core import _image_token_id, compute_image_features, prefill_prompt
+
+    tokenizer = processor.tokenizer
+    eos = model.generation_config.eos_token_id
+    eos_ids = set(eos if isinstance(eos, (list, tuple)) else [eos]) | {tokenizer.eos_token_id}
+    image_token_id = _image_token_id(model)
+    main_vocab = model.get_output_embeddings().weight.shape[0]
+    if image_features is None:
+        image_features = compute_image_features(model, inputs["pixel_values"])
+
+    batch_stats = SpeculativeStats()
+    captions = []
+    for row in range(inputs["input_ids"].shape[0]):
+        keep = inputs["attention_mask"][row].bool()
+        row_ids = inputs["input_ids"][row][keep]
+        row_inputs = {"input_ids": row_ids.unsqueeze(0), "attention_mask": torch.ones_like(row_ids).unsqueeze(0)}
+        start_time = time.perf_counter()
+        cache = prefill_prompt(model, row_inputs, image_features[row:row + 1], prefix_cache)
+        if cache is None:
+            raise RuntimeError("Image tokens and image features do not match.")
+        if streamer is not None:
+            streamer.put(row_ids.unsqueeze(0)) # Consumed as the prompt (skip_prompt)
+        token_ids, first_token_time = _speculative_row(model, draft, row_ids, cache, main_vocab, temperature, top_p,
+                                                       max_new_tokens, eos_ids, image_token_id, stop_event, streamer,
+                                                       batch_stats)
+        # Same stages as plain generation: prompt to the first committed token, then mean time per later token.
+        if first_token_time is not None:
+            METRICS.observe(STAGE_PREFILL, first_token_time - start_time, rows=1, speculative=True)
+            if len(token_ids) > 1:
+                METRICS.observe(STAGE_DECODE_TOKEN, (time.perf_counter() - first_token_time) / (len(token_ids) - 1),
+                                rows=1, tokens=len(token_ids), speculative=True)
+        captions.append(tokenizer.decode(token_ids, skip_special_tokens=True).strip())
+    if streamer is not None:
+        streamer.end()
+
+    draft.last_stats = batch_stats
+    draft.total_stats.add(batch_stats)
+    return captions
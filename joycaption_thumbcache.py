@@ -0,0 +1,135 @@
+# Persistent thumbnail cache: one SQLite file per dataset directory, keyed by (path, size, mtime, height).
+# Qt-free so it can be reused by tools; the GUI wires it into ThumbnailLoader.
+import os
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Optional, List, Tuple
+
+from joycaption_core import dataset_state_path
+
+CACHE_FILENAME = ".joycaption_thumbs.sqlite"
+DEFAULT_BUDGET_BYTES = 512 * 1024 * 1024
+FALLBACK_CACHE_DIR = Path.home() / ".cache" / "joycaption" / "thumbs"
+COMMIT_EVERY = 64 # Inserts are batched into one transaction per this many thumbnails
+# WAL needs shared memory between connections, which SMB/NFS do not provide reliably; DELETE is used there
+NETWORK_FS_TYPES = {"nfs", "nfs4", "cifs", "smb3", "smbfs", "9p", "afs", "ceph", "glusterfs", "lustre",
+                    "fuse.sshfs", "fuse.glusterfs", "fuse.rclone"}
+
+
+def _on_network_filesystem(path: Path) -> bool:
+    """Best effort: /proc/mounts on Linux, the drive type on Windows; False where it cannot tell (macOS)."""
+    directory = str(path.parent.resolve())
+    if sys.platform == "win32":
+        if directory.startswith("\\\\"): # UNC path
+            return True
+        import ctypes
+        DRIVE_REMOTE = 4
+        return ctypes.windll.kernel32.GetDriveTypeW(os.path.splitdrive(directory)[0] + "\\") == DRIVE_REMOTE
+    try:
+        with open("/proc/mounts", encoding="utf-8") as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return False
+    best_mount, best_type = "", ""
+    for mount_point, fs_type in mounts:
+        mount_point = mount_point.replace("\\040", " ")
+        inside = directory == mount_point or directory.startswith(mount_point.rstrip("/") + "/")
+        if inside and len(mount_point) >= len(best_mount): # Longest (innermost, else last mounted) wins
+            best_mount, best_type = mount_point, fs_type
+    return best_type in NETWORK_FS_TYPES
+
+
+class ThumbnailCache:
+    """Thread-safe; get/put may be called from thumbnail worker threads."""
+
+    def __init__(self, dataset_dir: Path, thumbnail_height: int, budget_bytes: int = DEFAULT_BUDGET_BYTES):
+        self.db_path = dataset_state_path(dataset_dir, CACHE_FILENAME, FALLBACK_CACHE_DIR)
+        self.thumbnail_height = thumbnail_height
+        self.budget_bytes = budget_bytes
+        self._lock = threading.Lock()
+        self._uncommitted = 0
+        self._touched: List[Tuple[float, str]] = [] # Access times are written lazily, not on every read
+        self._closed = False
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=10.0)
+        journal_mode = "DELETE" if _on_network_filesystem(self.db_path) else "WAL"
+        self._conn.execute(f"PRAGMA journal_mode={journal_mode}")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS thumbs ("
+            " path TEXT NOT NULL, height INTEGER NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,"
+            " last_access REAL NOT NULL, data BLOB NOT NULL, PRIMARY KEY (path, height))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS thumbs_last_access ON thumbs (last_access)")
+        self._conn.commit()
+
+    def get(self, image_path: Path, size: int, mtime_ns: int) -> Optional[bytes]:
+        """Returns encoded thumbnail bytes, or None if missing or the file changed since it was cached."""
+        key = str(image_path)
+        with self._lock:
+            if self._closed:
+                return None
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, data FROM thumbs WHERE path = ? AND height = ?",
+                (key, self.thumbnail_height)
+            ).fetchone()
+            if row is None or row[0] != size or row[1] != mtime_ns:
+                return None
+            self._touched.append((time.time(), key))
+            return row[2]
+
+    def put(self, image_path: Path, size: int, mtime_ns: int, data: bytes):
+        with self._lock:
+            if self._closed:
+                return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO thumbs (path, height, size, mtime_ns, last_access, data) VALUES (?, ?, ?, ?, ?, ?)",
+                (str(image_path), self.thumbnail_height, size, mtime_ns, time.time(), sqlite3.Binary(data))
+            )
+            self._uncommitted += 1
+            if self._uncommitted >= COMMIT_EVERY:
+                self._commit_locked()
+
+    def _commit_locked(self):
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE thumbs SET last_access = ? WHERE path = ? AND height = ?",
+                [(ts, key, self.thumbnail_height) for ts, key in self._touched]
+            )
+            self._touched.clear()
+        self._conn.commit()
+        self._uncommitted = 0
+
+    def prune(self):
+        """Evicts least-recently-used thumbnails until the cache fits the byte budget."""
+        with self._lock:
+            self._commit_locked()
+            total = self._conn.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM thumbs").fetchone()[0]
+            if total <= self.budget_bytes:
+                return
+            excess = total - self.budget_bytes
+            victims, freed = [], 0
+            for rowid, length in self._conn.execute("SELECT rowid, LENGTH(data) FROM thumbs ORDER BY last_access ASC"):
+                victims.append((rowid,))
+                freed += length
+                if freed >= excess:
+                    break
+            self._conn.executemany("DELETE FROM thumbs WHERE rowid = ?", victims)
+            self._conn.commit()
+            print(f"Thumbnail cache: evicted {len(victims)} entries ({freed / 1e6:.1f} MB) from {self.db_path}")
+
+    def close(self):
+        if self._closed:
+            return
+        try:
+            self.prune()
+        except sqlite3.Error as e:
+            print(f"Error pruning thumbnail cache {self.db_path}: {e}")
+        with self._lock:
+            if self._closed:
+                return
+            self._commit_locked()
+            self._conn.close()
+            self._closed = True
@@ -0,0 +1,42 @@
+# A tiny, randomly initialised stand-in for the JoyCaption LLaVA model, for CPU-only test machines and
+# benchmarks. It uses the real processor (tokenizer + chat template), shrinks only the image size, and
+# generates to max_new_tokens every time (random weights rarely emit EOS), so its cost is predictable.
+import torch
+from transformers import AutoProcessor, LlamaConfig, LlavaConfig, LlavaForConditionalGeneration, SiglipVisionConfig
+
+from joycaption_core import MODEL_PATH
+
+TINY_IMAGE_SIZE = 56 # 4 x 4 patches of 14 px -> 16 image tokens instead of 729
+TINY_PATCH_SIZE = 14
+
+
+def build_tiny_model(model_path: str = MODEL_PATH, seed: int = 0):
+    """Returns (processor, model, load message) like load_model. Same seed -> identical replicas."""
+    processor = AutoProcessor.from_pretrained(model_path)
+    processor.image_processor.size = {"height": TINY_IMAGE_SIZE, "width": TINY_IMAGE_SIZE}
+    processor.patch_size = TINY_PATCH_SIZE
+    tokenizer = processor.tokenizer
+
+    vision_config = SiglipVisionConfig(
+        hidden_size=32, intermediate_size=64, num_hidden_layers=2, num_attention_heads=2,
+        image_size=TINY_IMAGE_SIZE, patch_size=TINY_PATCH_SIZE,
+    )
+    text_config = LlamaConfig(
+        vocab_size=len(tokenizer), hidden_size=64, intermediate_size=128, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=4096,
+        bos_token_id=tokenizer.bos_token_id, eos_token_id=tokenizer.eos_token_id,
+    )
+    config = LlavaConfig(
+        vision_config=vision_config,
+        text_config=text_config,
+        image_token_index=tokenizer.convert_tokens_to_ids(processor.image_token),
+        vision_feature_layer=-1,
+        # Must agree with how the processor counts image tokens.
+        vision_feature_select_strategy=getattr(processor, "vision_feature_select_strategy", None) or "full",
+    )
+
+    torch.manual_seed(seed)
+    model = LlavaForConditionalGeneration(config)
+    model.eval()
+    num_params = sum(p.numel() for p in model.parameters())
+    return processor, model, f"Tiny random LLaVA stand-in ({num_params / 1e6:.1f}M parameters, float32, cpu)."
@@ -0,0 +1,132 @@
+# Write-behind caption persistence: a background thread drains a bounded queue and writes sidecars
+# atomically (temp file + os.replace), so the UI thread never blocks on slow disks or network shares.
+# Qt-free; the GUI bridges the on_written callback to a signal.
+import os
+import queue
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from joycaption_metrics import METRICS, STAGE_CAPTION_SAVE
+
+DEFAULT_MAX_PENDING = 1024 # submit() blocks beyond this many unwritten captions (back-pressure), unless block=False
+WRITE_BATCH_SIZE = 64 # Captions drained from the queue per write pass
+
+
+def write_text_atomic(path: Path, text: str):
+    """Readers see either the old file or the complete new one, never a partial write."""
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with METRICS.time(STAGE_CAPTION_SAVE):
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
+        raise
+
+
+class CaptionWriter:
+    """
+    submit() is thread-safe and returns once the caption is queued. `on_written(count, errors)` is called
+    from the writer thread after every write pass; errors are (path, message) pairs.
+    UI threads submit with block=False: when the queue is full the caption is parked in an unbounded
+    overflow list, which the writer thread moves into the queue as it drains it (order is preserved).
+    """
+
+    def __init__(self, on_written: Optional[Callable[[int, List[Tuple[Path, str]]], None]] = None,
+                 max_pending: int = DEFAULT_MAX_PENDING):
+        self.on_written = on_written
+        self._queue: "queue.Queue[Optional[Tuple[Path, str]]]" = queue.Queue(maxsize=max_pending)
+        self._overflow: Deque[Optional[Tuple[Path, str]]] = deque()
+        self._overflow_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="caption-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, path: Path, text: str, block: bool = True):
+        if self._closed:
+            raise RuntimeError("CaptionWriter is closed.")
+        if block:
+            self._queue.put((path, text))
+        else:
+            self._put_nowait((path, text))
+
+    def _put_nowait(self, item: Optional[Tuple[Path, str]]):
+        with self._overflow_lock:
+            if not self._overflow: # Anything already parked must be queued first
+                try:
+                    self._queue.put_nowait(item)
+                    return
+                except queue.Full:
+                    pass
+            self._overflow.append(item)
+
+    def _refill_from_overflow(self):
+        """
+        Writer thread, before every wait on the queue. Under the same lock as _put_nowait, so an item is only
+        parked while the queue is full, and the writer never sleeps on an empty queue with items parked.
+        """
+        with self._overflow_lock:
+            while self._overflow:
+                try:
+                    self._queue.put_nowait(self._overflow[0])
+                except queue.Full:
+                    return
+                self._overflow.popleft()
+
+    def _run(self):
+        while True:
+            self._refill_from_overflow()
+            batch = [self._queue.get()]
+            while len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            latest: Dict[Path, str] = {} # A newer caption for the same file supersedes the queued one
+            for item in batch:
+                if item is not None:
+                    latest[item[0]] = item[1]
+            written, errors = 0, []
+            for path, text in latest.items():
+                try:
+                    write_text_atomic(path, text)
+                    written += 1
+                except OSError as e:
+                    print(f"Error saving caption {path}: {e}")
+                    errors.append((path, str(e)))
+            for _ in batch:
+                self._queue.task_done()
+            if self.on_written and (written or errors):
+                self.on_written(written, errors)
+            if any(item is None for item in batch):
+                return
+
+    def flush(self):
+        """Blocks until everything submitted so far is on disk (or failed)."""
+        while True:
+            self._queue.join()
+            with self._overflow_lock:
+                if not self._overflow:
+                    return
+            time.sleep(0.005) # The writer thread is moving parked captions into the queue
+
+    def close(self):
+        """Writes everything still queued, then stops the thread."""
+        if self._closed:
+            return
+        self._closed = True
+        with self._overflow_lock:
+            parked = bool(self._overflow)
+            if parked:
+                self._overflow.append(None) # The stop marker goes after the parked captions
+        if not parked:
+            self._queue.put(None)
+        self._thread.join()
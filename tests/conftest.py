@@ -0,0 +1,5 @@
+# The modules live at the repository root (no package), as for the scripts in benchmarks/.
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,49 @@
+import threading
+import time
+
+import joycaption_writer
+from joycaption_writer import CaptionWriter
+
+
+def test_non_blocking_submit_with_full_queue(tmp_path, monkeypatch):
+    release = threading.Event()
+    write_text_atomic = joycaption_writer.write_text_atomic
+
+    def stalled_write(path, text):
+        release.wait(10) # A slow disk: the writer thread holds its first batch until released
+        write_text_atomic(path, text)
+
+    monkeypatch.setattr(joycaption_writer, "write_text_atomic", stalled_write)
+    written = []
+    writer = CaptionWriter(on_written=lambda count, errors: written.append((count, errors)), max_pending=2)
+    paths = [tmp_path / f"img_{idx:03d}.txt" for idx in range(50)]
+
+    start = time.perf_counter()
+    for idx, path in enumerate(paths):
+        writer.submit(path, f"caption {idx}", block=False)
+    assert time.perf_counter() - start < 1.0
+    assert writer._queue.full()
+    assert writer._overflow
+
+    release.set()
+    writer.flush()
+    assert not writer._overflow
+    assert [path.read_text(encoding="utf-8") for path in paths] == [f"caption {idx}" for idx in range(50)]
+    assert sum(count for count, _ in written) == 50
+    assert all(not errors for _, errors in written)
+    writer.close()
+
+
+def test_close_writes_parked_captions(tmp_path, monkeypatch):
+    release = threading.Event()
+    write_text_atomic = joycaption_writer.write_text_atomic
+    monkeypatch.setattr(joycaption_writer, "write_text_atomic",
+                        lambda path, text: (release.wait(10), write_text_atomic(path, text)))
+    writer = CaptionWriter(max_pending=1)
+    paths = [tmp_path / f"img_{idx:03d}.txt" for idx in range(10)]
+    for path in paths:
+        writer.submit(path, path.stem, block=False)
+
+    threading.Timer(0.1, release.set).start()
+    writer.close()
+    assert [path.read_text(encoding="utf-8") for path in paths] == [path.stem for path in paths]
@@ -0,0 +1,44 @@
+import sys
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from joycaption_cpu import quantize_language_model_int8
+
+
+class _LlavaLike(torch.nn.Module):
+    """Mimics transformers >= 4.52: language_model is a read-only property and lm_head sits on the wrapper."""
+
+    def __init__(self):
+        super().__init__()
+        self.model = torch.nn.Module()
+        self.model.language_model = torch.nn.Sequential(torch.nn.Linear(16, 16), torch.nn.ReLU(), torch.nn.Linear(16, 16))
+        self.model.vision_tower = torch.nn.Linear(16, 16)
+        self.lm_head = torch.nn.Linear(16, 32)
+
+    @property
+    def language_model(self):
+        return self.model.language_model
+
+    def forward(self, x):
+        return self.lm_head(self.language_model(x))
+
+
+def test_torch_fallback_quantizes_in_place(monkeypatch):
+    monkeypatch.setitem(sys.modules, "torchao", None) # Force the torch.ao fallback
+    monkeypatch.setitem(sys.modules, "torchao.quantization", None)
+    model = _LlavaLike().eval()
+    language_model = model.language_model
+    x = torch.randn(2, 16)
+    expected = model(x)
+
+    assert quantize_language_model_int8(model) == "torch dynamic int8"
+
+    dynamic_linear = torch.ao.nn.quantized.dynamic.Linear
+    assert model.language_model is language_model # Same module object: quantized in place, not copied
+    assert isinstance(model.language_model[0], dynamic_linear)
+    assert isinstance(model.language_model[2], dynamic_linear)
+    assert isinstance(model.lm_head, dynamic_linear)
+    assert isinstance(model.model.vision_tower, torch.nn.Linear) and not isinstance(model.model.vision_tower, dynamic_linear)
+    assert torch.allclose(model(x), expected, atol=0.1)